@@ -28,6 +28,12 @@ import binascii
 import sys
 import subprocess
 import shlex
+import collections
+import hashlib
+import json
+import struct
+import array
+import asyncio
 
 def get_routing_table():
     """Extract the node's routing table in usable format"""
@@ -54,6 +60,34 @@ def get_routing_table():
 
     return rt_entries
 
+def get_routes_hash(routes):
+    """Get hash of route lines not depending on their order.
+    Must be the same as the one computed by the ALTO server"""
+
+    hasher = hashlib.sha256()
+    for route_key in sorted(json.dumps(route, sort_keys=True) for route in routes):
+        hasher.update(route_key.encode('utf-8'))
+        hasher.update(b'\n')
+
+    return hasher.hexdigest()
+
+def make_routes_delta(base_routes, routes):
+    """Get delta upload turning base_routes (last acknowledged
+    by the server) into routes"""
+
+    base_keys = collections.Counter(json.dumps(route, sort_keys=True) for route in base_routes)
+    keys = collections.Counter(json.dumps(route, sort_keys=True) for route in routes)
+
+    removed = base_keys - keys
+    added = keys - base_keys
+
+    return {
+        'base': get_routes_hash(base_routes),
+        'hash': get_routes_hash(routes),
+        'add': [json.loads(key) for key in added.elements()],
+        'remove': [json.loads(key) for key in removed.elements()]
+    }
+
 def _parse_rt_line(str_line):
     """Parse a str representing a single line in rt"""
 
@@ -123,6 +157,28 @@ def _get_iface_addr(iface):
 
         ip_addr_data = popen_ip.stdout.readlines()
 
+    return _parse_ip_addr_lines(ip_addr_data)
+
+async def get_interfaces_addresses_async():
+    """Collect interface address details without blocking the event loop"""
+
+    # Get the liost of active interfaces
+    interfaces = get_net_adapter_names()
+
+    # Run ip utility for all interfaces at once
+    addresses = await asyncio.gather(*[_get_iface_addr_async(iface) for iface in interfaces])
+
+    return dict(zip(interfaces, addresses))
+
+async def _get_iface_addr_async(iface):
+    """Extract iface addr details from ip utility without blocking"""
+
+    ip_addr_data = await _run_command_async('ip', '-a', '-d', '-o', 'addr', 'list', iface)
+    return _parse_ip_addr_lines(ip_addr_data)
+
+def _parse_ip_addr_lines(ip_addr_data):
+    """Parse output lines of the ip utility"""
+
     # Strip the newlines
     lines = [line.replace('\n', '') for line in ip_addr_data]
 
@@ -131,6 +187,14 @@ def _get_iface_addr(iface):
 
     return parsed_data
 
+async def _run_command_async(*args):
+    """Run the command and return lines of its output"""
+
+    process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE)
+    (stdout, _) = await process.communicate()
+
+    return stdout.decode().splitlines(keepends=True)
+
 def _parse_ip_addr_single_line(line):
     """Parse a single line from ip addr list command"""
 
@@ -192,6 +256,40 @@ def collect_all_interface_stats():
     return interface_stats
 
 
+# Compact binary adapter stats upload. All integers are little endian:
+#   header: magic b'PAS1', uint16 number of stat names, uint16 number of adapters
+#   stat names, then adapter names: uint8 length + UTF-8 bytes each
+#   counters: uint64 per (adapter, stat name), a row per adapter
+# It is sent base64 encoded as adapter_stats_packed of the batch upload
+
+def pack_interface_stats(interface_stats):
+    """Encode output of collect_all_interface_stats() to compact binary format"""
+
+    # Stat names are sent once, missing values are sent as 0
+    stat_index = {}
+    for interface_stat in interface_stats:
+        for stat_name in interface_stat['stats']:
+            stat_index.setdefault(stat_name, len(stat_index))
+
+    counters = array.array('Q', [0]) * (len(interface_stats) * len(stat_index))
+    for (row, interface_stat) in enumerate(interface_stats):
+        row_start = row * len(stat_index)
+        for (stat_name, value) in interface_stat['stats'].items():
+            counters[row_start + stat_index[stat_name]] = value
+
+    if sys.byteorder != 'little':
+        counters.byteswap()
+
+    parts = [struct.pack('<4sHH', b'PAS1', len(stat_index), len(interface_stats))]
+    names = list(stat_index) + [interface_stat['name'] for interface_stat in interface_stats]
+    for name in names:
+        encoded = name.encode('utf-8')
+        parts.append(struct.pack('<B', len(encoded)))
+        parts.append(encoded)
+    parts.append(counters.tobytes())
+
+    return b''.join(parts)
+
 def _get_interface_stats(interface_name):
     """Collect and return stats of the given interface"""
 
@@ -241,6 +339,22 @@ def get_quagga_rt():
 
         quagga_rt = p_vtysh.stdout.readlines()
 
+    return _parse_quagga_rt_lines(quagga_rt)
+
+async def get_quagga_rt_async():
+    """Extract routing table as seen by Quagga without blocking the event loop"""
+
+    try:
+        quagga_rt = await _run_command_async('vtysh', '-c', 'sh ip route')
+    except FileNotFoundError:
+        # Quagga is not installed
+        return None
+
+    return _parse_quagga_rt_lines(quagga_rt)
+
+def _parse_quagga_rt_lines(quagga_rt):
+    """Parse output lines of the vtysh"""
+
     # Strip the newlines
     lines = [line.replace('\n', '') for line in quagga_rt]
 
@@ -22,14 +22,25 @@ Collector program to upload data from virtual routers/switches to ALTO server.
 import logging
 import asyncio
 import argparse
+import base64
+import functools
+import math
 import sys
 import socket
+import threading
 #import ptvsd
 import requests
 import traceback
 
 import nethelpers
 
+# Routing tables acknowledged by the server: data type -> routes
+_acked_routes = {}
+
+# Keep-alive connections to the server are reused by all uploads. Session
+# is not thread safe, hence each thread posting data has its own one
+_thread_data = threading.local()
+
 # Enable remote execution from the Visual Studio
 # ! Comment out this line if running locally on Win PC!
 #ptvsd.enable_attach(secret='alto')
@@ -43,60 +54,126 @@ def main(run_args):
         logging.error('Collector supports Linux only!')
         return
 
-    ## Event loop
-    loop = asyncio.get_event_loop()
-    loop.set_debug(True)
-
-    # Setup call to data reporting
-    loop.call_later(run_args.collect_interval, report_stats, run_args)
-
     # Run until terminated
     try:
-        loop.run_forever()
+        asyncio.run(run_collector(run_args), debug=True)
     except KeyboardInterrupt:
         pass
 
-    # If we are asked to close - close the connection and end the loop
-    loop.close()
+async def run_collector(run_args):
+    """Report stats at fixed rate, not drifting by the time reporting takes"""
 
-def report_stats(run_args):
-    """Periodically report stats"""
-    try:
-        # Make base URL
-        server_url = 'http://' + run_args.alto_server + '/upload/' + socket.gethostname() + '/'
+    loop = asyncio.get_running_loop()
+    interval = run_args.collect_interval
+
+    next_run = loop.time() + interval
+    report_task = None
+
+    while True:
+        await asyncio.sleep(max(0, next_run - loop.time()))
+
+        # Do not pile up reports if the server is slower than the interval
+        if report_task is not None and not report_task.done():
+            logging.warning('Previous report is still running, skipping this one')
+        else:
+            report_task = asyncio.ensure_future(report_stats(run_args))
 
-        # POST adapeter counters
+        # Schedule next run, skipping the missed ones
+        next_run += interval
+        now = loop.time()
+        if next_run < now:
+            next_run += math.ceil((now - next_run) / interval) * interval
+
+def post(url, **kwargs):
+    """POST using the session of the calling thread"""
+
+    session = getattr(_thread_data, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _thread_data.session = session
+
+    return session.post(url, **kwargs)
+
+async def post_async(url, **kwargs):
+    """POST in executor thread without blocking the event loop"""
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(post, url, **kwargs))
+
+async def report_stats(run_args):
+    """Collect and report stats once"""
+    try:
+        # All data of this device is uploaded at once
+        server_url = 'http://' + run_args.alto_server + '/upload/batch'
+        timeout = run_args.collect_interval
+        device_data = {}
+
+        # Collect data requiring external tools at the same time
+        is_router = run_args.dev_type == 'router'
+        collectors = [nethelpers.get_interfaces_addresses_async()]
+        if is_router:
+            collectors.append(nethelpers.get_quagga_rt_async())
+
+        collected = await asyncio.gather(*collectors)
+        adapter_addresses = collected[0]
+        quagga_rt = collected[1] if is_router else None
+
+        # Adapeter counters, compact ones are base64 encoded to fit in JSON
         adapter_stats = nethelpers.collect_all_interface_stats()
-        requests.post(server_url + 'adapter_stats', json=adapter_stats)
+        if run_args.packed_stats:
+            device_data['adapter_stats_packed'] = base64.b64encode(
+                nethelpers.pack_interface_stats(adapter_stats)).decode('ascii')
+        else:
+            device_data['adapter_stats'] = adapter_stats
 
-        # POST adapter addresses
-        adapter_addresses = nethelpers.get_interfaces_addresses()
-        requests.post(server_url + 'adapter_addr', json=adapter_addresses)
+        # Adapter addresses
+        device_data['adapter_addr'] = adapter_addresses
 
-        # If this is router POST routing table
-        if run_args.dev_type == 'router':
-            rtable = nethelpers.get_routing_table()
-            requests.post(server_url + 'rtable', json=rtable)
+        # If this is router add routing tables
+        routes = {}
+        if is_router:
+            routes['rtable'] = nethelpers.get_routing_table()
 
-            quagga_rt = nethelpers.get_quagga_rt()
             if quagga_rt is not None:
-                requests.post(server_url + 'quagga_rt', json=quagga_rt)
+                routes['quagga_rt'] = quagga_rt
+
+        # Tables known by the server are sent as changes since the last upload
+        for (data_type, data) in routes.items():
+            acked = _acked_routes.get(data_type)
+            if acked is None:
+                device_data[data_type] = data
+            else:
+                device_data[data_type] = nethelpers.make_routes_delta(acked, data)
+
+        _acked_routes.clear()
+
+        resp = await post_async(
+            server_url, json={socket.gethostname(): device_data}, timeout=timeout)
+
+        # Server lost track of our tables, upload them in full
+        if resp.status_code == 409:
+            logging.info('Server requested to resync routing tables')
+            device_data.update(routes)
+            resp = await post_async(
+                server_url, json={socket.gethostname(): device_data}, timeout=timeout)
+
+        if resp.status_code == 204:
+            _acked_routes.update(routes)
     
     # Consume OSError when remote is not answering
     except OSError as exc:
         logging.error('Consumed OSError: %s', exc)
 
-    # Schedule next run
-    loop = asyncio.get_event_loop()
-    loop.call_later(run_args.collect_interval, report_stats, run_args)
-
 if __name__ == "__main__":
     # Parse the command line arguments
     parser = argparse.ArgumentParser(description='ALTO Virtual Net device stats collector')
 
     parser.add_argument('--alto-server', help='IP Address of the ALTO server', default='127.0.0.1')
     parser.add_argument('--dev-type', help='Type of the virtual device (switch/router)', default='router')
-    parser.add_argument('--collect-interval', help='Data collection frequency', default=15.0)
+    parser.add_argument('--collect-interval', help='Data collection frequency', default=15.0,
+                        type=float)
+    parser.add_argument('--packed-stats', help='Upload adapter stats in compact binary format',
+                        action='store_true')
 
     args = parser.parse_args()
 
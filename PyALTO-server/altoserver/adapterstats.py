@@ -0,0 +1,220 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Fixed size time series of network adapter counters and load estimates.
+"""
+import struct
+import warnings
+
+import numpy
+
+# Ways to estimate the current rate of a counter:
+#   last - change between the latest two samples
+#   ewma - exponentially weighted moving average of the rates
+#   mean - average rate over all rates kept
+#   peak - 95th percentile of the rates kept
+LOAD_ESTIMATORS = ('last', 'ewma', 'mean', 'peak')
+
+class AdapterStatsRing(object):
+    """Ring buffer holding the latest samples of one adapter's counters"""
+
+    # Counters kept from the uploaded stats, missing ones are saved as 0
+    counter_names = ('rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets', 'rx_errors', 'tx_errors')
+    _counter_index = {name: index for (index, name) in enumerate(counter_names)}
+
+    ewma_alpha = 0.3            # Weight of the latest rate in EWMA
+    peak_percentile = 95
+
+    def __init__(self, capacity=10):
+        """Preallocate buffers for the given number of samples"""
+
+        assert capacity >= 2
+
+        self._times = numpy.zeros(capacity, dtype=numpy.float64)
+        self._counters = numpy.zeros((capacity, len(self.counter_names)), dtype=numpy.uint64)
+        self._rates = numpy.full((capacity, len(self.counter_names)), numpy.nan)
+        self._intervals = numpy.zeros(capacity, dtype=numpy.float64)   # Seconds each row's rates span
+        self._ewma = None       # EWMA of each counter's rate
+        self._peak = None       # Peak rate of each counter
+        self._next = 0          # Row the next sample is written to
+        self._size = 0          # Number of valid samples
+
+    def append(self, timestamp, stats):
+        """Add sample of {counter name -> value} taken at timestamp"""
+        self.append_counters(timestamp, [stats.get(name, 0) for name in self.counter_names])
+
+    def append_counters(self, timestamp, counters):
+        """Add sample of counter values in counter_names order taken at timestamp"""
+
+        row = self._next
+        prev = row - 1
+        self._times[row] = timestamp
+        self._counters[row] = counters
+        self._rates[row] = numpy.nan
+        self._intervals[row] = 0
+
+        self._next = (row + 1) % len(self._times)
+        self._size = min(self._size + 1, len(self._times))
+
+        if self._size < 2:
+            return
+
+        # Rate since the previous sample
+        delta_t = self._times[row] - self._times[prev]
+        if delta_t <= 0:
+            return
+
+        # Counter going backwards (adapter reset) gives no rate (NaN) for the interval
+        deltas = self._counters[row].astype(numpy.int64) - self._counters[prev].astype(numpy.int64)
+        rates = numpy.where(deltas >= 0, deltas / delta_t, numpy.nan)
+        self._rates[row] = rates
+        self._intervals[row] = delta_t
+
+        # Update estimates, so that lookups do not depend on the history length.
+        # Unknown rates keep the previous estimate
+        if self._ewma is None:
+            self._ewma = rates
+        else:
+            ewma = numpy.where(numpy.isnan(self._ewma), rates,
+                               self.ewma_alpha * rates + (1 - self.ewma_alpha) * self._ewma)
+            self._ewma = numpy.where(numpy.isnan(rates), self._ewma, ewma)
+
+        with warnings.catch_warnings():
+            # Counters without any known rate get NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            self._peak = numpy.nanpercentile(self._rates[:self._size], self.peak_percentile, axis=0)
+
+    def get_latest(self):
+        """Get (timestamp, {counter name -> value}) of the latest sample or None"""
+
+        if not self._size:
+            return None
+
+        row = self._next - 1
+        counters = dict(zip(self.counter_names, self._counters[row].tolist()))
+        return (float(self._times[row]), counters)
+
+    def get_rate(self, counter_name, estimator='last'):
+        """Get change per second of the counter using one of the
+        LOAD_ESTIMATORS or None if there are less than two samples"""
+
+        if self._size < 2:
+            return None
+
+        last = self._next - 1
+        column = self._counter_index[counter_name]
+
+        if estimator == 'last':
+            rate = self._rates[last, column]
+        elif estimator == 'ewma':
+            rate = None if self._ewma is None else self._ewma[column]
+        elif estimator == 'mean':
+            # Time weighted average of the known rates
+            rates = self._rates[:self._size, column]
+            known = ~numpy.isnan(rates)
+            delta_t = self._intervals[:self._size][known].sum()
+            delta_d = (rates[known] * self._intervals[:self._size][known]).sum()
+            rate = delta_d / delta_t if delta_t > 0 else None
+        elif estimator == 'peak':
+            rate = None if self._peak is None else self._peak[column]
+        else:
+            raise ValueError('Unknown load estimator {}'.format(estimator))
+
+        if rate is None or numpy.isnan(rate):
+            return None
+
+        return float(rate)
+
+    def __len__(self):
+        return self._size
+
+# Compact binary adapter stats upload. All integers are little endian:
+#   header: magic b'PAS1', uint16 number of stat names, uint16 number of adapters
+#   stat names, then adapter names: uint8 length + UTF-8 bytes each
+#   counters: uint64 per (adapter, stat name), a row per adapter
+PACKED_STATS_MIMETYPE = 'application/vnd.pyalto.adapter-stats'
+_PACKED_HEADER = struct.Struct('<4sHH')
+_PACKED_MAGIC = b'PAS1'
+
+def decode_packed_stats(data):
+    """Decode packed adapter stats to (adapter names, counters) where counters
+    has a row per adapter and AdapterStatsRing.counter_names columns.
+    Raises ValueError if data is malformed."""
+
+    if len(data) < _PACKED_HEADER.size:
+        raise ValueError('Packed stats header is truncated')
+
+    (magic, num_stats, num_adapters) = _PACKED_HEADER.unpack_from(data, 0)
+    if magic != _PACKED_MAGIC:
+        raise ValueError('Unknown packed stats format')
+
+    offset = _PACKED_HEADER.size
+    (stat_names, offset) = _unpack_names(data, offset, num_stats)
+    (adapter_names, offset) = _unpack_names(data, offset, num_adapters)
+
+    if len(data) - offset != num_adapters * num_stats * 8:
+        raise ValueError('Packed stats counters size mismatch')
+
+    values = numpy.frombuffer(data, dtype='<u8', offset=offset).reshape(num_adapters, num_stats)
+
+    # Only counters kept in the history are copied
+    src_cols = []
+    dst_cols = []
+    for (src_col, stat_name) in enumerate(stat_names):
+        dst_col = AdapterStatsRing._counter_index.get(stat_name)
+        if dst_col is not None:
+            src_cols.append(src_col)
+            dst_cols.append(dst_col)
+
+    counters = numpy.zeros((num_adapters, len(AdapterStatsRing.counter_names)), dtype=numpy.uint64)
+    counters[:, dst_cols] = values[:, src_cols]
+
+    return (adapter_names, counters)
+
+def counters_from_stats(adapter_stats):
+    """Get (adapter names, counters) of adapter stats [{name, stats}] uploaded
+    as JSON in the same format decode_packed_stats() returns"""
+
+    adapter_names = [adapter_stat['name'] for adapter_stat in adapter_stats]
+    counters = numpy.zeros((len(adapter_stats), len(AdapterStatsRing.counter_names)),
+                           dtype=numpy.uint64)
+    for (row, adapter_stat) in enumerate(adapter_stats):
+        counters[row] = [adapter_stat['stats'].get(name, 0)
+                         for name in AdapterStatsRing.counter_names]
+
+    return (adapter_names, counters)
+
+def _unpack_names(data, offset, count):
+    """Unpack count length prefixed names starting at offset.
+    Returns (names, offset after the names)"""
+
+    names = []
+    for _ in range(count):
+        if offset >= len(data):
+            raise ValueError('Packed stats name table is truncated')
+
+        length = data[offset]
+        name = data[offset + 1:offset + 1 + length]
+        if len(name) != length:
+            raise ValueError('Packed stats name table is truncated')
+
+        names.append(name.decode('utf-8'))
+        offset += 1 + length
+
+    return (names, offset)
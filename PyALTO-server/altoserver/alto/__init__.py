@@ -27,6 +27,7 @@ import logging
 from flask import Blueprint, Response, request, abort
 
 from .altoserver import AltoServer
+from .updatestream import UpdateStreamService
 
 from .addresstypes import *
 from .costproviders import *
@@ -40,29 +41,93 @@ alto_server.register_cost_providers([
     ospfcostprovider.OSPFCostProvider(),
     routehopscostprovider.RouteHopsCostProvider(),
     pathhopscostprovider.PathHopsCostProvider(),
-    pathloadcostprovider.PathLoadCostProvider()
+    pathloadcostprovider.PathLoadCostProvider(),
+    pathloadcostprovider.PathLoadCostProvider('ewma'),
+    pathloadcostprovider.PathLoadCostProvider('mean'),
+    pathloadcostprovider.PathLoadCostProvider('peak')
 ])
 alto_server.register_property_providers([
     pidpropertyprovider.PIDPropertyProvider(),
     hostnamepropertyprovider.HostnamePropertyProvider(),
 ])
 
+update_stream = UpdateStreamService(alto_server)
+
 alto = Blueprint('alto', __name__)
 
+def _not_modified_response(etag):
+    """Return 304 response if client already has entity with given tag"""
+
+    if etag not in request.if_none_match:
+        return None
+
+    resp = Response(status=304)
+    resp.set_etag(etag)
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+def _coded_etag(tag, encoding):
+    """Strong entity tag of the representation in the given content coding"""
+    return '{}-{}'.format(tag, encoding)
+
 @alto.route('/networkmap')
 def get_network_map():
     """Get ALTO network map """ 
 
     # TODO: Any request validity checking here
 
-    # Get the map
+    # Use compression if client accepts it
+    encoding = request.accept_encodings.best_match(
+        ['gzip', 'deflate'], default='identity')
+
+    # Get the (cached) map
     try:
-        resp = alto_server.get_network_map()
+        (vtag, body) = alto_server.get_network_map_body(encoding)
     except Exception as exc:
         logging.exception('Exc in networkmap', exc_info = exc)
         abort(500)
-        
+
+    # Map vtag is used as entity tag of each content coding
+    etag = _coded_etag(vtag, encoding)
+    resp = _not_modified_response(etag)
+    if resp is not None:
+        return resp
+
     # Return properly structured response
+    resp = Response(
+        body,
+        mimetype='application/alto-networkmap+json'
+    )
+    if encoding != 'identity':
+        resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    resp.set_etag(etag)
+
+    return resp
+
+@alto.route('/networkmap/filtered', methods=['POST'])
+def get_filtered_network_map():
+    """Get ALTO filtered network map [RFC7285] p 11.3.1"""
+
+    # Drop early if not json
+    if not request.is_json:
+        abort(400)
+
+    req_data = request.json
+
+    # Ensure that required keys are there
+    if 'pids' not in req_data:
+        abort(400)
+
+    try:
+        resp = alto_server.get_filtered_network_map(
+            req_data['pids'],
+            req_data.get('address-types')
+        )
+    except Exception as exc:
+        logging.exception('Exc in filtered networkmap', exc_info = exc)
+        abort(500)
+
     return Response(
         json.dumps(resp),
         mimetype='application/alto-networkmap+json'
@@ -87,6 +152,15 @@ def get_endpoint_properties():
     if 'endpoints' not in req_data:
         abort(400)
 
+    # Lookup is safe, hence allow polling clients to skip unchanged data
+    etag = alto_server.get_endpoint_properties_tag(
+        req_data['properties'],
+        req_data['endpoints']
+    )
+    not_modified = _not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+
     # Request data. Do not try to parse requested
     # data here. This is only a shim layer
     try:
@@ -99,10 +173,13 @@ def get_endpoint_properties():
         abort(500)
 
     # Return if successfull
-    return Response(
+    http_resp = Response(
         json.dumps(resp),
         mimetype='application/alto-endpointprop+json'
     )
+    http_resp.set_etag(etag)
+
+    return http_resp
 
 @alto.route('/endpointcost/lookup', methods=['POST'])
 def get_endpoint_cost():
@@ -157,3 +234,114 @@ def get_endpoint_cost():
         json.dumps(costmap),
         mimetype='application/alto-endpointcost+json'
     )
+
+@alto.route('/costmap/<resource_id>')
+def get_cost_map(resource_id):
+    """Get ALTO cost map [RFC7285] p 11.2.3"""
+
+    # Use compression if client accepts it
+    encoding = request.accept_encodings.best_match(
+        ['gzip', 'deflate'], default='identity')
+
+    # Get the (precomputed) map
+    try:
+        cost_map = alto_server.get_cost_map_body(resource_id, encoding)
+    except Exception as exc:
+        logging.exception('Exc in costmap', exc_info = exc)
+        abort(500)
+
+    if cost_map is None:
+        abort(404)
+
+    (tag, body) = cost_map
+    etag = _coded_etag(tag, encoding)
+    not_modified = _not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+
+    resp = Response(
+        body,
+        mimetype='application/alto-costmap+json'
+    )
+    if encoding != 'identity':
+        resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    resp.set_etag(etag)
+
+    return resp
+
+@alto.route('/costmap/filtered', methods=['POST'])
+def get_filtered_cost_map():
+    """Get ALTO filtered cost map [RFC7285] p 11.3.2"""
+
+    # Drop early if not json
+    if not request.is_json:
+        abort(400)
+
+    req_data = request.json
+
+    # Ensure that required keys and data are there
+    if 'cost-type' not in req_data:
+        abort(400)
+
+    if 'cost-mode' not in req_data['cost-type']:
+        abort(400)
+
+    if 'cost-metric' not in req_data['cost-type']:
+        abort(400)
+
+    pids = req_data.get('pids', {})
+
+    try:
+        resp = alto_server.get_filtered_cost_map(
+            req_data['cost-type'],
+            pids.get('srcs', []),
+            pids.get('dsts', [])
+        )
+    except Exception as exc:
+        logging.exception('Exc in filtered costmap', exc_info = exc)
+        abort(500)
+
+    # No cost map for requested cost type
+    if resp is None:
+        abort(400)
+
+    return Response(
+        json.dumps(resp),
+        mimetype='application/alto-costmap+json'
+    )
+
+@alto.route('/updates', methods=['POST'])
+def get_update_stream():
+    """Stream updates of network map and cost maps [RFC8895]"""
+
+    # Drop early if not json
+    if not request.is_json:
+        abort(400)
+
+    req_data = request.json
+
+    # Ensure that resources to subscribe are given
+    if not isinstance(req_data, dict) or not isinstance(req_data.get('add'), dict):
+        abort(400)
+
+    if not any(req_data['add']):
+        abort(400)
+
+    subscriptions = {}
+    for client_id, params in req_data['add'].items():
+        if not isinstance(params, dict) or not isinstance(params.get('resource-id'), str):
+            abort(400)
+
+        if not update_stream.has_resource(params['resource-id']):
+            abort(400)
+
+        subscriptions[client_id] = params['resource-id']
+
+    resp = Response(
+        update_stream.stream(subscriptions),
+        mimetype='text/event-stream'
+    )
+    resp.headers['Cache-Control'] = 'no-cache'
+
+    return resp
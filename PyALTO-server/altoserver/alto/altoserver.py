@@ -19,10 +19,14 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 Implementation of ALTO protocol
 """
+import hashlib
 import ipaddress
+import json
 import logging
+import zlib
 
 from altoserver import nm
+from .pidcostmap import PIDCostMap
 
 class AltoServer(object):
     """This class implementes functionality of the ALTO protocol"""
@@ -31,8 +35,12 @@ class AltoServer(object):
         """Initialize the ALTO server"""
 
         self._cost_providers = []
-        self._property_providers = []
+        self._property_providers = {}           # Property name -> provider
         self._address_parsers = []
+        self._network_map_pids = (None, {})     # (vtag, {PID name -> prefixes})
+        self._network_map_cache = (None, {})    # (vtag, {encoding -> body})
+        self._cost_maps = {}                    # Resource id -> PIDCostMap
+        self._cost_map_bodies = {}              # Resource id -> (tag, {encoding -> body})
 
     def parse_endpoints(self, in_endpoints):
         """Parse textual address representations to Python objects"""
@@ -65,22 +73,100 @@ class AltoServer(object):
     def get_network_map(self):
         """Return JSON serializable network map per [RFC7285] p11.2.1"""
     
+        # Build the response
+        with nm.lock:
+            resp = {
+                'meta': nm.get_map_meta(),
+                'network-map': self._get_network_map_pids()
+            }
+
+        return resp
+
+    def get_filtered_network_map(self, pid_names, address_types=None):
+        """Return JSON serializable filtered network map per [RFC7285] p11.3.1.
+        Empty pid_names selects all PIDs, address_types None selects all types"""
+
+        with nm.lock:
+            meta = nm.get_map_meta()
+            nmap = self._get_network_map_pids()
+
+        if not any(pid_names):
+            pid_names = nmap.keys()
+
+        # Pick (cached) prefix lists of requested PIDs, unknown PIDs are skipped
+        filtered_map = {}
+        for pid_name in pid_names:
+            prefixes = nmap.get(pid_name)
+            if prefixes is None:
+                continue
+
+            if address_types is not None:
+                prefixes = {addr_type: prefix_list for (addr_type, prefix_list)
+                            in prefixes.items() if addr_type in address_types}
+                if not any(prefixes):
+                    continue
+
+            filtered_map[pid_name] = prefixes
+
+        resp = {
+            'meta': meta,
+            'network-map': filtered_map
+        }
+
+        return resp
+
+    def _get_network_map_pids(self):
+        """Return {PID name -> prefixes} part of the network map. It is
+        built once per map vtag and must not be modified"""
+
+        vtag = nm.get_map_tag()
+        (cached_vtag, nmap) = self._network_map_pids
+        if cached_vtag == vtag:
+            return nmap
+
         # Get internal network representation
-        (meta, map) = nm.get_pid_topology()
+        (_, pids) = nm.get_pid_topology()
 
         # Add pids
         nmap = {}
-        for pid in map:
+        for pid in pids:
             (name, data) = pid.get_json_repr()
             nmap[name] = data
-    
-        # Build the response
-        resp = {
-            'meta': meta,
-            'network-map': nmap
-        }
 
-        return resp
+        self._network_map_pids = (vtag, nmap)
+        return nmap
+
+    def get_network_map_body(self, encoding='identity'):
+        """Return (vtag, network map as encoded JSON bytes). Encoding is one of
+        identity, gzip or deflate. Bodies are reused until map vtag changes"""
+
+        with nm.lock:
+            vtag = nm.get_map_tag()
+            (cached_vtag, bodies) = self._network_map_cache
+            if cached_vtag != vtag:
+                bodies = {'identity': json.dumps(self.get_network_map()).encode('utf-8')}
+                self._network_map_cache = (vtag, bodies)
+
+        body = bodies.get(encoding)
+        if body is None:
+            body = AltoServer.compress_body(bodies['identity'], encoding)
+            bodies[encoding] = body
+
+        return (vtag, body)
+
+    @staticmethod
+    def compress_body(body, encoding):
+        """Compress response body using given HTTP content coding"""
+
+        if encoding == 'identity':
+            return body
+        elif encoding == 'gzip':
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+            return compressor.compress(body) + compressor.flush()
+        elif encoding == 'deflate':
+            return zlib.compress(body, 9)
+        else:
+            raise ValueError('Unsupported encoding {}'.format(encoding))
 
     def get_endpoint_properties(self, properties, endpoints):
         """Return endpoint properties [RFC7285] p 11.4.1"""
@@ -93,45 +179,40 @@ class AltoServer(object):
         parsed_addr = self.parse_endpoints(endpoints)
 
         endp_props = {}
-        dependent_tags = []
-        
-        # Iterate over addresses.
-        # For each address we have to get all properties
-        for address in parsed_addr:
-
-            props = {}
-            
-            for property in properties:
-                
-                provider = self._get_property_provider(property)
-                if provider is None:
-                    logging.info('No property provider for {} property'.format(property))
-                    continue
-                    
-                property_val = provider.get_property(address)
+        dependent_tags = set()
+
+        # Textual representations of the addresses used in the response
+        addr_strings = [self._get_address_parser(address).from_object(address)
+                        for address in parsed_addr]
+
+        # Each provider handles all addresses at once, in the requested order
+        for property in dict.fromkeys(properties):
+
+            provider = self._get_property_provider(property)
+            if provider is None:
+                logging.info('No property provider for {} property'.format(property))
+                continue
+
+            with nm.lock:
+                property_vals = provider.get_properties(parsed_addr)
+
+            num_missing = 0
+            for (addr_string, property_val) in zip(addr_strings, property_vals):
                 if property_val is None:
-                    logging.info('Property {} not processed for address: {}'
-                                 .format(property, str(address)))
+                    num_missing += 1
                     continue
 
                 # Save values
                 (prop_value, dependency) = property_val
-                props[property] = prop_value
-                dependent_tags.append(dependency)
-
-            # Link address to all properties if any
-            if any(props.keys()):
-                endp_props[address] = props
+                endp_props.setdefault(addr_string, {})[property] = prop_value
+                dependent_tags.add(tuple(dependency.items()))
 
-        # Change from object to string
-        keys_copy = list(endp_props.keys())
-        for key in keys_copy:
-            parser = self._get_address_parser(key)
-            new_key = parser.from_object(key)
-            endp_props[new_key] = endp_props.pop(key)
+            if num_missing:
+                logging.info('Property {} not processed for {} of {} addresses'
+                             .format(property, num_missing, len(parsed_addr)))
 
         # Ensure no duplicate dependent vtags
-        no_dupes  = [dict(t) for t in set([tuple(d.items()) for d in dependent_tags])]
+        no_dupes = [dict(t) for t in dependent_tags]
 
         resp = {
             'meta' : {
@@ -142,6 +223,18 @@ class AltoServer(object):
         
         return resp
 
+    def get_endpoint_properties_tag(self, properties, endpoints):
+        """Get entity tag of endpoint properties response. Tag changes
+        if request or the network state properties depend on changes"""
+
+        with nm.lock:
+            state = [nm.get_map_tag(), nm.topo_version, nm.addr_version]
+
+        hasher = hashlib.sha256()
+        hasher.update(json.dumps(state + [properties, endpoints]).encode('utf-8'))
+
+        return hasher.hexdigest()
+
     def get_endpoint_costs(self, cost_type, endpoints):
         """Implement cost calculation service by given endpoints"""
 
@@ -151,8 +244,10 @@ class AltoServer(object):
             cost_type['cost-metric']
         )
 
-        # Get costs provided by cost estimator
-        cost_map = cost_estimator.get_cost(endpoints['srcs'], endpoints['dsts'])
+        # Get costs provided by cost estimator, uploads must not change
+        # the network while costs are computed
+        with nm.lock:
+            cost_map = cost_estimator.get_cost(endpoints['srcs'], endpoints['dsts'])
         
         costmap_response = {
             'meta' : {
@@ -163,6 +258,93 @@ class AltoServer(object):
 
         return costmap_response
 
+    def get_cost_map(self, resource_id):
+        """Return PIDCostMap of the given cost map resource or None.
+        Cost map is recomputed when network map or costs state changes"""
+
+        provider = self._get_cost_map_provider(resource_id)
+        if provider is None:
+            return None
+
+        # Uploads must not change the network while the map is built,
+        # lookup tables of the providers are updated by the upload threads
+        with nm.lock:
+            vtag = nm.get_map_tag()
+            state_version = provider.get_state_version()
+            cost_map = self._cost_maps.get(resource_id)
+            if cost_map is None or not cost_map.is_current(vtag, state_version):
+                cost_map = self._build_cost_map(provider, vtag, state_version)
+                self._cost_maps[resource_id] = cost_map
+
+        return cost_map
+
+    def get_filtered_cost_map(self, cost_type, src_pids, dst_pids):
+        """Return JSON serializable filtered cost map per [RFC7285] p11.3.2
+        or None if there is no cost map of the given cost type.
+        Empty src_pids / dst_pids select all PIDs"""
+
+        provider = self._get_cost_estimator(
+            cost_type['cost-mode'],
+            cost_type['cost-metric']
+        )
+        if provider is None or not provider.provides_cost_map:
+            return None
+
+        cost_map = self.get_cost_map(provider.cost_type)
+
+        return cost_map.get_json_repr(
+            src_pids if any(src_pids) else None,
+            dst_pids if any(dst_pids) else None
+        )
+
+    def get_cost_map_body(self, resource_id, encoding='identity'):
+        """Return (tag, encoded JSON bytes) of the given cost map resource or None"""
+
+        cost_map = self.get_cost_map(resource_id)
+        if cost_map is None:
+            return None
+
+        (cached_tag, bodies) = self._cost_map_bodies.get(resource_id, (None, {}))
+        if cached_tag != cost_map.tag:
+            bodies = {'identity': json.dumps(cost_map.get_json_repr()).encode('utf-8')}
+            self._cost_map_bodies[resource_id] = (cost_map.tag, bodies)
+
+        body = bodies.get(encoding)
+        if body is None:
+            body = AltoServer.compress_body(bodies['identity'], encoding)
+            bodies[encoding] = body
+
+        return (cost_map.tag, body)
+
+    def _build_cost_map(self, provider, vtag, state_version):
+        """Compute costs between all PIDs using given cost provider"""
+
+        (_, pids) = nm.get_pid_topology()
+        pid_names = sorted([pid.name for pid in pids])
+        pid_endpoints = nm.get_pid_endpoints()
+
+        # Router addresses are used only if the PID has no other devices
+        members = []
+        for pid_name in pid_names:
+            devices = [(ip, nm.get_device_by_ip(ip)) for ip in pid_endpoints.get(pid_name, [])]
+            pid_members = [ip for (ip, device) in devices
+                           if device is not None and device.type != 'router']
+            if not any(pid_members):
+                pid_members = [ip for (ip, device) in devices if device is not None]
+            members.append(pid_members)
+
+        logging.info('Building %s cost map for %s PIDs with %s endpoints',
+                     provider.cost_type, len(pid_names), sum(map(len, members)))
+
+        costs = provider.get_pid_cost_matrix(members)
+
+        cost_type = {
+            'cost-mode': provider.cost_mode,
+            'cost-metric': provider.cost_metric
+        }
+
+        return PIDCostMap(cost_type, vtag, state_version, pid_names, costs)
+
     def register_address_parsers(self, addr_parsers):
         """Register given parsers with the server"""
         assert any(addr_parsers)
@@ -175,7 +357,7 @@ class AltoServer(object):
         assert any(prop_provider)
 
         for provider in prop_provider:
-            self._property_providers.append(provider)
+            self._property_providers.setdefault(provider.property_name, provider)
 
     def register_cost_providers(self, cost_providers):
         """Register given cost providers with the ALTO server"""
@@ -194,17 +376,20 @@ class AltoServer(object):
 
         return None
 
-    def _get_property_provider(self, property_name):
-        """Factory method to return endpoint property provider"""
+    def _get_cost_map_provider(self, resource_id):
+        """Get cost provider serving given cost map resource"""
 
-        # Find provider for given property
-        for provider in self._property_providers:
-            if provider.property_name == property_name.lower():
-                return provider
+        for cost_provider in self._cost_providers:
+            if cost_provider.provides_cost_map and cost_provider.cost_type == resource_id:
+                return cost_provider
 
-        # No providers found
         return None
 
+    def _get_property_provider(self, property_name):
+        """Factory method to return endpoint property provider"""
+
+        return self._property_providers.get(property_name.lower())
+
     def _get_address_parser(self, address):
         """Get address parser from address type"""
 
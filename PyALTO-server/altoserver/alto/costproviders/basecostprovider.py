@@ -19,6 +19,10 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 Base class that all cost estimators should extend
 """
+import numpy
+
+from altoserver import nm
+from ..addresstypes.ipaddrparser import IPAddrParser
 
 class BaseCostProvider(object):
     """Abstract class"""
@@ -28,7 +32,164 @@ class BaseCostProvider(object):
         self.cost_mode = None
         self.cost_metric = None
         self.cost_type = None
+        self.provides_cost_map = True   # Can costs be served as PID cost map
+        self.pid_cost_aggregate = numpy.fmin    # Combines costs of all endpoint pairs of two PIDs
 
     def get_cost(self, srcs, dsts):
         """Extending class should implement this"""
         raise NotImplementedError()
+
+    def get_state_version(self):
+        """Get version of the network state costs are derived from.
+        Extending class should extend it if costs depend on other data"""
+        return (nm.topo_version, nm.addr_version, nm.rt_version)
+
+    def get_cost_matrix(self, srcs, dsts):
+        """Get costs from each of srcs to each of dsts IP addresses as
+        numpy array of shape (len(srcs), len(dsts)). Unknown costs are NaN.
+        Extending class can override this for faster bulk computation."""
+
+        ip_parser = IPAddrParser()
+        str_srcs = [ip_parser.from_object(src) for src in srcs]
+        str_dsts = [ip_parser.from_object(dst) for dst in dsts]
+
+        costs = numpy.full((len(srcs), len(dsts)), numpy.nan)
+        if not srcs or not dsts:
+            return costs
+
+        costmap = self.get_cost(str_srcs, str_dsts)
+        for src_idx, src in enumerate(str_srcs):
+            src_costs = costmap.get(src)
+            if src_costs is None:
+                continue
+            for dst_idx, dst in enumerate(str_dsts):
+                cost = src_costs.get(dst)
+                if cost is not None:
+                    costs[src_idx, dst_idx] = cost
+
+        return costs
+
+    def get_pid_cost_matrix(self, pid_endpoints):
+        """Get costs between PIDs given as [[IP address]] of their endpoints as
+        numpy array of shape (len(pid_endpoints), len(pid_endpoints)). Cost between
+        two PIDs combines costs of all their endpoint pairs using pid_cost_aggregate,
+        unknown (NaN) costs are ignored unless all of them are unknown.
+        Extending class can override this for faster bulk computation."""
+
+        num_pids = len(pid_endpoints)
+        costs = numpy.full((num_pids, num_pids), numpy.nan)
+
+        pid_indexes = [index for (index, members) in enumerate(pid_endpoints) if members]
+        if not pid_indexes:
+            return costs
+
+        endpoints = []
+        pid_starts = []
+        for index in pid_indexes:
+            pid_starts.append(len(endpoints))
+            endpoints.extend(pid_endpoints[index])
+
+        endpoint_costs = self.get_cost_matrix(endpoints, endpoints)
+        aggregate = self.pid_cost_aggregate
+        costs[numpy.ix_(pid_indexes, pid_indexes)] = aggregate.reduceat(
+            aggregate.reduceat(endpoint_costs, pid_starts, axis=0), pid_starts, axis=1)
+
+        return costs
+
+    def _get_source_route(self, device, address):
+        """Get (router, access cost, {device name -> cost}) of the source address
+        of device. Router is the one costs are computed from or None, access cost
+        is combined with them. Costs to the given devices are not routed, NaN if
+        none. Extending class using _get_pid_costs_by_router implements this"""
+        raise NotImplementedError()
+
+    def _get_router_costs(self, router, dsts):
+        """Get [cost or None] from router to each of [(IP address, device)]
+        Extending class using _get_pid_costs_by_router implements this"""
+        raise NotImplementedError()
+
+    def _combine_costs(self, access_cost, router_costs):
+        """Combine access cost of a source with (numpy array of) costs from
+        its router. Result must not get better as access cost gets worse"""
+        return router_costs + access_cost
+
+    def _get_pid_costs_by_router(self, pid_endpoints):
+        """Get costs between PIDs as get_pid_cost_matrix does, but computing
+        costs once per router instead of once per source. Sources of a PID
+        behind the same router only differ in their access cost, hence only
+        the best of them decides cost to each destination"""
+
+        num_pids = len(pid_endpoints)
+        costs = numpy.full((num_pids, num_pids), numpy.nan)
+        aggregate = self.pid_cost_aggregate
+        prefers_larger = bool(aggregate(0.0, 1.0) == 1.0)
+
+        # Endpoints of all PIDs, endpoints of each PID are next to each other
+        dsts = []           # [(IP address, device)]
+        dst_pids = []       # Indexes of PIDs having endpoints
+        dst_starts = []     # Index of the first endpoint of each of dst_pids
+        sources = []        # [(PID index, IP address, device)]
+        for (pid_index, members) in enumerate(pid_endpoints):
+            pid_dsts = [(address, nm.get_device_by_ip(address)) for address in members]
+            pid_dsts = [(address, device) for (address, device) in pid_dsts
+                        if device is not None]
+            if not pid_dsts:
+                continue
+            dst_pids.append(pid_index)
+            dst_starts.append(len(dsts))
+            dsts.extend(pid_dsts)
+            sources.extend((pid_index, address, device) for (address, device) in pid_dsts)
+
+        if not dsts:
+            return costs
+
+        dst_columns = {}    # Device name -> [index in dsts]
+        for (column, (_, device)) in enumerate(dsts):
+            dst_columns.setdefault(device.name, []).append(column)
+
+        # Sources of the same PID behind the same router
+        groups = {}         # (PID index, router name) -> (router, [(access cost, costs)])
+        for (pid_index, address, device) in sources:
+            route = self._get_source_route(device, address)
+            if route is None:
+                continue
+            (router, access_cost, direct_costs) = route
+            router_name = None if router is None else router.name
+            groups.setdefault((pid_index, router_name), (router, []))[1].append(
+                (access_cost, direct_costs))
+
+        router_costs = {}   # Router name -> numpy array of costs to dsts
+        no_costs = numpy.full(len(dsts), numpy.nan)
+        for ((pid_index, router_name), (router, members)) in groups.items():
+            if router is None:
+                row = no_costs
+            else:
+                row = router_costs.get(router_name)
+                if row is None:
+                    row = numpy.array(self._get_router_costs(router, dsts), dtype=float)
+                    router_costs[router_name] = row
+
+            # The best source first
+            members.sort(key=lambda member: member[0], reverse=prefers_larger)
+            group_costs = self._combine_costs(members[0][0], row)
+
+            # Destinations some sources reach without routing
+            direct_columns = {}     # Index in dsts -> {member index -> cost}
+            for (member_index, (_, direct_costs)) in enumerate(members):
+                for (device_name, cost) in direct_costs.items():
+                    for column in dst_columns.get(device_name, ()):
+                        direct_columns.setdefault(column, {})[member_index] = cost
+
+            for (column, member_costs) in direct_columns.items():
+                routed_cost = numpy.nan
+                for (member_index, (access_cost, _)) in enumerate(members):
+                    if member_index not in member_costs:
+                        routed_cost = self._combine_costs(access_cost, row[column])
+                        break
+                group_costs[column] = aggregate.reduce(
+                    [routed_cost] + list(member_costs.values()))
+
+            costs[pid_index, dst_pids] = aggregate(
+                costs[pid_index, dst_pids], aggregate.reduceat(group_costs, dst_starts))
+
+        return costs
@@ -19,7 +19,6 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 Routing cost provider that is using OSPF routing distance as its cost.
 """
-import ipaddress
 import logging
 
 from altoserver import nm
@@ -54,10 +53,15 @@ class OSPFCostProvider(BaseCostProvider):
         srcs = [self._ip_parser.to_object(saddr) for saddr in in_srcs]
         dsts = [self._ip_parser.to_object(daddr) for daddr in in_dsts]
 
+        # Each destination is looked up once, even if requested a few times
+        unique_dsts = list(dict.fromkeys(dsts))
+        dst_strs = [self._ip_parser.from_object(dst_addr) for dst_addr in unique_dsts]
+
         # Algorithm (for each SRC IP):
         #   1. Get Device from IP
         #   2. Go Upstream until device is router
-        #   3. Get OSPF RD for each destination
+        #   3. Get OSPF RD for each destination, once per router
+        router_distances = {}   # Router name -> {destination -> OSPF RD}
         costmap = {}
         for source_ip in srcs:
             device = nm.get_device_by_ip(source_ip)
@@ -76,17 +80,18 @@ class OSPFCostProvider(BaseCostProvider):
                              str(source_ip))
                 continue
 
-            # Extract destination OSPF RD for each destination
-            distances = {}
-            for dst_addr in dsts:
-                ospf_rd = self._get_ospf_rd(first_hop_rtr, dst_addr)
-                if ospf_rd is not None:
-                    distances[self._ip_parser.from_object(dst_addr)] = ospf_rd
-                    logging.info('OSPF RD: From: %s To: %s -> %s', 
-                                 str(source_ip), str(dst_addr), ospf_rd)
-                else:
-                    logging.info('OSPF cost from %s to %s not found',
-                                 str(source_ip), str(dst_addr))
+            # Sources behind the same router share its distances
+            distances = router_distances.get(first_hop_rtr)
+            if distances is None:
+                distances = {}
+                rds = self._get_ospf_rds(first_hop_rtr, unique_dsts)
+                for (dst_str, ospf_rd) in zip(dst_strs, rds):
+                    if ospf_rd is not None:
+                        distances[dst_str] = ospf_rd
+
+                logging.info('OSPF RD: From: %s found to %d of %d destinations',
+                             first_hop_rtr, len(distances), len(unique_dsts))
+                router_distances[first_hop_rtr] = distances
 
             # Save results if any
             if any(distances):
@@ -95,32 +100,29 @@ class OSPFCostProvider(BaseCostProvider):
         # Resulting cost-map
         return costmap
 
-    def _get_ospf_rd(self, router_name, destination):
-        """Given router name, ger OSPF RD for each destination"""
+    def get_pid_cost_matrix(self, pid_endpoints):
+        """Get costs between PIDs looking up OSPF RD once per first hop router"""
+        return self._get_pid_costs_by_router(pid_endpoints)
 
-        assert (isinstance(destination, ipaddress.IPv4Address) or
-                isinstance(destination, ipaddress.IPv6Address))
+    def _get_source_route(self, device, address):
+        """Sources use the OSPF RD of their first hop router"""
 
-        router = nm.get_device_by_name(router_name)
-        if router is None:
+        first_hop_rtr = nm.get_upstream_router(device.name)
+        if first_hop_rtr is None:
             return None
 
-        # Check for entires in Quagga RT
-        quagga_rt = router.quagga_routing_table
-        if not any(quagga_rt):
-            return None
+        return (nm.get_device_by_name(first_hop_rtr), 0, {})
 
-        rd_min = None
-        for route_line in quagga_rt:
-            if route_line['protocol'] != 'O':
-                continue
+    def _get_router_costs(self, router, dsts):
+        """Get OSPF RD from router to each destination"""
+        return router.get_ospf_distances([address for (address, _) in dsts])
+
+    def _get_ospf_rds(self, router_name, destinations):
+        """Given router name, get OSPF RD for each destination"""
 
-            # route_line is OSPF
-            if destination in ipaddress.ip_network(route_line['subnet']):
-                # find min RD
-                if rd_min is None:
-                    rd_min = route_line['RD']
-                else:
-                    rd_min = min([rd_min, route_line['RD']])
+        router = nm.get_device_by_name(router_name)
+        if router is None:
+            return [None] * len(destinations)
 
-        return rd_min
+        # Lookup in the router's compiled Quagga RT
+        return router.get_ospf_distances(destinations)
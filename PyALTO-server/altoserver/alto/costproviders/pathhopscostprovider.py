@@ -38,6 +38,7 @@ class PathHopsCostProvider(BaseCostProvider):
         self.cost_metric = 'hops-path'
         self.cost_mode = 'numerical'
         self.cost_type = 'hops-path'
+        self.provides_cost_map = False
 
         self._ip_parser = IPAddrParser()
 
@@ -59,7 +60,7 @@ class PathHopsCostProvider(BaseCostProvider):
 
         path = {}
 
-        for index, node in enumerate(nm.dev_to_dev_iterator(srcs[0], dsts[0])):
+        for index, node in enumerate(nm.get_path(srcs[0], dsts[0])):
             path[index] = node.name
 
         data = {
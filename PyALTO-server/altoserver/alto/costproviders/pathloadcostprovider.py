@@ -26,7 +26,11 @@ available bandwidth along the path from source to destination.
 """
 import logging
 
+import numpy
+
 from altoserver import nm
+from altoserver.adapterstats import LOAD_ESTIMATORS
+from altoserver.widestpathtable import WidestPathTable
 from .basecostprovider import BaseCostProvider
 from ..addresstypes.ipaddrparser import IPAddrParser
 
@@ -36,105 +40,100 @@ class PathLoadCostProvider(BaseCostProvider):
     @staticmethod
     def get_link_capacity(from_node, to_node):
         """Get link capacity between given nodes"""
-        for (a_node, b_node, params) in nm.get_out_edges(from_node):
-
-            # Sanity check
-            assert a_node == from_node
-
-            # Are we connected to the required node
-            if b_node == to_node:
-                # Get capacity or None
-                return params.get('capacity')
-
-        # Not found
-        return None
+        return nm.get_link_capacity(from_node, to_node)
 
     @staticmethod
-    def get_residual_bw_for_path(path):
-        """Given {Step->Node} path, get residual bw"""
-
-        residual_bws = []
-        idx_node_a = 0
-        idx_node_b = 1
-        pairs_left = len(path) - 1
-        debug_str = ''
-
-        while pairs_left:
-            node_a = path[idx_node_a]
-            node_b = path[idx_node_b]
-
-            # Get link's capacity
-            cap_a_to_b = PathLoadCostProvider.get_link_capacity(
-                node_a, node_b)
-            if cap_a_to_b is None:
-                logging.warning('No known capacity from %s to %s',
-                                node_a, node_b)
-                return None
-
-            # We do not know user-to-user links load, so use link's capacity
-            if node_a.type == 'user' and node_b.type == 'user':
-                residual_bws.append(cap_a_to_b)
-
-                idx_node_a += 1
-                idx_node_b += 1
-                pairs_left -= 1
+    def compute_link_residual_bw(node_a, node_b, load_estimator='last'):
+        """Get residual bw of the link from node_a to node_b or None.
+        Load is estimated using one of adapterstats.LOAD_ESTIMATORS"""
+
+        # Get link's capacity
+        cap_a_to_b = PathLoadCostProvider.get_link_capacity(node_a, node_b)
+        if cap_a_to_b is None:
+            logging.warning('No known capacity from %s to %s',
+                            node_a, node_b)
+            return None
+
+        # We do not know user-to-user links load, so use link's capacity
+        if node_a.type == 'user' and node_b.type == 'user':
+            return cap_a_to_b
+
+        # Get adapter details
+        adapters = nm.core_data.get_adapter_names(node_a.name, node_b.name)
+        if adapters is None:
+            logging.warning('Unable to get adapters conencting %s to %s',
+                            node_a, node_b)
+            return None
+
+        ((node_a_global, node_a_local), (node_b_global, node_b_local)) = adapters
+
+        load = None
+        rbw = None
+
+        # Get RX BW on node_b of TX BW on node_a
+        if node_b.type == 'user':
+            # Get upload from dev A
+            load = node_a.get_adapter_tx_load(node_a_local, load_estimator)
+        else:
+            # Get download from dev B
+            load = node_b.get_adapter_rx_load(node_b_local, load_estimator)
+
+        if load is None:
+            rbw = cap_a_to_b
+        else:
+            load = int(load)
+            rbw = max([0, cap_a_to_b - load])
+
+        logging.info('%s -> %s Cap/Load/RBW %s/%s/%s',
+                     node_a.name, node_b.name, cap_a_to_b, load, rbw)
+
+        return rbw
+
+    def __init__(self, load_estimator='last'):
+        """Init the cost provider. Link loads are estimated using one of
+        adapterstats.LOAD_ESTIMATORS, each estimator is a separate metric"""
+        if load_estimator not in LOAD_ESTIMATORS:
+            raise ValueError('Unknown load estimator {}'.format(load_estimator))
 
-                continue
-
-            # Get adapter details
-            adapters = nm.core_data.get_adapter_names(node_a.name, node_b.name)
-            if adapters is None:
-                logging.warning('Unable to get adapters conencting %s to %s',
-                                node_a, node_b)
-                return None
-
-            ((node_a_global, node_a_local), (node_b_global, node_b_local)) = adapters
-
-            load = None
-            rbw = None
-
-            # Get RX BW on node_b of TX BW on node_a
-            if node_b.type == 'user':
-                # Get upload from dev A
-                load = node_a.get_adapter_tx_load(node_a_local)
-                if load is None:
-                    rbw = cap_a_to_b
-                else:
-                    load = int(load)
-                    rbw = max([0, cap_a_to_b - load])
-            else:
-                # Get download from dev B
-                load = node_b.get_adapter_rx_load(node_b_local)
-                if load is None:
-                    rbw = cap_a_to_b
-                else:
-                    load = int(load)
-                    rbw = max([0, cap_a_to_b - load])
-
-            residual_bws.append(rbw)
-            debug_str = ';'.join([
-                debug_str, 
-                '{} -> {} Cap/Load/RBW {}/{}/{}'
-                .format(node_a.name, node_b.name, cap_a_to_b, load, rbw)
-            ])
-
-            # Continue on the path
-            idx_node_a += 1
-            idx_node_b += 1
-            pairs_left -= 1
-
-        logging.info(debug_str)
-        return min(residual_bws)
-
-    def __init__(self):
-        """Init the cost provider"""
         super().__init__()
         self.cost_metric = 'residual-pathbandwidth'
+        if load_estimator != 'last':
+            self.cost_metric = '{}-{}'.format(self.cost_metric, load_estimator)
         self.cost_mode = 'numerical'
-        self.cost_type = 'residual-pathbandwidth'
+        self.cost_type = self.cost_metric
+        self.pid_cost_aggregate = numpy.fmax    # Widest of the paths between two PIDs
+
+        self._load_estimator = load_estimator
 
         self._ip_parser = IPAddrParser()
 
+        # Links are shared by many paths, residual bw of each link is
+        # computed once per version of the topology and adapter stats
+        self._link_rbw = {}             # (Node A name, Node B name) -> RBW or None
+        self._link_rbw_version = None
+
+        # Bottlenecks of routed paths, shared by all sources behind the same router
+        self._widest_paths = WidestPathTable(nm, self.get_link_residual_bw)
+
+    def get_link_residual_bw(self, node_a, node_b):
+        """Get residual bw of the link from node_a to node_b or None"""
+
+        version = (nm.topo_version, nm.stats_version)
+        if version != self._link_rbw_version:
+            self._link_rbw = {}
+            self._link_rbw_version = version
+
+        key = (node_a.name, node_b.name)
+        if key not in self._link_rbw:
+            self._link_rbw[key] = PathLoadCostProvider.compute_link_residual_bw(
+                node_a, node_b, self._load_estimator)
+
+        return self._link_rbw[key]
+
+    def get_state_version(self):
+        """Residual bandwidth also depends on the adapter stats"""
+        return super().get_state_version() + (nm.stats_version,)
+
     def get_cost(self, in_srcs, in_dsts):
         """Return cost based on the residual bandwidth"""
 
@@ -146,21 +145,20 @@ class PathLoadCostProvider(BaseCostProvider):
         srcs = [self._ip_parser.to_object(saddr) for saddr in in_srcs]
         dsts = [self._ip_parser.to_object(daddr) for daddr in in_dsts]
 
+        # Resolve devices once, unknown ones are skipped
+        src_devices = self._get_devices(srcs)
+        dst_devices = self._get_devices(dsts)
+
         costmap = {}
 
         # Loop over sources and destinations
-        for src in srcs:
+        for (src, src_device) in src_devices:
             this_src = {}
 
-            for dst in dsts:
-
-                # Get path
-                this_path = {}
-                for index, node in enumerate(nm.dev_to_dev_iterator(src, dst)):
-                    this_path[index] = node
+            for (dst, dst_device) in dst_devices:
 
-                # Get residual BW
-                rbw = PathLoadCostProvider.get_residual_bw_for_path(this_path)
+                # Get bottleneck of the routed path
+                rbw = self._widest_paths.get_bottleneck(src_device, dst_device, dst)
                 if rbw is None:
                     continue
 
@@ -172,3 +170,43 @@ class PathLoadCostProvider(BaseCostProvider):
                 costmap[self._ip_parser.from_object(src)] = this_src
 
         return costmap
+
+    def get_pid_cost_matrix(self, pid_endpoints):
+        """Get costs between PIDs tracing paths once per first hop router"""
+        return self._get_pid_costs_by_router(pid_endpoints)
+
+    def _get_source_route(self, device, address):
+        """Source is limited by the bottleneck up to its first hop router,
+        devices on the way up are reached without routing"""
+
+        (upstream, reached_router) = self._widest_paths.get_upstream(device)
+        direct_rbws = {up_device.name: bottleneck for (up_device, bottleneck) in upstream}
+
+        # Path without links has no bandwidth
+        direct_rbws[device.name] = numpy.nan
+
+        (router, up_bottleneck) = upstream[-1]
+        return (router if reached_router else None, up_bottleneck, direct_rbws)
+
+    def _get_router_costs(self, router, dsts):
+        """Get bottleneck from router to each destination"""
+
+        return [self._widest_paths.get_router_bottleneck(router, device, address)
+                for (address, device) in dsts]
+
+    def _combine_costs(self, access_cost, router_costs):
+        """Path is as wide as its narrowest part"""
+        return numpy.minimum(router_costs, access_cost)
+
+    def _get_devices(self, ip_addrs):
+        """Get [(IP, device)] of given IPs, skipping unknown devices"""
+
+        devices = []
+        for ip_addr in ip_addrs:
+            device = nm.get_device_by_ip(ip_addr)
+            if device is None:
+                logging.info('Failed to find device having IP %s', str(ip_addr))
+                continue
+            devices.append((ip_addr, device))
+
+        return devices
@@ -24,10 +24,12 @@ protocols with the only exception that it can be over 15. In RIP
 everything over 15 routing hops is considered unreachable.
 """
 
-import ipaddress
 import logging
 
+import numpy
+
 from altoserver import nm
+from altoserver.routehopstable import RouteHopsTable
 from .basecostprovider import BaseCostProvider
 from ..addresstypes.ipaddrparser import IPAddrParser
 
@@ -42,6 +44,7 @@ class RouteHopsCostProvider(BaseCostProvider):
         self.cost_type = 'hops-routingcost'
 
         self._ip_parser = IPAddrParser()
+        self._hops_table = RouteHopsTable(nm)
 
     def get_cost(self, in_srcs, in_dsts):
         """Return cost map based on number of
@@ -59,9 +62,14 @@ class RouteHopsCostProvider(BaseCostProvider):
         srcs = [self._ip_parser.to_object(saddr) for saddr in in_srcs]
         dsts = [self._ip_parser.to_object(daddr) for daddr in in_dsts]
 
+        # Each destination is traced once, even if requested a few times
+        unique_dsts = list(dict.fromkeys(dsts))
+        dst_strs = {dst: self._ip_parser.from_object(dst) for dst in unique_dsts}
+
         # N.B. This cost CAN be 0 if source and destination is connected
         # directly or over the switch type device. If the SRC==DST, this
         # will be set to 0.
+        router_hops = {}    # Router name -> {destination -> hops or None}
         costmap = {}
         for source_ip in srcs:
 
@@ -71,18 +79,38 @@ class RouteHopsCostProvider(BaseCostProvider):
                 logging.info('Device having addr: %s not found', str(source_ip))
                 continue
 
-            # One the device if found, trace to all destinations
+            # Sources behind the same router share its hops to destinations
+            first_hop_rtr = self._get_first_hop_router(device)
+            if first_hop_rtr is None:
+                logging.warning('Could not get FHR for dev %s', device.name)
+                dst_hops = {}
+            else:
+                dst_hops = router_hops.get(first_hop_rtr.name)
+                if dst_hops is None:
+                    dst_hops = {
+                        dst: self._hops_table.get_hops(first_hop_rtr, dst)
+                        for dst in unique_dsts
+                    }
+                    router_hops[first_hop_rtr.name] = dst_hops
+
+            # Hosts are one more hop away than their router
+            extra_hops = 0 if device.type == 'router' else 1
+            src_intf = self._get_source_interface(device, source_ip)
+
             distances = {}
-            for destination_ip in dsts:
-                cost = self._trace_l3_hops(device, source_ip, destination_ip)
-                if cost is None:
-                    logging.info('No cost from %s to %s',
-                                 str(source_ip), str(destination_ip))
+            for destination_ip in unique_dsts:
+                # Are devices the same or connected to the same broadcast domain
+                if (destination_ip == source_ip or
+                        (src_intf is not None and destination_ip in src_intf.network)):
+                    distances[dst_strs[destination_ip]] = 0
                     continue
-                else:
-                    logging.info('Cost from %s to %s is %s',
-                                 str(source_ip), str(destination_ip), cost)
-                    distances[self._ip_parser.from_object(destination_ip)] = cost
+
+                routing_distance = dst_hops.get(destination_ip)
+                if routing_distance is not None:
+                    distances[dst_strs[destination_ip]] = routing_distance + extra_hops
+
+            logging.info('Cost from %s found to %d of %d destinations',
+                         str(source_ip), len(distances), len(unique_dsts))
 
             # Save results if any
             if any(distances):
@@ -91,85 +119,59 @@ class RouteHopsCostProvider(BaseCostProvider):
         #Return costmap
         return costmap
 
-    def _trace_l3_hops(self, src_device, source, destination):
-        """Trace the path from source to destination
-        returning number of network hops"""
+    def get_pid_cost_matrix(self, pid_endpoints):
+        """Get costs between PIDs computing hops once per first hop router"""
+
+        costs = self._get_pid_costs_by_router(pid_endpoints)
+
+        # Endpoints connected to the same network are 0 hops away
+        network_pids = {}   # Network -> {PID index}
+        for (pid_index, members) in enumerate(pid_endpoints):
+            for address in members:
+                device = nm.get_device_by_ip(address)
+                if device is None:
+                    continue
+                intf = self._get_source_interface(device, address)
+                if intf is not None:
+                    network_pids.setdefault(intf.network, set()).add(pid_index)
+
+        for pid_indexes in network_pids.values():
+            pid_indexes = sorted(pid_indexes)
+            costs[numpy.ix_(pid_indexes, pid_indexes)] = 0
 
-        # Handle some of the corner cases
-        if source == destination:
-            return 0
+        return costs
+
+    def _get_source_route(self, device, address):
+        """Hops are counted from the first hop router, hosts are one hop further"""
+
+        extra_hops = 0 if device.type == 'router' else 1
+        return (self._get_first_hop_router(device), extra_hops, {})
+
+    def _get_router_costs(self, router, dsts):
+        """Get hops from router to each destination"""
+
+        return [self._hops_table.get_hops(router, address) for (address, _) in dsts]
+
+    def _get_source_interface(self, src_device, source):
+        """Get interface of the device having the source ip"""
 
-        # Get interface having source ip
-        src_intf = None
         for intf in src_device.ip_interfaces:
             if intf.ip == source:
-                src_intf = intf
+                return intf
 
-        # Are devices connected to the same broadcast domain
-        if destination in src_intf.network:
-            return 0
+        return None
 
-        # At this point the destination is at least 1 hop away
-        # If this is router do nothing, else - get FHR
-        cur_rtr = None
-        if src_device.type == 'router':
-            cur_rtr = src_device
-        if src_device.type != 'router':
-            fhr_name = self._get_upstream_router(src_device.name)
-            if fhr_name is None:
-                logging.warning('Could not get FHR for dev %s', src_device.name)
-                return None
-            cur_rtr = nm.get_device_by_name(fhr_name)
-
-        # Loop through network until target rtr is found
-        routing_distance = 0
-        ttl = 128   # Adjust this for your network size
-        while True:
-            # Prevent infinite looping
-            if ttl == 0:
-                logging.warning('TTL expired while tracing from %s to %s',
-                                str(source), str(destination))
-                return None
-
-            # Get the line-of-interest from the routing table
-            rtable = cur_rtr.routing_table
-            if not any(rtable):
-                logging.warning('Routing table empty in %s', cur_rtr.name)
-                return None
-
-            route_line = None
-            for line in rtable:
-                network = ipaddress.ip_network('{}/{}'.format(
-                    line['destination'], line['mask']))
-                if destination in network:
-                    route_line = line
-                    break
-
-            if route_line is None:
-                logging.warning('Did not find route to %s in rtr %s',
-                                destination, cur_rtr.name)
-                return None
-
-            # We have route line, check what to do next
-            if 'G' not in route_line['flags']:
-                # Do not use gateway - destination conencted directly!
-                break
-            else:
-                # Get the GW router
-                cur_rtr = nm.get_device_by_ip(ipaddress.ip_address(route_line['gateway']))
-                if cur_rtr is None:
-                    logging.warning('Did not find device with IP: %s', route_line['gateway'])
-                    return None
-                routing_distance += 1
-                ttl -= 1
-                continue
+    def _get_first_hop_router(self, src_device):
+        """Get the router itself or the first hop router of other devices"""
 
-        # Adjust the final value
-        if src_device.type != 'router':
-            routing_distance += 1
+        if src_device.type == 'router':
+            return src_device
 
-        return routing_distance
+        fhr_name = self._get_upstream_router(src_device.name)
+        if fhr_name is None:
+            return None
 
+        return nm.get_device_by_name(fhr_name)
 
     def _get_upstream_router(self, device_name):
         """Given the device name find first hop router"""
@@ -0,0 +1,106 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Precomputed PID to PID costs served as ALTO cost map [RFC7285] p11.2.3
+"""
+import hashlib
+import json
+
+import numpy
+
+class PIDCostMap(object):
+    """Dense matrix of costs between all PIDs of the network map"""
+
+    def __init__(self, cost_type, vtag, state_version, pid_names, costs):
+        """Init cost map. costs[i, j] is cost from pid_names[i]
+        to pid_names[j] or NaN if cost is not known"""
+
+        self.cost_type = cost_type          # {'cost-mode': ..., 'cost-metric': ...}
+        self.vtag = vtag                    # Tag of the network map PIDs are from
+        self.state_version = state_version  # Version of the network state costs are from
+        self.pid_names = pid_names
+        self.pid_index = {name: index for index, name in enumerate(pid_names)}
+        self.costs = costs
+
+        # Tag identifying this version of the cost map
+        hasher = hashlib.sha256()
+        hasher.update(json.dumps([vtag, cost_type, state_version]).encode('utf-8'))
+        self.tag = hasher.hexdigest()
+
+    def is_current(self, vtag, state_version):
+        """Check if cost map was computed from the given state"""
+        return self.vtag == vtag and self.state_version == state_version
+
+    def get_json_repr(self, src_pids=None, dst_pids=None):
+        """Get JSON encodable representation. If src_pids or dst_pids
+        are given, only costs between these PIDs are included"""
+
+        # Select rows and columns of requested PIDs, unknown PIDs are skipped
+        src_indexes = self._get_pid_indexes(src_pids)
+        dst_indexes = self._get_pid_indexes(dst_pids)
+        costs = self.costs[numpy.ix_(src_indexes, dst_indexes)]
+
+        cost_map = {}
+        for row_idx, src_idx in enumerate(src_indexes):
+            row = costs[row_idx]
+            known = numpy.flatnonzero(~numpy.isnan(row))
+            if not len(known):
+                continue
+
+            cost_map[self.pid_names[src_idx]] = {
+                self.pid_names[dst_indexes[col_idx]]: PIDCostMap._to_json_number(row[col_idx])
+                for col_idx in known
+            }
+
+        return {
+            'meta': {
+                'dependent-vtags': [{
+                    'resource-id': 'network-map',
+                    'tag': self.vtag
+                }],
+                'cost-type': self.cost_type
+            },
+            'cost-map': cost_map
+        }
+
+    def _get_pid_indexes(self, pid_names):
+        """Get matrix indexes of given PIDs or of all PIDs if None"""
+
+        if pid_names is None:
+            return numpy.arange(len(self.pid_names))
+
+        indexes = []
+        seen = set()
+        for pid_name in pid_names:
+            index = self.pid_index.get(pid_name)
+            if index is not None and index not in seen:
+                indexes.append(index)
+                seen.add(index)
+
+        return numpy.array(indexes, dtype=numpy.intp)
+
+    @staticmethod
+    def _to_json_number(value):
+        """Convert numpy float to int if possible, else to float"""
+
+        value = float(value)
+        if value.is_integer():
+            return int(value)
+
+        return value
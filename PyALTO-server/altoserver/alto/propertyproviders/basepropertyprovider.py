@@ -29,3 +29,8 @@ class BasePropertyProvider(object):
     def get_property(self, endpoint):
         """Return value of the property"""
         raise NotImplementedError
+
+    def get_properties(self, endpoints):
+        """Return list of property values (or None) in the order of the
+        given endpoints. Override to handle whole request at once"""
+        return [self.get_property(endpoint) for endpoint in endpoints]
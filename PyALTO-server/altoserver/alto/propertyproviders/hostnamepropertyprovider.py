@@ -53,3 +53,26 @@ class HostnamePropertyProvider(BasePropertyProvider):
 
         # Return device name and meta of map this name was derived from
         return (device.name, nm.get_map_meta())
+
+    def get_properties(self, endpoints):
+        """Return Hostnames of all given endpoints"""
+
+        logging.info('Hostname request for %d endpoints', len(endpoints))
+
+        # Names are from the same map
+        map_meta = nm.get_map_meta()
+
+        results = []
+        for endpoint in endpoints:
+            # This class supports IP addresses only
+            if not isinstance(endpoint, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+                results.append(None)
+                continue
+
+            device = nm.get_device_by_ip(endpoint)
+            if device is None:
+                results.append(None)
+            else:
+                results.append((device.name, map_meta))
+
+        return results
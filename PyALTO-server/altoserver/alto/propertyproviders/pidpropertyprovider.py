@@ -53,3 +53,26 @@ class PIDPropertyProvider(BasePropertyProvider):
 
         # Return with dependant information
         return (endpoint_pid, nm.get_map_meta())
+
+    def get_properties(self, endpoints):
+        """Return PIDs and dependant VTAGs of all given endpoints"""
+
+        logging.info('PID lookup for %d endpoints', len(endpoints))
+
+        # This class supports IP addresses only
+        ip_endpoints = [endpoint for endpoint in endpoints
+                        if isinstance(endpoint, (ipaddress.IPv4Address, ipaddress.IPv6Address))]
+        endpoint_pids = dict(zip(ip_endpoints, nm.get_pids_from_ips(ip_endpoints)))
+
+        # All PIDs are from the same map
+        map_meta = nm.get_map_meta()
+
+        results = []
+        for endpoint in endpoints:
+            endpoint_pid = endpoint_pids.get(endpoint)
+            if endpoint_pid is None:
+                results.append(None)
+            else:
+                results.append((endpoint_pid, map_meta))
+
+        return results
@@ -0,0 +1,188 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+ALTO incremental updates using Server-Sent Events in the style of [RFC8895].
+Clients get full resource once and JSON merge patches [RFC7396] afterwards.
+"""
+import json
+import logging
+import threading
+import time
+
+from altoserver import nm
+
+def make_merge_patch(old, new):
+    """Build JSON merge patch transforming old into new"""
+
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return new
+
+    patch = {}
+    for key in old:
+        if key not in new:
+            patch[key] = None
+
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif old[key] != value:
+            patch[key] = make_merge_patch(old[key], value)
+
+    return patch
+
+class UpdateStreamService(object):
+    """Pushes changes of network map and cost maps to subscribed clients"""
+
+    def __init__(self, alto_server, min_interval=1.0, keepalive_interval=15.0):
+        """Init the service. Changes are sent at most once per min_interval
+        seconds, idle streams get a comment every keepalive_interval seconds"""
+
+        self._alto_server = alto_server
+        self._min_interval = min_interval
+        self._keepalive_interval = keepalive_interval
+
+        self._changed = threading.Condition()
+        self._change_count = 0
+
+        # Resource id -> (tag, media type, data, previous tag, merge patch from previous data).
+        # Shared by all streams, so each update is computed once per resource version
+        self._updates = {}
+        self._updates_lock = threading.Lock()
+
+        nm.add_listener(self._on_network_change)
+
+    def has_resource(self, resource_id):
+        """Check if updates of given resource can be streamed"""
+        return self._get_resource(resource_id) is not None
+
+    def stream(self, subscriptions):
+        """Generator of SSE events. subscriptions -> {Client id: Resource id}"""
+
+        sent = {}   # Client id -> tag last sent to the client
+
+        try:
+            while True:
+                # Changes made while sending will be seen on next round
+                with self._changed:
+                    seen_changes = self._change_count
+
+                for client_id, resource_id in subscriptions.items():
+                    update = self._get_update(resource_id)
+                    if update is None:
+                        continue
+
+                    (tag, media_type, data, prev_tag, patch) = update
+                    last_tag = sent.get(client_id)
+                    if last_tag == tag:
+                        continue
+
+                    if last_tag is not None and last_tag == prev_tag:
+                        if any(patch):
+                            yield UpdateStreamService._format_event(
+                                'application/merge-patch+json', client_id, patch)
+                    else:
+                        # New client or client missed some versions
+                        yield UpdateStreamService._format_event(media_type, client_id, data)
+
+                    sent[client_id] = tag
+
+                # Wait for the next change of the network state
+                with self._changed:
+                    changed = self._changed.wait_for(
+                        lambda: self._change_count != seen_changes,
+                        timeout=self._keepalive_interval)
+
+                if not changed:
+                    yield ': keep-alive\n\n'
+                    continue
+
+                # Let a burst of uploads settle before recomputing
+                time.sleep(self._min_interval)
+
+        except Exception as exc:
+            logging.exception('Exc in update stream', exc_info = exc)
+            yield UpdateStreamService._format_event(
+                'application/alto-updatestreamcontrol+json', None,
+                {'description': 'Internal server error, the stream is closed'})
+
+    def _get_update(self, resource_id):
+        """Get (tag, media type, data, previous tag, merge patch from previous data)
+        of the current version of the given resource or None"""
+
+        with self._updates_lock:
+            # Tag and data must be of the same network version
+            with nm.lock:
+                resource = self._get_resource(resource_id)
+                if resource is None:
+                    return None
+
+                (tag, media_type, get_data) = resource
+                update = self._updates.get(resource_id)
+                if update is not None and update[0] == tag:
+                    return update
+
+                data = get_data()
+
+            if update is None:
+                update = (tag, media_type, data, None, None)
+            else:
+                update = (tag, media_type, data, update[0], make_merge_patch(update[2], data))
+
+            self._updates[resource_id] = update
+            return update
+
+    def _get_resource(self, resource_id):
+        """Get (tag, media type, data getter) of the given resource or None"""
+
+        if resource_id == 'network-map':
+            return (
+                nm.get_map_tag(),
+                'application/alto-networkmap+json',
+                self._alto_server.get_network_map
+            )
+
+        cost_map = self._alto_server.get_cost_map(resource_id)
+        if cost_map is None:
+            return None
+
+        return (
+            cost_map.tag,
+            'application/alto-costmap+json',
+            cost_map.get_json_repr
+        )
+
+    def _on_network_change(self, event, device):
+        """Wake up streams waiting for changes"""
+
+        with self._changed:
+            self._change_count += 1
+            self._changed.notify_all()
+
+    @staticmethod
+    def _format_event(media_type, client_id, data):
+        """Format SSE event carrying data of given client id.
+        Control events are not related to any client and have no client id"""
+
+        logging.debug('Update stream event %s for %s', media_type, client_id)
+
+        if client_id is None:
+            return 'event: {}\ndata: {}\n\n'.format(media_type, json.dumps(data))
+
+        return 'event: {},{}\ndata: {}\n\n'.format(
+            media_type, client_id, json.dumps(data))
@@ -27,10 +27,12 @@ class CoreNetData(object):
 
     _bridges = {}
     _mappings = {}
+    _adapter_names = {}
     valid = False
 
     # _bridges = { bridge_name -> [global_a, global_b]}
     # _mappings = { hostname -> [[global, local], ...]}
+    # _adapter_names = { (src_device, dst_device) -> result of get_adapter_names }
 
     def load_data(self, filename):
         """Load data from given filename"""
@@ -42,6 +44,7 @@ class CoreNetData(object):
 
         self._bridges = data['links']
         self._mappings = data['names']
+        self._adapter_names = {}
 
         self._validate()
         self.valid = True
@@ -83,7 +86,17 @@ class CoreNetData(object):
 
     def get_adapter_names(self, src_device, dst_device):
         """Get adapter names connecting src_device with dst_device"""
-        
+
+        # Connections do not change once loaded, look each pair up once
+        key = (src_device, dst_device)
+        if key not in self._adapter_names:
+            self._adapter_names[key] = self._find_adapter_names(src_device, dst_device)
+
+        return self._adapter_names[key]
+
+    def _find_adapter_names(self, src_device, dst_device):
+        """Search for adapter names connecting src_device with dst_device"""
+
         # Get all source device adapters
         src_node_adapters = self._mappings.get(src_device)
         if src_node_adapters is None:
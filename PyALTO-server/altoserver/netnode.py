@@ -19,16 +19,21 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 Representation of network device
 """
-import collections
 import ipaddress
 import time
 import logging
 
+from altoserver.prefixtrie import PrefixTrie
+from altoserver.adapterstats import AdapterStatsRing, counters_from_stats
+from altoserver.routedelta import get_route_key, get_routes_hash
+
 class NetNode(object):
     """NetNode class represents a single network device"""
     # Once created, all properties should be public, but changes
     # should be strictly controlled, hence using @property.
 
+    stats_history = 10          # Number of adapter stats samples kept per adapter
+
     def __init__(self, name, dev_type, in_ips=[], upst=None):
         """Initialize the device"""
 
@@ -38,10 +43,18 @@ class NetNode(object):
         self._upstream = None   # Upstream device (user->adslam, adslam->router, router->None)
         self._ip_interfaces = []# IP addresses assigned to device. Switch will have none
         self._rt = None         # Routing table
+        self._rt_version = 0    # Changed each time content of the routing table changes
+        self._rt_hash = get_routes_hash([]) # Hash of the routing table lines
+        self._fib = None        # Routing table compiled for LPM: prefix -> (intf, gw)
+        self._fib_default = None# Default route (intf, gw) if any
+        self._fib_prefixes = frozenset() # All prefixes in the routing table
         self._qrt = None        # Quagga routing table
+        self._qrt_hash = get_routes_hash([]) # Hash of the Quagga routing table lines
+        self._ospf_rd = None    # OSPF subnets compiled for lookups: prefix -> min RD
 
         # Time series data
-        self._adapter_stats = collections.deque([], maxlen=10)
+        self._adapter_stats = {}    # Adapter name -> AdapterStatsRing
+        self._stats_time = None     # Time of the latest adapter stats upload
         self._address_details = []
 
         self._name = name       
@@ -78,6 +91,26 @@ class NetNode(object):
         else:
             return self._rt
 
+    @property
+    def routed_prefixes(self):
+        """Get set of IP prefixes present in the routing table"""
+        return self._fib_prefixes
+
+    @property
+    def routing_table_hash(self):
+        """Get hash of the routing table used by delta uploads"""
+        return self._rt_hash
+
+    @property
+    def quagga_routing_table_hash(self):
+        """Get hash of the Quagga routing table used by delta uploads"""
+        return self._qrt_hash
+
+    @property
+    def rt_version(self):
+        """Get version of the routing table"""
+        return self._rt_version
+
     @property
     def quagga_routing_table(self):
         """Get Quagga routing table"""
@@ -89,17 +122,33 @@ class NetNode(object):
 
     @property
     def interface_stats(self):
-        """Return latest observed adapter stats"""
-        return self._adapter_stats[-1]
+        """Return latest observed adapter stats as (time, [{'name', 'stats'}])"""
+
+        stats = []
+        for (adapter_name, ring) in self._adapter_stats.items():
+            (_, counters) = ring.get_latest()
+            stats.append({'name': adapter_name, 'stats': counters})
+
+        return (self._stats_time, stats)
+
+    @staticmethod
+    def parse_interface_addresses(addr_data):
+        """Get [IPv4/v6Interface] of the uploaded addresses.
+        Raises ValueError, KeyError or TypeError if data is malformed"""
+        return [ipaddress.ip_interface(intf_addr['address']) for intf_addr in addr_data]
+
+    def update_interface_addresses(self, addr_data, ip_interfaces=None):
+        """Called with new interface data. ip_interfaces are
+        parsed addr_data if they are already known"""
 
-    def update_interface_addresses(self, addr_data):
-        """Called with new interface data"""
+        # Parse everything first, so that malformed data changes nothing
+        if ip_interfaces is None:
+            ip_interfaces = NetNode.parse_interface_addresses(addr_data)
 
         # Update assigned IP addresses
         self._ip_interfaces.clear()
 
-        for intf_addr in addr_data:
-            ip_intf = ipaddress.ip_interface(intf_addr['address'])
+        for ip_intf in ip_interfaces:
             self._ip_interfaces.append(ip_intf)
             logging.info('%s : Added interface: %s', self, str(ip_intf))
 
@@ -107,91 +156,207 @@ class NetNode(object):
         self._address_details.clear()
         self._address_details.extend(addr_data)
 
+    @staticmethod
+    def check_adapter_stats(adapter_stats):
+        """Raise ValueError if uploaded adapter stats are malformed"""
+
+        for adapter_stat in adapter_stats:
+            if (not isinstance(adapter_stat, dict) or
+                    not isinstance(adapter_stat.get('name'), str) or
+                    not isinstance(adapter_stat.get('stats'), dict)):
+                raise ValueError('Adapter stats need name and stats')
+
+            # Counters are kept as uint64
+            for name in AdapterStatsRing.counter_names:
+                value = adapter_stat['stats'].get(name, 0)
+                if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value < 2**64:
+                    raise ValueError('Counter {} of {} is not a 64 bit unsigned integer'.format(
+                        name, adapter_stat['name']))
+
+    @staticmethod
+    def parse_adapter_stats(adapter_stats):
+        """Get (adapter names, counters) of uploaded adapter stats as taken by
+        update_adapter_counters(). Raises ValueError if they are malformed"""
+
+        NetNode.check_adapter_stats(adapter_stats)
+        return counters_from_stats(adapter_stats)
+
     def update_adapter_stats(self, adapter_stats):
         """Append latest counters"""
 
         # Add stats with timestamp
-        self._adapter_stats.append((time.time(), adapter_stats))
+        self._stats_time = time.time()
+
+        for adapter_stat in adapter_stats:
+            ring = self._get_adapter_stats_ring(adapter_stat['name'])
+            ring.append(self._stats_time, adapter_stat['stats'])
+
+        self._forget_adapters_except(adapter_stat['name'] for adapter_stat in adapter_stats)
+
+    def update_adapter_counters(self, adapter_names, counters):
+        """Append latest counters given with a row per adapter
+        and AdapterStatsRing.counter_names columns"""
+
+        # Add stats with timestamp
+        self._stats_time = time.time()
+
+        for (adapter_name, adapter_counters) in zip(adapter_names, counters):
+            ring = self._get_adapter_stats_ring(adapter_name)
+            ring.append_counters(self._stats_time, adapter_counters)
+
+        self._forget_adapters_except(adapter_names)
+
+    def _get_adapter_stats_ring(self, adapter_name):
+        """Get stats history of the adapter, creating it if needed"""
 
-    def update_routing_table(self, rt_data):
-        """Update Routing table data"""
+        ring = self._adapter_stats.get(adapter_name)
+        if ring is None:
+            ring = AdapterStatsRing(self.stats_history)
+            self._adapter_stats[adapter_name] = ring
+
+        return ring
+
+    def _forget_adapters_except(self, adapter_names):
+        """Loads need two consecutive samples, forget adapters missing in the latest one"""
+
+        uploaded = set(adapter_names)
+        for adapter_name in list(self._adapter_stats):
+            if adapter_name not in uploaded:
+                del self._adapter_stats[adapter_name]
+
+    def update_routing_table(self, rt_data, fib=None):
+        """Update Routing table data. fib is compile_fib(rt_data) if it is
+        already known. Returns True if routing table changed"""
 
         assert self.type == 'router'
+
+        # Routers re-send the same table each time, do not recompile it
+        if rt_data == self._rt:
+            return False
+
+        # Compile first, so that malformed table changes nothing
+        if fib is None:
+            fib = NetNode.compile_fib(rt_data)
+
         self._rt = rt_data
+        self._rt_hash = get_routes_hash(rt_data)
+        (self._fib, self._fib_default, self._fib_prefixes) = fib
+        self._rt_version += 1
 
-    def update_quagga_routing_table(self, qrt_data):
-        """Update Quagga RT"""
+        return True
+
+    @staticmethod
+    def compile_fib(rt_data):
+        """Compile routing table lines to prefix trie used by the LPM.
+        Returns (trie, default route, all prefixes). Raises ValueError,
+        KeyError or TypeError if routing table is malformed"""
+
+        fib = PrefixTrie()
+        fib_default = None
+        fib_prefixes = set()
+
+        # Lines are ranked by metric, then canonically, so that the
+        # result does not depend on the order lines were uploaded in
+        ranked_lines = sorted(rt_data, key=lambda line: (line.get('metric', 0), get_route_key(line)))
+
+        for line in ranked_lines:
+            # TODO: change from str interpolation to ctor with (str,str) in Py3.6
+            network = ipaddress.ip_network('{}/{}'.format(line['destination'], line['mask']))
+            fib_prefixes.add(network)
+
+            # If there are a few lines with the same prefix - the best ranked one is used
+            fib.insert(network, (line['ifname'], line['gateway']))
+
+            # The best ranked line using gateway is default route
+            if fib_default is None and 'G' in line['flags']:
+                fib_default = (line['ifname'], line['gateway'])
+
+        return (fib, fib_default, frozenset(fib_prefixes))
+
+    def update_quagga_routing_table(self, qrt_data, ospf_rd=None):
+        """Update Quagga RT. ospf_rd is compile_ospf_rd(qrt_data) if it is
+        already known. Returns True if Quagga RT changed"""
 
         assert self.type == 'router'
+
+        if qrt_data == self._qrt:
+            return False
+
+        # Compile first, so that malformed table changes nothing
+        if ospf_rd is None:
+            ospf_rd = NetNode.compile_ospf_rd(qrt_data)
+
         self._qrt = qrt_data
+        self._qrt_hash = get_routes_hash(qrt_data)
+        self._ospf_rd = ospf_rd
 
-    def get_adapter_tx_load(self, adapter_name: str) -> int:
-        """Get TX load in bps of given adapter"""
-        
-        # Do we have any measurements?
-        num_samples = len(self._adapter_stats)
-        if num_samples < 2:
-            return None
+        return True
 
-        (time_1, stats_1) = self._adapter_stats[-1]
-        (time_2, stats_2) = self._adapter_stats[-2]
-        
-        adapter_stat_1 = None
-        adapter_stat_2 = None
+    @staticmethod
+    def compile_ospf_rd(qrt_data):
+        """Compile OSPF lines of Quagga RT to prefix trie holding min RD of each subnet.
+        Raises ValueError, KeyError or TypeError if Quagga RT is malformed"""
 
-        for adapter_stat in stats_1:
-            if adapter_stat['name'] == adapter_name:
-                adapter_stat_1 = adapter_stat['stats']
+        subnet_rd = {}
+        for route_line in qrt_data:
+            if route_line['protocol'] != 'O' or route_line['RD'] is None:
+                continue
 
-        for adapter_stat in stats_2:
-            if adapter_stat['name'] == adapter_name:
-                adapter_stat_2 = adapter_stat['stats']
+            subnet = ipaddress.ip_network(route_line['subnet'])
+            rd_min = subnet_rd.get(subnet)
+            if rd_min is None or route_line['RD'] < rd_min:
+                subnet_rd[subnet] = route_line['RD']
 
-        if adapter_stat_1 is None or adapter_stat_2 is None:
-            logging.warning('Did not find adapter %s in node %s', adapter_name, self.name)
-            return None
+        ospf_rd = PrefixTrie()
+        for subnet, rd_min in subnet_rd.items():
+            ospf_rd.insert(subnet, rd_min)
 
-        # x_1 > x_2
-        delta_t = time_1 - time_2
-        delta_d = (adapter_stat_1['tx_bytes'] - adapter_stat_2['tx_bytes']) * 8
+        return ospf_rd
 
-        assert delta_t != 0
+    def get_ospf_distances(self, destinations):
+        """Get min OSPF RD of all subnets containing each of the given
+        IP addresses. Returns list of RDs (or None) in the same order"""
 
-        return delta_d/delta_t
+        assert self._type == 'router'
+        if self._ospf_rd is None:
+            return [None] * len(destinations)
 
-    def get_adapter_rx_load(self, adapter: str) -> int:
-        """Get RX load in bps of given adapter"""
-        
-        # Do we have any measurements?
-        num_samples = len(self._adapter_stats)
-        if num_samples < 2:
-            return None
+        distances = []
+        for destination in destinations:
+            distances.append(min(self._ospf_rd.matches(destination), default=None))
 
-        (time_1, stats_1) = self._adapter_stats[-1]
-        (time_2, stats_2) = self._adapter_stats[-2]
-        
-        adapter_stat_1 = None
-        adapter_stat_2 = None
+        return distances
 
-        for adapter_stat in stats_1:
-            if adapter_stat['name'] == adapter:
-                adapter_stat_1 = adapter_stat['stats']
+    def get_adapter_tx_load(self, adapter_name: str, estimator='last') -> int:
+        """Get TX load in bps of given adapter"""
 
-        for adapter_stat in stats_2:
-            if adapter_stat['name'] == adapter:
-                adapter_stat_2 = adapter_stat['stats']
+        tx_rate = self._get_adapter_rate(adapter_name, 'tx_bytes', estimator)
+        if tx_rate is None:
+            return None
 
-        if adapter_stat_1 is None or adapter_stat_2 is None:
-            logging.warning('Did not find adapter %s in node %s', adapter_name, self.name)
+        return tx_rate * 8
+
+    def get_adapter_rx_load(self, adapter: str, estimator='last') -> int:
+        """Get RX load in bps of given adapter"""
+
+        rx_rate = self._get_adapter_rate(adapter, 'rx_bytes', estimator)
+        if rx_rate is None:
             return None
 
-        # x_1 > x_2
-        delta_t = time_1 - time_2
-        delta_d = (adapter_stat_1['rx_bytes'] - adapter_stat_2['rx_bytes']) * 8
+        return int(rx_rate * 8)
+
+    def _get_adapter_rate(self, adapter_name, counter_name, estimator):
+        """Get per second change of the adapter's counter or None.
+        Estimator is one of adapterstats.LOAD_ESTIMATORS"""
 
-        assert delta_t != 0
+        # Do we have any measurements?
+        ring = self._adapter_stats.get(adapter_name)
+        if ring is None:
+            if self._stats_time is not None:
+                logging.warning('Did not find adapter %s in node %s', adapter_name, self.name)
+            return None
 
-        return int(delta_d/delta_t)
+        return ring.get_rate(counter_name, estimator)
 
     def rt_longest_prefix_match(self, destination_ip, return_default=False):
         """Perform LPM based on destination and return (intf, gw) 
@@ -199,33 +364,20 @@ class NetNode(object):
         (if present)."""
 
         assert self._type == 'router'
-        if self._rt is None:
+        if self._fib is None:
             return None
 
         # Match route lines
-        # TODO: change from str interpolation to ctor with (str,str) in Py3.6
-        rt_lines = [line for line in self._rt 
-                    if destination_ip in ipaddress.ip_network('{}/{}'.format(
-                        line['destination'], line['mask']))]
-       
-        if any(rt_lines):
-            lpm_line = max(rt_lines, key=lambda x: 
-                           ipaddress
-                            .ip_network('{}/{}'.format(
-                                x['destination'], x['mask']))
-                            .prefixlen)
-
-            return (lpm_line['ifname'], lpm_line['gateway'])
+        lpm_route = self._fib.longest_match(destination_ip)
+
+        if lpm_route is not None:
+            return lpm_route
         elif not return_default:
             # Do not return default 
             return None
         else:
             # Try to return default
-            def_route = [rt_line for rt_line in self._rt if 'G' in rt_line['flags']]
-            if any(def_route):
-                return def_route[0]
-            else:
-                return None
+            return self._fib_default
 
     def __eq__(self, other):
         """Implement equality comparer"""
@@ -21,16 +21,21 @@ Classes related to network topology capture and representation.
 """
 import ipaddress
 import hashlib
+import json
 import logging
+import threading
 
 from networkx import nx
 from altoserver.netnode import NetNode
+from altoserver.prefixtrie import PrefixTrie
+from altoserver.prefixintervals import PrefixIntervals
 from altoserver.corenetdata import CoreNetData
 
 class NetworkMap(object):
     """Holder of network topology"""
 
     cap = {}
+    path_cache_size = 65536     # Max number of traced paths kept
 
     def __init__(self):
         """Initialize the network topology"""
@@ -38,20 +43,200 @@ class NetworkMap(object):
         # Topology as MultiDiGraph (MultiDi - Since each link is two unidirectional edges)
         self._topo = nx.MultiDiGraph()
         self._net_pids = {}             # Pin_Name -> Pid object
+        self._devices = {}              # Device name -> NetNode object
+        self._dev_ips = {}              # IP address -> [NetNode object] in order of indexing
+        self._pid_trie = PrefixTrie()   # IP prefix -> Pid name (LPM lookups)
+        self._pid_intervals = None      # PrefixIntervals of the PID trie (None - needs rebuild)
         self._topo_version = 0          # Each topology change should change the version number
+        self._addr_version = 0          # Each change of device addresses should change the version number
+        self._rt_version = 0            # Each change of any routing table should change the version number
+        self._stats_version = 0         # Each upload of adapter stats should change the version number
+        self._path_cache = {}           # (Device name, Destination IP) -> (path, versions, error)
+        self._listeners = []            # Callables notified about network state changes
+        self._map_tag = None            # VTAG of the map and the version it was computed for
+        self._map_tag_version = None
+
+        # Held while changing the network state from uploads and while
+        # computing results which must not see half applied uploads
+        self.lock = threading.RLock()
         
         self.core_data = CoreNetData()
         self.core_data.load_data(r'/tmp/netdata.json')
         #self.core_data.load_data(r'C:\PyPPSPP\netdata.json')
 
+    @property
+    def topo_version(self):
+        """Get version of the topology (devices and PIDs)"""
+        return self._topo_version
+
+    @property
+    def addr_version(self):
+        """Get version of the device addresses"""
+        return self._addr_version
+
+    @property
+    def rt_version(self):
+        """Get version of routing tables (kernel and Quagga) of all routers"""
+        return self._rt_version
+
+    @property
+    def stats_version(self):
+        """Get version of adapter stats of all devices"""
+        return self._stats_version
+
+    def get_devices(self):
+        """Get all devices in the topology"""
+        return self._devices.values()
+
     def get_out_edges(self, node):
         """Get node's out edges list"""
         return self._topo.out_edges([node], False, True)
 
+    def get_link_capacity(self, node_a, node_b):
+        """Get capacity of the link from node_a to node_b or None"""
+
+        links = self._topo.get_edge_data(node_a, node_b)
+        if not links:
+            return None
+
+        # Parallel links are not used, take the first one
+        return next(iter(links.values())).get('capacity')
+
     def get_in_edges(self, node):
         """Get node's in edges list"""
         return self._topo.in_edges([node], False, True)
         
+    def add_device(self, device: NetNode):
+        """Add a device to the topology. Device with the same name is replaced,
+        links of the old device are kept and connected to the new one"""
+
+        # Graph would keep the old object as the node key, so the old node
+        # is removed and its links are re-added to the new object
+        links = []
+        old_device = self._devices.pop(device.name, None)
+        if old_device is not None:
+            links.extend(self.get_out_edges(old_device))
+            links.extend((node_a, node_b, params)
+                         for (node_a, node_b, params) in self.get_in_edges(old_device)
+                         if node_a != old_device)   # Self loops are out edges too
+            self._unindex_device_ips(old_device)
+            self._topo.remove_node(old_device)
+
+        self._topo.add_node(device)
+        for (node_a, node_b, params) in links:
+            self._topo.add_edge(
+                device if node_a == old_device else node_a,
+                device if node_b == old_device else node_b,
+                **params)
+
+        self._devices[device.name] = device
+        self._index_device_ips(device)
+        self._topo_version += 1
+        self._notify_listeners('topology', device)
+
+    def remove_device(self, dev_name: str):
+        """Remove device and all its links from the topology"""
+
+        device = self._devices.pop(dev_name, None)
+        if device is None:
+            return
+
+        self._unindex_device_ips(device)
+        self._topo.remove_node(device)
+        self._topo_version += 1
+        self._notify_listeners('topology', device)
+
+    def update_device_addresses(self, device: NetNode, addr_data, ip_interfaces=None):
+        """Replace addresses of the given device keeping IP index in sync.
+        ip_interfaces are parsed addr_data if they are already known"""
+
+        # Parse before touching the index, so that malformed data changes nothing
+        if ip_interfaces is None:
+            ip_interfaces = NetNode.parse_interface_addresses(addr_data)
+
+        old_ips = list(device.ip_interfaces)
+
+        self._unindex_device_ips(device)
+        device.update_interface_addresses(addr_data, ip_interfaces)
+        self._index_device_ips(device)
+
+        if old_ips != device.ip_interfaces:
+            self._addr_version += 1
+            self._notify_listeners('addresses', device)
+
+    def update_device_routing_table(self, device: NetNode, rt_data, fib=None):
+        """Update routing table of the given router"""
+
+        if device.update_routing_table(rt_data, fib):
+            self._rt_version += 1
+            self._notify_listeners('routes', device)
+
+    def update_device_quagga_routing_table(self, device: NetNode, qrt_data, ospf_rd=None):
+        """Update Quagga routing table of the given router"""
+
+        if device.update_quagga_routing_table(qrt_data, ospf_rd):
+            self._rt_version += 1
+            self._notify_listeners('quagga_routes', device)
+
+    def update_device_adapter_stats(self, device: NetNode, adapter_stats):
+        """Add adapter stats of the given device"""
+
+        device.update_adapter_stats(adapter_stats)
+        self._stats_version += 1
+        self._notify_listeners('stats', device)
+
+    def update_device_adapter_counters(self, device: NetNode, adapter_names, counters):
+        """Add adapter counters of the given device decoded from packed upload"""
+
+        device.update_adapter_counters(adapter_names, counters)
+        self._stats_version += 1
+        self._notify_listeners('stats', device)
+
+    def update_devices_adapter_stats(self, device_stats):
+        """Add adapter stats of many devices as one change of the stats.
+        device_stats -> [(device, adapter stats list or (adapter names, counters))]"""
+
+        for (device, adapter_stats) in device_stats:
+            if isinstance(adapter_stats, tuple):
+                device.update_adapter_counters(*adapter_stats)
+            else:
+                device.update_adapter_stats(adapter_stats)
+
+        self._stats_version += 1
+        self._notify_listeners('stats', None)
+
+    def add_listener(self, callback):
+        """Register callable(event, device) called on each change of the network state.
+        Event is one of: topology, addresses, routes, quagga_routes, stats, pids.
+        Device is None if the change is not related to a single device"""
+        self._listeners.append(callback)
+
+    def _notify_listeners(self, event, device):
+        """Inform listeners about a change of the network state"""
+        for callback in self._listeners:
+            callback(event, device)
+
+    def _index_device_ips(self, device: NetNode):
+        """Add device's addresses to IP index. First device with the IP wins
+        lookups, others are kept as owners in case the first one goes away"""
+
+        for ip_inf in device.ip_interfaces:
+            owners = self._dev_ips.setdefault(ip_inf.ip, [])
+            if not any(owner is device for owner in owners):
+                owners.append(device)
+
+    def _unindex_device_ips(self, device: NetNode):
+        """Remove device's addresses from the IP index"""
+
+        for ip_inf in device.ip_interfaces:
+            owners = self._dev_ips.get(ip_inf.ip)
+            if owners is None:
+                continue
+
+            owners[:] = [owner for owner in owners if owner is not device]
+            if not owners:
+                del self._dev_ips[ip_inf.ip]
+
     def add_pid_to_topology(self, name, ip_prefixes):
         """Add a PID to topology. ip_prefixes -> [IPv4/v6Network]"""
 
@@ -61,7 +246,34 @@ class NetworkMap(object):
             return False
 
         # This overwrites old value
+        replaced = new_pid.name in self._net_pids
         self._net_pids[new_pid.name] = new_pid
+        self._topo_version += 1
+
+        # Old prefixes must be dropped from the trie, else just add new ones
+        if replaced:
+            self._build_pid_trie()
+        else:
+            self._add_pid_to_trie(new_pid)
+        self._pid_intervals = None
+
+        self._notify_listeners('pids', None)
+
+    def _build_pid_trie(self):
+        """Compile prefix trie from all PIDs"""
+
+        self._pid_trie = PrefixTrie()
+        for pid in self._net_pids.values():
+            self._add_pid_to_trie(pid)
+
+    def _add_pid_to_trie(self, pid):
+        """Add prefixes of the given PID to the trie. If the same prefix is in
+        a few PIDs, the PID added first is used"""
+
+        for prefix in pid.ipv4_prefixes:
+            self._pid_trie.insert(prefix, pid.name)
+        for prefix in pid.ipv6_prefixes:
+            self._pid_trie.insert(prefix, pid.name)
 
     def init_small_topo(self):
         """Create a simple small topology"""
@@ -74,7 +286,7 @@ class NetworkMap(object):
         }
 
         core = NetNode('core-0', 'router')
-        self._topo.add_node(core)
+        self.add_device(core)
         self.add_pid_to_topology('core-dc', [
             ipaddress.ip_network('192.168.240.0/24'),
             ipaddress.ip_network('192.168.245.0/24')
@@ -86,7 +298,7 @@ class NetworkMap(object):
             [ipaddress.ip_interface('192.168.245.2/30')],
             core.name
         )
-        self._topo.add_node(src)
+        self.add_device(src)
         
 
         global_adslam_index = 0
@@ -95,7 +307,7 @@ class NetworkMap(object):
         for brasid in range(3):
             bras_name = 'bras-{}'.format(brasid)
             bras = NetNode(bras_name, 'router')
-            self._topo.add_node(bras)
+            self.add_device(bras)
 
             for adslamid in range(2):
                 # Build IP range for ADSLAM
@@ -107,7 +319,7 @@ class NetworkMap(object):
 
                 # Add ADSLAM Object
                 adslam = NetNode(adslam_name, 'adslam', [], bras_name)
-                self._topo.add_node(adslam)
+                self.add_device(adslam)
                 self._topo.add_edge(adslam, bras, capacity=self.cap['adslamlink'])
                 self._topo.add_edge(bras, adslam, capacity=self.cap['adslamlink'])
 
@@ -127,7 +339,7 @@ class NetworkMap(object):
                         ],
                         adslam_name
                     )
-                    self._topo.add_node(home)
+                    self.add_device(home)
                     self._topo.add_edge(home, adslam, capacity=self.cap['homelink'])
                     self._topo.add_edge(adslam, home, capacity=self.cap['homelink'])
 
@@ -165,7 +377,7 @@ class NetworkMap(object):
 
         # For use by dev machine
         core = NetNode('core-0', 'router')
-        self._topo.add_node(core)
+        self.add_device(core)
 
         src = NetNode(
             'src-0',
@@ -173,7 +385,7 @@ class NetworkMap(object):
             [ipaddress.ip_interface('192.168.245.2/30')],
             core.name
         )
-        self._topo.add_node(src)
+        self.add_device(src)
 
         # ADSLAM user's IPs are:
         # 192.168.<ADSLAM_ID>.<USER_ID+2>/24 (USER_ID=1 reserved for router)
@@ -188,7 +400,7 @@ class NetworkMap(object):
             # Build BRAS as connected infrastructure
             bras_name = 'bras-{}'.format(bras_id)
             bras = NetNode(bras_name, 'router')
-            self._topo.add_node(bras)
+            self.add_device(bras)
 
             for adslam_id in range(0, adslams_per_bras):
                 # Build IP range for ADSLAM
@@ -200,7 +412,7 @@ class NetworkMap(object):
 
                 # Add ADSLAM Object
                 adslam = NetNode(adslam_name, 'adslam', [], bras_name)
-                self._topo.add_node(adslam)
+                self.add_device(adslam)
                 self._topo.add_edge(adslam, bras, capacity=self.cap['adslamlink'])
                 self._topo.add_edge(bras, adslam, capacity=self.cap['adslamlink'])
 
@@ -220,7 +432,7 @@ class NetworkMap(object):
                         ],
                         adslam_name
                     )
-                    self._topo.add_node(home)
+                    self.add_device(home)
                     self._topo.add_edge(home, adslam, capacity=self.cap['homelink'])
                     self._topo.add_edge(adslam, home, capacity=self.cap['homelink'])
 
@@ -267,26 +479,28 @@ class NetworkMap(object):
     def get_pid_topology(self):
         """Return PID based topology data in form of (vtag, [AltoPID])"""
 
-        hasher = hashlib.sha256()
-        hasher.update(str(self._topo_version).encode('ascii'))
-
         return (self.get_map_meta(), self._net_pids.values())
 
     def get_map_tag(self):
         """Get tag of a map"""
-        hasher = hashlib.sha256()
-        hasher.update(str(self._topo_version).encode('ascii'))
 
-        return hasher.hexdigest()
+        # Tag is hash of PIDs content, compute it once per map version
+        if self._map_tag_version != self._topo_version:
+            hasher = hashlib.sha256()
+            for pid_name in sorted(self._net_pids):
+                pid_repr = self._net_pids[pid_name].get_json_repr()
+                hasher.update(json.dumps(pid_repr, sort_keys=True).encode('utf-8'))
+
+            self._map_tag = hasher.hexdigest()
+            self._map_tag_version = self._topo_version
+
+        return self._map_tag
 
     def get_map_meta(self):
         """Get VTAG of the map"""
 
-        hasher = hashlib.sha256()
-        hasher.update(str(self._topo_version).encode('ascii'))
-
         vtag = {
-            'tag': hasher.hexdigest(),
+            'tag': self.get_map_tag(),
             'resource-id': 'network-map'
         }
 
@@ -295,57 +509,47 @@ class NetworkMap(object):
     def get_device_by_name(self, dev_name: str) -> NetNode:
         """Get object representing device by name"""
 
-        # Try to get obj by name
-        for dev in self._topo:
-            if dev == dev_name:
-                return dev            
-
-        return None
+        return self._devices.get(dev_name)
 
     def get_pid_from_dev_name(self, dev_name: str) -> str:
         """Get the PID value from the given device name"""
         pass
 
+    def get_pid_endpoints(self):
+        """Get addresses of all devices grouped by PID: {PID name -> [IP address]}"""
+
+        ip_addresses = list(self._dev_ips)
+
+        pid_endpoints = {}
+        for (ip_address, pid_name) in zip(ip_addresses, self.get_pids_from_ips(ip_addresses)):
+            if pid_name is not None:
+                pid_endpoints.setdefault(pid_name, []).append(ip_address)
+
+        return pid_endpoints
+
     def get_pid_from_ip(self, ip_address) -> str:
         """Get the PID value from the given IP address"""
 
-        # Build candidates
-        candidates = []
-        for pid in self._net_pids.values():
-            if ip_address.version == 4:
-                for prefix in pid.ipv4_prefixes:
-                    if ip_address in prefix:
-                        candidates.append((prefix, pid))
-            elif ip_address.version == 6:
-                for prefix in pid.ipv6_prefixes:
-                    if ip_address in prefix:
-                        candidates.append((prefix, pid))
-            else:
-                raise Exception('The future is here')
+        # Name of PID having the longest prefix or None
+        return self._pid_trie.longest_match(ip_address)
 
-        # Did we find anything?
-        if not any(candidates):
-            return None
+    def get_pids_from_ips(self, ip_addresses):
+        """Get list of PID names (or None) of the given IP addresses"""
+
+        if self._pid_intervals is None:
+            self._pid_intervals = PrefixIntervals(self._pid_trie)
 
-        # Return name of candidate with longest prefix
-        (prefix, pid) = max(candidates, key=lambda x: x[0].prefixlen)
-        return pid.name
+        return self._pid_intervals.longest_matches(ip_addresses)
 
     def get_device_by_ip(self, ip_address) -> NetNode:
         """Get device from given IP address"""
 
         # Ensure we have sane parameters
         assert (isinstance(ip_address, ipaddress.IPv4Address) or
-                isinstance(ip_address, ipaddress.IPv4Address))
-
-        # Look for a device having required ip address
-        for device in self._topo:
-            for ip_inf in device.ip_interfaces:
-                if ip_inf.ip == ip_address:
-                    return device
+                isinstance(ip_address, ipaddress.IPv6Address))
 
-        # none found
-        return None
+        owners = self._dev_ips.get(ip_address)
+        return owners[0] if owners else None
 
     def get_upstream_router(self, device_name: str) -> str:
         """Returns first-hop upstream router. If given
@@ -364,6 +568,105 @@ class NetworkMap(object):
         else:
             return self.get_upstream_router(device.upstream)
 
+    def get_path(self, ip_a, ip_b):
+        """Get tuple of all devices in the path from ip_a to ip_b. Traced
+        paths (and failures to trace them) are cached until routing tables
+        of the routers on the path, device addresses or topology changes.
+        """
+
+        device_a = self.get_device_by_ip(ip_a)
+        if device_a is None:
+            raise LookupError('Failed to find device having IP {}'.format(str(ip_a)))
+
+        # Path depends on the source device and not the source IP
+        cache_key = (device_a.name, ip_b)
+        cached = self._path_cache.get(cache_key)
+        if cached is not None:
+            (path, versions, error) = cached
+            if self._trace_versions_valid(versions):
+                if path is None:
+                    raise LookupError(error)
+                return path
+
+        # Keep devices visited so far to know what state the failure depends on
+        visited = []
+        try:
+            for device in self.dev_to_dev_iterator(ip_a, ip_b):
+                visited.append(device)
+        except LookupError as exc:
+            self._cache_path(cache_key, None, self._get_trace_versions(visited), str(exc))
+            raise
+
+        path = tuple(visited)
+        self._cache_path(cache_key, path, self._get_trace_versions(path), None)
+
+        return path
+
+    def _cache_path(self, cache_key, path, versions, error):
+        """Save traced path or the trace error to the path cache"""
+
+        # Do not let the cache grow without limits
+        if len(self._path_cache) >= self.path_cache_size:
+            self._path_cache.clear()
+
+        self._path_cache[cache_key] = (path, versions, error)
+
+    def _get_trace_versions(self, devices):
+        """Get versions of the state used to trace path over given devices"""
+
+        rt_versions = tuple((dev, dev.rt_version) for dev in devices if dev.type == 'router')
+        return (self._topo_version, self._addr_version, rt_versions)
+
+    def _trace_versions_valid(self, versions):
+        """Check if the state used to trace the path did not change"""
+
+        (topo_version, addr_version, rt_versions) = versions
+        if topo_version != self._topo_version or addr_version != self._addr_version:
+            return False
+
+        for (dev, rt_version) in rt_versions:
+            if dev.rt_version != rt_version:
+                return False
+
+        return True
+
+    def get_router_next_hop(self, router: NetNode, ip_b) -> NetNode:
+        """Get the next device on the routed path from router to ip_b.
+        Raises LookupError if the next device can not be found.
+        """
+
+        # Inspect RT to find outgoing interface
+        rt_data = router.rt_longest_prefix_match(ip_b, True)
+        if rt_data is None:
+            raise LookupError('Router {} has not route to IP {}'.format(
+                router.name, str(ip_b)))
+
+        (router_intf, gw_str) = rt_data
+        if gw_str == '0.0.0.0':
+            # Next device is connected directly
+            next_data = self.core_data.get_remote_peer(router.name, router_intf)
+            if next_data is None:
+                raise LookupError('Failed to get device connected to {} interface {}'
+                                  .format(router.name, router_intf))
+
+            # Find next device
+            (next_hostname, next_intf) = next_data
+            next_dev = self.get_device_by_name(next_hostname)
+
+            # Check if it is found
+            if next_dev is None:
+                raise LookupError('Failed to find device with name {}'.format(next_hostname))
+        else:
+            # Get the gateway
+            gw_ip = ipaddress.ip_address(gw_str)
+            next_dev = self.get_device_by_ip(gw_ip)
+
+            # Check if it is found
+            if next_dev is None:
+                raise LookupError('Failed to find device with IP {}'.format(gw_str))
+
+        return next_dev
+
     def dev_to_dev_iterator(self, ip_a, ip_b):
         """Get iterator returning all intermediate devices in the path
         from ip_a to ip_b. First and final devices are also included.
@@ -386,7 +689,7 @@ class NetworkMap(object):
         if device_a == device_b:
             yield device_a
             yield device_b
-            raise StopIteration
+            return
 
         # Return first device
         yield device_a
@@ -403,13 +706,13 @@ class NetworkMap(object):
                     yield upst_dev
                     # did we finish?
                     if upst_dev == device_b:
-                        raise StopIteration
+                        return
                     else:
                         cur_device = upst_dev
                 else: # Going down
                     if cur_device == device_b:
-                        yield cur_device
-                        raise StopIteration
+                        # Already returned when stepping to it
+                        return
                     else:
                         raise LookupError('Going downstream but last user device is {} and not {}'
                                           .format(cur_device.name, device_b.name))
@@ -424,7 +727,7 @@ class NetworkMap(object):
                     yield upst_dev
                     # did we finish?
                     if upst_dev == device_b:
-                        raise StopIteration
+                        return
                     else:
                         cur_device = upst_dev
                 else:
@@ -432,7 +735,7 @@ class NetworkMap(object):
                     for (a_dev, b_dev, params) in self.get_out_edges(cur_device):
                         if b_dev == device_b:
                             yield b_dev
-                            raise StopIteration
+                            return
                     raise LookupError('Did not find target device attached to {}'.format(cur_device.name))
 
             elif cur_device.type == 'router':
@@ -443,51 +746,15 @@ class NetworkMap(object):
                 # Once router is found we are going "down"
                 going_up = False
                 
-                # Did we find the target?
+                # Did we find the target? It was returned when stepping to it
                 if cur_device == device_b:
-                    yield cur_device
-                    raise StopIteration
-
-                # Inspect RT to find outgoing interface
-                rt_data = cur_device.rt_longest_prefix_match(ip_b, True)
-                if rt_data is None:
-                    raise LookupError('Router {} has not route to IP {}'.format(
-                        cur_device.name, str(ip_b)))
-
-                (router_intf, gw_str) = rt_data
-                if gw_str == '0.0.0.0':
-                    # Next device is connected directly
-                    next_data = self.core_data.get_remote_peer(cur_device.name, router_intf)
-                    if next_data is None:
-                        raise LookupError('Failed to get device connected to {} interface {}'
-                                          .format(cur_device.name, router_intf))
-
-                    # Find next device
-                    (next_hostname, next_intf) = next_data
-                    next_dev = self.get_device_by_name(next_hostname)
-
-                    # Check if it is found
-                    if next_dev is None:
-                        raise LookupError('Failed to find device with name {}'.format(next_hostname))
-
-                    # Make gateway cur device
-                    yield next_dev
-                    ttl -= 1
-                    cur_device = next_dev
+                    return
 
-                else:
-                    # Get the gateway
-                    gw_ip = ipaddress.ip_address(gw_str)
-                    next_dev = self.get_device_by_ip(gw_ip)
-
-                    # Check if it is found
-                    if next_dev is None:
-                        raise LookupError('Failed to find device with IP {}'.format(gw_str))
-
-                    # Make gateway cur device
-                    yield next_dev
-                    ttl -= 1
-                    cur_device = next_dev
+                # Step to the next hop and continue from there
+                next_dev = self.get_router_next_hop(cur_device, ip_b)
+                yield next_dev
+                ttl -= 1
+                cur_device = next_dev
 
             else:
                 raise LookupError('Found device with unrecognized type {}'.format(cur_device.type))
@@ -0,0 +1,114 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+IP prefixes flattened to sorted disjoint address intervals, used to
+resolve many addresses at once (longest prefix match) with NumPy.
+"""
+import ipaddress
+
+import numpy
+
+class PrefixIntervals(object):
+    """Snapshot of a PrefixTrie as sorted interval start addresses, each
+    mapped to the value of the longest prefix covering the interval."""
+
+    def __init__(self, prefix_trie):
+        """Build intervals of all prefixes in the given trie"""
+
+        self._values = []       # Distinct values of the trie
+        self._value_index = {}  # Value -> index in self._values
+
+        prefixes = {4: [], 6: []}
+        for (prefix, _) in prefix_trie.items():
+            prefixes[prefix.version].append(prefix)
+
+        # Version -> (interval starts, value index per interval or -1)
+        self._families = {
+            4: self._build_intervals(prefix_trie, ipaddress.IPv4Address, prefixes[4]),
+            6: self._build_intervals(prefix_trie, ipaddress.IPv6Address, prefixes[6])
+        }
+
+    def longest_matches(self, ip_addresses):
+        """Return list of values of the longest prefixes containing
+        given IPv4/v6Addresses (or None) in the same order"""
+
+        results = [None] * len(ip_addresses)
+
+        for (version, (starts, indexes)) in self._families.items():
+            positions = [pos for (pos, ip_address) in enumerate(ip_addresses)
+                         if ip_address.version == version]
+            if not positions:
+                continue
+
+            addrs = numpy.array([int(ip_addresses[pos]) for pos in positions], dtype=starts.dtype)
+
+            # Interval starting at or before each address. First interval
+            # starts at 0, so every address falls into some interval.
+            found = indexes[numpy.searchsorted(starts, addrs, side='right') - 1]
+
+            for (pos, index) in zip(positions, found.tolist()):
+                if index >= 0:
+                    results[pos] = self._values[index]
+
+        return results
+
+    def _build_intervals(self, prefix_trie, address_cls, prefixes):
+        """Get (starts, value indexes) arrays of one address family"""
+
+        max_addr = (1 << address_cls(0).max_prefixlen) - 1
+
+        # The longest matching prefix can only change where a prefix starts or ends
+        bounds = {0}
+        for prefix in prefixes:
+            bounds.add(int(prefix.network_address))
+            end = int(prefix.broadcast_address) + 1
+            if end <= max_addr:
+                bounds.add(end)
+
+        starts = []
+        indexes = []
+        for bound in sorted(bounds):
+            value = prefix_trie.longest_match(address_cls(bound))
+            index = -1 if value is None else self._get_value_index(value)
+
+            # Merge with the previous interval if mapped to the same value
+            if indexes and indexes[-1] == index:
+                continue
+
+            starts.append(bound)
+            indexes.append(index)
+
+        # IPv6 addresses do not fit into fixed size integers
+        if address_cls is ipaddress.IPv4Address:
+            starts = numpy.array(starts, dtype=numpy.uint64)
+        else:
+            starts = numpy.array(starts, dtype=object)
+
+        return (starts, numpy.array(indexes, dtype=numpy.intp))
+
+    def _get_value_index(self, value):
+        """Get index of value in the value list, adding it if needed"""
+
+        index = self._value_index.get(value)
+        if index is None:
+            index = len(self._values)
+            self._values.append(value)
+            self._value_index[value] = index
+
+        return index
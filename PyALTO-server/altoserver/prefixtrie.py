@@ -0,0 +1,127 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Binary trie used for IP prefix lookups (longest prefix match).
+"""
+import ipaddress
+
+# Indexes in the trie node list: [zero_child, one_child, value]
+_ZERO = 0
+_ONE = 1
+_VALUE = 2
+
+# Marker of a node not holding any prefix
+_EMPTY = object()
+
+class PrefixTrie(object):
+    """Binary trie mapping IPv4/IPv6 prefixes to values.
+    Each address family is kept in a separate tree."""
+
+    def __init__(self):
+        """Initialize empty trie"""
+
+        self._roots = {
+            4: [None, None, _EMPTY],
+            6: [None, None, _EMPTY]
+        }
+        self._num_prefixes = 0
+
+    def insert(self, ip_prefix, value, replace=False):
+        """Add IPv4/v6Network to the trie. If prefix is already present
+        the old value is kept unless replace is set."""
+
+        node = self._roots[ip_prefix.version]
+        addr = int(ip_prefix.network_address)
+        shift = ip_prefix.max_prefixlen - 1
+
+        # Walk (and build) the path of the prefix bits
+        for _ in range(ip_prefix.prefixlen):
+            bit = (addr >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, _EMPTY]
+            node = node[bit]
+            shift -= 1
+
+        if node[_VALUE] is _EMPTY:
+            self._num_prefixes += 1
+        elif not replace:
+            return
+
+        node[_VALUE] = value
+
+    def longest_match(self, ip_address):
+        """Return value of the longest prefix containing
+        given IPv4/v6Address or None"""
+
+        node = self._roots[ip_address.version]
+        addr = int(ip_address)
+        shift = ip_address.max_prefixlen - 1
+        best = node[_VALUE]
+
+        while shift >= 0:
+            node = node[(addr >> shift) & 1]
+            if node is None:
+                break
+            if node[_VALUE] is not _EMPTY:
+                best = node[_VALUE]
+            shift -= 1
+
+        if best is _EMPTY:
+            return None
+
+        return best
+
+    def matches(self, ip_address):
+        """Iterate over values of all prefixes containing given
+        IPv4/v6Address, from the shortest to the longest prefix"""
+
+        node = self._roots[ip_address.version]
+        addr = int(ip_address)
+        shift = ip_address.max_prefixlen - 1
+
+        if node[_VALUE] is not _EMPTY:
+            yield node[_VALUE]
+
+        while shift >= 0:
+            node = node[(addr >> shift) & 1]
+            if node is None:
+                return
+            if node[_VALUE] is not _EMPTY:
+                yield node[_VALUE]
+            shift -= 1
+
+    def items(self):
+        """Iterate over (IPv4/v6Network, value) of all prefixes in the trie"""
+
+        for (version, network_cls) in ((4, ipaddress.IPv4Network), (6, ipaddress.IPv6Network)):
+            max_prefixlen = network_cls(0).max_prefixlen
+            nodes = [(self._roots[version], 0, 0)]
+
+            while nodes:
+                (node, addr, prefixlen) = nodes.pop()
+                if node[_VALUE] is not _EMPTY:
+                    network = network_cls((addr << (max_prefixlen - prefixlen), prefixlen))
+                    yield (network, node[_VALUE])
+
+                for bit in (_ZERO, _ONE):
+                    if node[bit] is not None:
+                        nodes.append((node[bit], (addr << 1) | bit, prefixlen + 1))
+
+    def __len__(self):
+        return self._num_prefixes
@@ -0,0 +1,79 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Delta encoded routing table uploads. Collectors send routes added and removed
+since the last acknowledged table: {'base': hash, 'hash': hash, 'add': [], 'remove': []}
+"""
+import collections
+import hashlib
+import json
+
+class RoutesDeltaConflict(Exception):
+    """Delta does not apply to the routes known by the server"""
+    pass
+
+def get_route_key(route):
+    """Get canonical textual representation of the route line"""
+    return json.dumps(route, sort_keys=True)
+
+def get_routes_hash(routes):
+    """Get hash of route lines not depending on their order"""
+
+    hasher = hashlib.sha256()
+    for route_key in sorted(get_route_key(route) for route in routes):
+        hasher.update(route_key.encode('utf-8'))
+        hasher.update(b'\n')
+
+    return hasher.hexdigest()
+
+def is_routes_delta(data):
+    """Check if uploaded routing data is a delta and not a full table"""
+    return isinstance(data, dict)
+
+def apply_routes_delta(routes, routes_hash, delta):
+    """Get new route lines by applying delta to routes having routes_hash.
+    Raises RoutesDeltaConflict if delta was made for other routes."""
+
+    if delta.get('base') != routes_hash:
+        raise RoutesDeltaConflict('Delta base {} does not match {}'.format(
+            delta.get('base'), routes_hash))
+
+    # Nothing changed since the last upload
+    if not delta.get('add') and not delta.get('remove'):
+        return routes
+
+    # Keep order of the remaining routes, new ones go last
+    to_remove = collections.Counter(get_route_key(route) for route in delta.get('remove', []))
+    new_routes = []
+    for route in routes:
+        route_key = get_route_key(route)
+        if to_remove[route_key] > 0:
+            to_remove[route_key] -= 1
+        else:
+            new_routes.append(route)
+
+    if any(to_remove.values()):
+        raise RoutesDeltaConflict('Removed routes are not in the table')
+
+    new_routes.extend(delta.get('add', []))
+
+    if get_routes_hash(new_routes) != delta.get('hash'):
+        raise RoutesDeltaConflict('Hash of the patched routes does not match')
+
+    return new_routes
@@ -0,0 +1,209 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Table of L3 (router) hop counts from routers to routed prefixes.
+"""
+import ipaddress
+import logging
+import threading
+
+from altoserver.prefixtrie import PrefixTrie
+
+class RouteHopsTable(object):
+    """Holds number of router hops from each router to each routed prefix.
+
+    Destinations are grouped by the longest prefix found in any of the routing
+    tables. All addresses of such prefix are routed the same way by every router,
+    hence the hop count is computed once per (router, prefix). Values are filled
+    on the first use and dropped when routing tables they were derived from change.
+    The table is guarded by its own lock, as it is filled by the request threads
+    and invalidated by the upload threads.
+    """
+
+    def __init__(self, network_map, max_hops=128):
+        """Initialize the table using given NetworkMap"""
+
+        self._nm = network_map
+        self._max_hops = max_hops
+        self._lock = threading.RLock()
+
+        self._hops = {}             # (Router name, prefix) -> hops or None
+        self._next_key = {}         # (Router name, prefix) -> key of the next router
+        self._prev_keys = {}        # (Router name, prefix) -> keys using it as the next router
+        self._router_keys = {}      # Router name -> keys computed from its routing table
+
+        self._router_prefixes = None # Router name -> set of routed prefixes
+        self._prefix_refs = {}      # Prefix -> number of routers having it
+        self._prefixes = None       # PrefixTrie of all routed prefixes (None - needs rebuild)
+
+        network_map.add_listener(self._on_network_change)
+
+    def get_hops(self, router, destination):
+        """Get number of L3 hops from router to destination IP or None"""
+
+        with self._lock:
+            if self._router_prefixes is None:
+                self._load_routers()
+
+            prefix = self._get_routed_prefix(destination)
+            if prefix is None:
+                logging.warning('No router has a route to %s', destination)
+                return None
+
+            key = (router.name, prefix)
+            if key in self._hops:
+                return self._hops[key]
+
+            return self._compute_hops(router, prefix, destination)
+
+    def _compute_hops(self, router, prefix, destination):
+        """Follow gateways from router until connected network or
+        already known router is found, saving hops of all routers"""
+
+        chain = []
+        tail_key = None
+        tail_hops = None
+        cur_rtr = router
+
+        while True:
+            key = (cur_rtr.name, prefix)
+            if key in self._hops:
+                # Rest of the path is already known
+                tail_key = key
+                tail_hops = self._hops[key]
+                break
+
+            if len(chain) == self._max_hops:
+                logging.warning('TTL expired while tracing from %s to %s',
+                                router.name, str(destination))
+                break
+
+            chain.append(cur_rtr)
+
+            route = cur_rtr.rt_longest_prefix_match(destination)
+            if route is None:
+                logging.warning('Did not find route to %s in rtr %s',
+                                destination, cur_rtr.name)
+                break
+
+            (_, gw_str) = route
+            if gw_str == '0.0.0.0':
+                # Destination connected directly
+                tail_hops = -1
+                break
+
+            # Get the GW router
+            next_rtr = self._nm.get_device_by_ip(ipaddress.ip_address(gw_str))
+            if next_rtr is None or next_rtr.type != 'router':
+                logging.warning('Did not find router with IP: %s', gw_str)
+                break
+
+            if next_rtr in chain:
+                logging.warning('Routing loop at %s while tracing to %s',
+                                next_rtr.name, str(destination))
+                break
+
+            cur_rtr = next_rtr
+
+        # Save hops of all routers walked, the last one is closest to destination
+        for index, chain_rtr in enumerate(reversed(chain)):
+            key = (chain_rtr.name, prefix)
+            if tail_hops is None:
+                self._hops[key] = None
+            else:
+                self._hops[key] = tail_hops + index + 1
+
+            self._router_keys.setdefault(chain_rtr.name, set()).add(key)
+            if tail_key is not None:
+                self._next_key[key] = tail_key
+                self._prev_keys.setdefault(tail_key, set()).add(key)
+            tail_key = key
+
+        return self._hops[(router.name, prefix)]
+
+    def _get_routed_prefix(self, destination):
+        """Get the longest routed prefix containing destination"""
+
+        if self._prefixes is None:
+            self._prefixes = PrefixTrie()
+            for prefix in self._prefix_refs:
+                self._prefixes.insert(prefix, prefix)
+
+        return self._prefixes.longest_match(destination)
+
+    def _load_routers(self):
+        """Collect routed prefixes of all routers in the map"""
+
+        self._router_prefixes = {}
+        for device in self._nm.get_devices():
+            if device.type == 'router':
+                self._update_router_prefixes(device)
+
+    def _update_router_prefixes(self, router):
+        """Update set of routed prefixes with ones of the given router"""
+
+        old_prefixes = self._router_prefixes.get(router.name, frozenset())
+        new_prefixes = router.routed_prefixes
+        if old_prefixes == new_prefixes:
+            return
+
+        for prefix in old_prefixes - new_prefixes:
+            self._prefix_refs[prefix] -= 1
+            if self._prefix_refs[prefix] == 0:
+                del self._prefix_refs[prefix]
+
+        for prefix in new_prefixes - old_prefixes:
+            self._prefix_refs[prefix] = self._prefix_refs.get(prefix, 0) + 1
+
+        self._router_prefixes[router.name] = new_prefixes
+        self._prefixes = None
+
+    def _drop_key(self, key):
+        """Drop saved hops and all hops derived from it"""
+
+        self._hops.pop(key, None)
+
+        next_key = self._next_key.pop(key, None)
+        if next_key is not None and next_key in self._prev_keys:
+            self._prev_keys[next_key].discard(key)
+
+        for prev_key in self._prev_keys.pop(key, set()):
+            self._drop_key(prev_key)
+
+    def _on_network_change(self, event, device):
+        """Invalidate the parts of the table affected by the change"""
+
+        with self._lock:
+            if self._router_prefixes is None:
+                return
+
+            if event == 'routes':
+                # Only hops derived from this router are affected
+                for key in self._router_keys.pop(device.name, set()):
+                    self._drop_key(key)
+                self._update_router_prefixes(device)
+            elif event in ('topology', 'addresses'):
+                # Gateways might resolve to other routers, start over
+                self._hops.clear()
+                self._next_key.clear()
+                self._prev_keys.clear()
+                self._router_keys.clear()
+                self._router_prefixes = None
+                self._prefix_refs.clear()
+                self._prefixes = None
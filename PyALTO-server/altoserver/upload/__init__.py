@@ -20,14 +20,94 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 Flask blueprint implementing RESTful web interface
 used to upload various network parameters.
 """
+import base64
 import logging
 import json
 
 from flask import Blueprint, request, Response, abort
 from altoserver import nm
+from altoserver.netnode import NetNode
+from altoserver.routedelta import RoutesDeltaConflict, apply_routes_delta, is_routes_delta
+from altoserver.adapterstats import PACKED_STATS_MIMETYPE, decode_packed_stats
 
 netupload = Blueprint('netupload', __name__)
 
+def _get_adapter_addresses(addr_data):
+    """Get address lines of all adapters"""
+
+    addresses = []
+    for lines in addr_data.values():
+        addresses.extend(lines)
+
+    return addresses
+
+# Routing data which can be uploaded as delta -> getter of (routes, hash) known for node
+_ROUTES_STATE = {
+    'rtable': lambda node: (node.routing_table, node.routing_table_hash),
+    'quagga_rt': lambda node: (node.quagga_routing_table, node.quagga_routing_table_hash)
+}
+
+def _resolve_routes(node, data_type, data):
+    """Get full routes from uploaded full table or delta.
+    Raises RoutesDeltaConflict if delta does not apply"""
+
+    if not is_routes_delta(data):
+        return data
+
+    (routes, routes_hash) = _ROUTES_STATE[data_type](node)
+    return apply_routes_delta(routes, routes_hash, data)
+
+def _resync_response(resync):
+    """Ask to upload full tables of {device_name -> [data type]}"""
+
+    resp = Response(
+        response=json.dumps({'error':'resync', 'resync':resync}),
+        mimetype='application/json'
+    )
+    resp.status_code = 409
+    return resp
+
+def _stage_adapter_addr(node, addr_data):
+    """Get update_device_addresses() arguments of the uploaded addresses"""
+
+    addresses = _get_adapter_addresses(addr_data)
+    return (addresses, NetNode.parse_interface_addresses(addresses))
+
+def _stage_routing_table(node, routes):
+    """Get update_device_routing_table() arguments of the uploaded routes"""
+
+    return (routes, None if routes == node.routing_table else NetNode.compile_fib(routes))
+
+def _stage_quagga_rt(node, routes):
+    """Get update_device_quagga_routing_table() arguments of the uploaded routes"""
+
+    return (routes, None if routes == node.quagga_routing_table else NetNode.compile_ospf_rd(routes))
+
+def _stage_adapter_stats(node, adapter_stats):
+    """Get (adapter names, counters) of the uploaded adapter stats"""
+    return NetNode.parse_adapter_stats(adapter_stats)
+
+def _stage_adapter_stats_packed(node, packed_stats):
+    """Get (adapter names, counters) of base64 encoded packed adapter stats"""
+    return decode_packed_stats(base64.b64decode(packed_stats, validate=True))
+
+# Data types accepted in the batch upload, in the order they are applied.
+# Addresses go first as routes are resolved using them. Stagers check and
+# compile the data without changing the network state and raise ValueError,
+# KeyError or TypeError if it is malformed.
+_BATCH_UPDATERS = (
+    ('adapter_addr', dict, _stage_adapter_addr, nm.update_device_addresses),
+    ('rtable', (list, dict), _stage_routing_table, nm.update_device_routing_table),
+    ('quagga_rt', (list, dict), _stage_quagga_rt, nm.update_device_quagga_routing_table),
+)
+
+# Adapter stats are sent either as JSON or as base64 encoded body of
+# PACKED_STATS_MIMETYPE. Stats of all devices are applied as one change.
+_BATCH_STATS_STAGERS = (
+    ('adapter_stats', list, _stage_adapter_stats),
+    ('adapter_stats_packed', str, _stage_adapter_stats_packed),
+)
+
 @netupload.route('/<device_name>/adapter_addr', methods=['GET', 'POST'])
 def upload_device_adapter_addr(device_name):
     """Process the incomming request with adapter(s) addresses"""
@@ -50,12 +130,15 @@ def upload_device_adapter_addr(device_name):
     if node is None:
         abort(400)
 
-    # Merge all addresses of all adapters
-    addresses = []
-    for lines in request.json.values():
-        addresses.extend(lines)
+    # Parse all addresses before the old ones are replaced
+    try:
+        (addresses, ip_interfaces) = _stage_adapter_addr(node, request.json)
+    except (ValueError, KeyError, TypeError, AttributeError) as exc:
+        logging.info('Bad adapter addresses from %s: %s', device_name, exc)
+        abort(400)
 
-    node.update_interface_addresses(addresses)
+    with nm.lock:
+        nm.update_device_addresses(node, addresses, ip_interfaces)
 
     # Processed fine
     return ('', 204)
@@ -74,7 +157,9 @@ def upload_device_adapter_stats(device_name):
         resp.status_code = 405
         return resp
 
-    if not request.is_json:
+    # Stats are uploaded either as JSON or in compact binary format
+    packed = request.mimetype == PACKED_STATS_MIMETYPE
+    if not packed and not request.is_json:
         abort(400)
 
     # Check if we have a node with given name
@@ -82,8 +167,19 @@ def upload_device_adapter_stats(device_name):
     if node is None:
         abort(400)
 
-    # Add stats to stats deque
-    node.update_adapter_stats(request.json)
+    # Check all stats before the first one is added
+    try:
+        if packed:
+            (adapter_names, counters) = decode_packed_stats(request.get_data())
+        else:
+            (adapter_names, counters) = _stage_adapter_stats(node, request.json)
+    except (ValueError, KeyError, TypeError, AttributeError) as exc:
+        logging.info('Bad adapter stats from %s: %s', device_name, exc)
+        abort(400)
+
+    # Add stats to stats history
+    with nm.lock:
+        nm.update_device_adapter_counters(node, adapter_names, counters)
 
     # Processed fine
     return ('', 204)
@@ -106,13 +202,24 @@ def upload_device_routing_table(device_name):
     if not request.is_json:
         abort(400)
 
-    # Check if we have a node with given name
+    # Check if we have a router with given name
     node = nm.get_device_by_name(device_name)
-    if node is None:
+    if node is None or node.type != 'router':
         abort(400)
 
-    # Add stats to stats deque
-    node.update_routing_table(request.json)
+    # Replace the routing table, compiled before the old one is dropped
+    with nm.lock:
+        try:
+            routes = _resolve_routes(node, 'rtable', request.json)
+            (routes, fib) = _stage_routing_table(node, routes)
+        except RoutesDeltaConflict as exc:
+            logging.info('Routing table delta of %s rejected: %s', device_name, exc)
+            return _resync_response({device_name: ['rtable']})
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            logging.info('Bad routing table from %s: %s', device_name, exc)
+            abort(400)
+
+        nm.update_device_routing_table(node, routes, fib)
 
     # Processed fine
     return ('', 204)
@@ -134,13 +241,117 @@ def upload_quagga_routing_table(device_name):
     if not request.is_json:
         abort(400)
 
-    # Check if we have a node with given name
+    # Check if we have a router with given name
     node = nm.get_device_by_name(device_name)
-    if node is None:
+    if node is None or node.type != 'router':
         abort(400)
 
-    # Add stats to stats deque
-    node.update_quagga_routing_table(request.json)
+    # Replace the Quagga routing table, compiled before the old one is dropped
+    with nm.lock:
+        try:
+            routes = _resolve_routes(node, 'quagga_rt', request.json)
+            (routes, ospf_rd) = _stage_quagga_rt(node, routes)
+        except RoutesDeltaConflict as exc:
+            logging.info('Quagga routing table delta of %s rejected: %s', device_name, exc)
+            return _resync_response({device_name: ['quagga_rt']})
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            logging.info('Bad Quagga routing table from %s: %s', device_name, exc)
+            abort(400)
+
+        nm.update_device_quagga_routing_table(node, routes, ospf_rd)
+
+    # Processed fine
+    return ('', 204)
+
+@netupload.route('/batch', methods=['GET', 'POST'])
+def upload_batch():
+    """Process the incomming request with any data of any number of
+    devices: {device_name -> {data type -> data}}"""
+
+    # Process GET for easier debugging
+    if request.method == 'GET':
+        # Return error response
+        resp = Response(
+            response=json.dumps({'error':'GET not allowed'}),
+            mimetype='application/json'
+        )
+        resp.status_code = 405
+        return resp
+
+    if not request.is_json or not isinstance(request.json, dict):
+        abort(400)
+
+    known_types = {data_type: data_cls for (data_type, data_cls, _, _) in _BATCH_UPDATERS}
+    known_types.update(
+        (data_type, data_cls) for (data_type, data_cls, _) in _BATCH_STATS_STAGERS)
+
+    # Check the structure first, so that bad request changes nothing
+    updates = []
+    for (device_name, device_data) in request.json.items():
+        node = nm.get_device_by_name(device_name)
+        if node is None or not isinstance(device_data, dict):
+            abort(400)
+
+        for (data_type, data) in device_data.items():
+            data_cls = known_types.get(data_type)
+            if data_cls is None or not isinstance(data, data_cls):
+                abort(400)
+
+            # Only routers have routing tables
+            if data_type in _ROUTES_STATE and node.type != 'router':
+                abort(400)
+
+        # Adapter stats can be sent in one format only
+        if sum(data_type in device_data for (data_type, _, _) in _BATCH_STATS_STAGERS) > 1:
+            abort(400)
+
+        updates.append((node, device_data))
+
+    # Apply all data as one change of the network state
+    with nm.lock:
+        # Routing deltas must apply to the current tables of all devices
+        resync = {}
+        for (node, device_data) in updates:
+            for data_type in _ROUTES_STATE:
+                if data_type not in device_data:
+                    continue
+                try:
+                    device_data[data_type] = _resolve_routes(node, data_type, device_data[data_type])
+                except RoutesDeltaConflict as exc:
+                    logging.info('Batch delta %s of %s rejected: %s', data_type, node.name, exc)
+                    resync.setdefault(node.name, []).append(data_type)
+                except (ValueError, KeyError, TypeError, AttributeError) as exc:
+                    logging.info('Bad batch delta %s of %s: %s', data_type, node.name, exc)
+                    abort(400)
+
+        if any(resync):
+            return _resync_response(resync)
+
+        # Parse and compile everything before the first change
+        staged = []
+        device_stats = []
+        try:
+            for (data_type, _, stager, updater) in _BATCH_UPDATERS:
+                for (node, device_data) in updates:
+                    if data_type in device_data:
+                        staged.append((updater, node, stager(node, device_data[data_type])))
+
+            for (data_type, _, stager) in _BATCH_STATS_STAGERS:
+                for (node, device_data) in updates:
+                    if data_type in device_data:
+                        device_stats.append((node, stager(node, device_data[data_type])))
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            logging.info('Bad batch upload: %s', exc)
+            abort(400)
+
+        for (updater, node, args) in staged:
+            updater(node, *args)
+
+        # Stats of all devices are one change of the stats
+        if any(device_stats):
+            nm.update_devices_adapter_stats(device_stats)
+
+    logging.info('Batch upload of %d devices processed', len(updates))
 
     # Processed fine
     return ('', 204)
@@ -0,0 +1,192 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Table of bottleneck (widest path) residual bandwidth along routed paths.
+"""
+import logging
+import math
+
+class WidestPathTable(object):
+    """Holds bottleneck residual bandwidth from devices to destinations.
+
+    Routers forward all packets to the same destination IP the same way, so the
+    bottleneck from a router is min(rbw of the link to the next hop, bottleneck
+    from the next hop). Each (router, destination) is computed once and shared
+    by all sources whose paths pass the router. Values are kept until topology,
+    addresses, routing tables or adapter stats change.
+    """
+
+    def __init__(self, network_map, link_rbw_getter, max_hops=128):
+        """Initialize using NetworkMap and callable(node_a, node_b)
+        returning residual bw of the link or None"""
+
+        self._nm = network_map
+        self._get_link_rbw = link_rbw_getter
+        self._max_hops = max_hops
+
+        self._version = None
+        self._upstream = {}         # Device name -> ([(device, bottleneck)], reached router)
+        self._router_bottleneck = {}# (Router name, destination IP) -> bottleneck or None
+
+    def get_bottleneck(self, device_a, device_b, ip_b):
+        """Get bottleneck residual bw on the path from device_a
+        to device_b having ip_b or None if it is not known"""
+
+        self._check_version()
+
+        # Path without links has no bandwidth
+        if device_a == device_b:
+            return None
+
+        # Going up from the source to its first hop router
+        (upstream, reached_router) = self._get_upstream(device_a)
+        for (device, bottleneck) in upstream:
+            if device == device_b:
+                return bottleneck
+
+        if not reached_router:
+            return None
+
+        (router, up_bottleneck) = upstream[-1]
+        down_bottleneck = self._get_router_bottleneck(router, device_b, ip_b)
+        if down_bottleneck is None:
+            return None
+
+        return min(up_bottleneck, down_bottleneck)
+
+    def get_upstream(self, device_a):
+        """Get ([(device, bottleneck from device_a)], reached router) of
+        devices from device_a up to its first hop router"""
+
+        self._check_version()
+        return self._get_upstream(device_a)
+
+    def get_router_bottleneck(self, router, device_b, ip_b):
+        """Get bottleneck residual bw on the routed path from router
+        to device_b having ip_b or None if it is not known"""
+
+        self._check_version()
+        return self._get_router_bottleneck(router, device_b, ip_b)
+
+    def _check_version(self):
+        """Drop all values if the network state changed"""
+
+        version = (self._nm.topo_version, self._nm.addr_version,
+                   self._nm.rt_version, self._nm.stats_version)
+        if version != self._version:
+            self._upstream.clear()
+            self._router_bottleneck.clear()
+            self._version = version
+
+    def _get_upstream(self, device_a):
+        """Get devices from device_a up to its first hop router with
+        bottleneck from device_a to each of them"""
+
+        cached = self._upstream.get(device_a.name)
+        if cached is not None:
+            return cached
+
+        upstream = [(device_a, math.inf)]
+        reached_router = False
+        cur_device = device_a
+        bottleneck = math.inf
+
+        while len(upstream) <= self._max_hops:
+            if cur_device.type == 'router':
+                reached_router = True
+                break
+
+            if cur_device.type not in ('user', 'adslam'):
+                logging.info('Found device with unrecognized type %s', cur_device.type)
+                break
+
+            upst_dev = self._nm.get_device_by_name(cur_device.upstream)
+            if upst_dev is None:
+                logging.info('Failed to lookup upstream for device %s', cur_device.name)
+                break
+
+            link_rbw = self._get_link_rbw(cur_device, upst_dev)
+            if link_rbw is None:
+                break
+
+            bottleneck = min(bottleneck, link_rbw)
+            upstream.append((upst_dev, bottleneck))
+            cur_device = upst_dev
+
+        self._upstream[device_a.name] = (upstream, reached_router)
+        return (upstream, reached_router)
+
+    def _get_router_bottleneck(self, router, device_b, ip_b):
+        """Follow routed next hops from router to device_b, saving
+        bottleneck of all routers walked"""
+
+        chain = []          # [(router, rbw of the link to its next hop)]
+        tail = None         # Bottleneck from the last walked next hop
+        cur_rtr = router
+
+        while True:
+            key = (cur_rtr.name, ip_b)
+            if key in self._router_bottleneck:
+                # Rest of the path is already known
+                tail = self._router_bottleneck[key]
+                break
+
+            if cur_rtr == device_b:
+                tail = math.inf
+                break
+
+            if len(chain) == self._max_hops or cur_rtr in (rtr for (rtr, _) in chain):
+                logging.info('Routing loop at %s while tracing to %s',
+                             cur_rtr.name, str(ip_b))
+                break
+
+            try:
+                next_dev = self._nm.get_router_next_hop(cur_rtr, ip_b)
+            except LookupError as exc:
+                logging.info('No path from %s to %s: %s', cur_rtr.name, str(ip_b), exc)
+                break
+
+            link_rbw = self._get_link_rbw(cur_rtr, next_dev)
+            chain.append((cur_rtr, link_rbw))
+            if link_rbw is None:
+                break
+
+            if next_dev.type == 'router':
+                cur_rtr = next_dev
+                continue
+
+            # Leaving routed part of the network, destination must be next or behind it
+            if next_dev == device_b:
+                tail = math.inf
+            elif next_dev.type == 'adslam':
+                tail = self._get_link_rbw(next_dev, device_b)
+            else:
+                logging.info('Going downstream but last device is %s and not %s',
+                             next_dev.name, device_b.name)
+            break
+
+        # Save bottleneck of all routers walked, the last one is closest to destination
+        for (chain_rtr, link_rbw) in reversed(chain):
+            if tail is not None and link_rbw is not None:
+                tail = min(tail, link_rbw)
+            else:
+                tail = None
+            self._router_bottleneck[(chain_rtr.name, ip_b)] = tail
+
+        return tail
@@ -0,0 +1,28 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Unit tests of the ALTO server. Run from PyALTO-server: python -m unittest
+"""
+import json
+import os
+
+# Importing altoserver loads CORE network data, tests do not depend on it
+if not os.path.exists('/tmp/netdata.json'):
+    with open('/tmp/netdata.json', 'w') as fp:
+        json.dump({'links': {}, 'names': {}}, fp)
@@ -0,0 +1,150 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Small routed network used by the tests:
+
+    h1 - a1 - r1 === r2 === r3 - a3 - h4
+                     |
+                     a2 - h2, h3
+
+r1 and r3 use default routes, r2 has routes to all networks.
+Each access network is a PID, router links are in the core PID.
+"""
+import ipaddress
+import json
+import tempfile
+
+from altoserver.netnode import NetNode
+from altoserver.networkmap import NetworkMap
+
+# Bridge name -> [global adapter names]
+_BRIDGES = {
+    'b1': ['r1.e0', 'r2.e0'], 'b2': ['r2.e2', 'r3.e0'],
+    'b3': ['r1.e1', 'a1.e0'], 'b4': ['r2.e1', 'a2.e0'], 'b5': ['r3.e1', 'a3.e0'],
+    'b6': ['a1.e1', 'h1.e0'], 'b7': ['a2.e1', 'h2.e0'], 'b8': ['a2.e2', 'h3.e0'],
+    'b9': ['a3.e1', 'h4.e0'],
+}
+
+# Device name -> (type, [addresses], upstream device, [local adapter names])
+_DEVICES = {
+    'r1': ('router', ['10.0.0.1/30', '10.0.1.1/24'], None, ['eth0', 'eth1']),
+    'r2': ('router', ['10.0.0.2/30', '10.0.2.1/24', '10.0.3.1/30'], None, ['eth0', 'eth1', 'eth2']),
+    'r3': ('router', ['10.0.3.2/30', '10.0.4.1/24'], None, ['eth0', 'eth1']),
+    'a1': ('adslam', [], 'r1', ['eth0', 'eth1']),
+    'a2': ('adslam', [], 'r2', ['eth0', 'eth1', 'eth2']),
+    'a3': ('adslam', [], 'r3', ['eth0', 'eth1']),
+    'h1': ('user', ['10.0.1.2/24'], 'a1', ['eth0']),
+    'h2': ('user', ['10.0.2.2/24'], 'a2', ['eth0']),
+    'h3': ('user', ['10.0.2.3/24'], 'a2', ['eth0']),
+    'h4': ('user', ['10.0.4.2/24'], 'a3', ['eth0']),
+}
+
+# (Device A, Device B, capacity) of links in both directions
+_LINKS = [
+    ('r1', 'r2', 100), ('r2', 'r3', 80),
+    ('r1', 'a1', 50), ('r2', 'a2', 60), ('r3', 'a3', 70),
+    ('a1', 'h1', 10), ('a2', 'h2', 20), ('a2', 'h3', 30), ('a3', 'h4', 40),
+]
+
+# Router name -> [(interface, destination, gateway, mask)]
+_ROUTES = {
+    'r1': [
+        ('eth0', '10.0.0.0', '0.0.0.0', '255.255.255.252'),
+        ('eth1', '10.0.1.0', '0.0.0.0', '255.255.255.0'),
+        ('eth0', '0.0.0.0', '10.0.0.2', '0.0.0.0'),
+    ],
+    'r2': [
+        ('eth0', '10.0.0.0', '0.0.0.0', '255.255.255.252'),
+        ('eth1', '10.0.2.0', '0.0.0.0', '255.255.255.0'),
+        ('eth2', '10.0.3.0', '0.0.0.0', '255.255.255.252'),
+        ('eth0', '10.0.1.0', '10.0.0.1', '255.255.255.0'),
+        ('eth2', '10.0.4.0', '10.0.3.2', '255.255.255.0'),
+    ],
+    'r3': [
+        ('eth0', '10.0.3.0', '0.0.0.0', '255.255.255.252'),
+        ('eth1', '10.0.4.0', '0.0.0.0', '255.255.255.0'),
+        ('eth0', '0.0.0.0', '10.0.3.1', '0.0.0.0'),
+    ],
+}
+
+# PID name -> [prefixes]
+_PIDS = {
+    'pid1': ['10.0.1.0/24'],
+    'pid2': ['10.0.2.0/24'],
+    'pid4': ['10.0.4.0/24'],
+    'core': ['10.0.0.0/30', '10.0.3.0/30'],
+}
+
+def make_routing_table(router_name):
+    """Get routing table lines of the router as uploaded by the collector"""
+
+    return [{
+        'ifname': ifname,
+        'destination': destination,
+        'gateway': gateway,
+        'mask': mask,
+        'flags': ['U'] if gateway == '0.0.0.0' else ['U', 'G']
+    } for (ifname, destination, gateway, mask) in _ROUTES[router_name]]
+
+def build_network_map():
+    """Get NetworkMap holding the test network"""
+    return load_network(NetworkMap())
+
+def load_network(network_map):
+    """Replace all devices of network_map with the test network"""
+
+    for device in list(network_map.get_devices()):
+        network_map.remove_device(device.name)
+
+    # Adapter names of the CORE simulator
+    mappings = {}
+    for (name, (_, _, _, adapters)) in _DEVICES.items():
+        mappings[name] = [['{}.e{}'.format(name, idx), adapter] for (idx, adapter) in enumerate(adapters)]
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as fp:
+        json.dump({'links': _BRIDGES, 'names': mappings}, fp)
+        fp.flush()
+        network_map.core_data.load_data(fp.name)
+
+    for (name, (dev_type, addresses, upstream, _)) in _DEVICES.items():
+        network_map.add_device(NetNode(
+            name, dev_type, [ipaddress.ip_interface(address) for address in addresses], upstream))
+
+    for (name_a, name_b, capacity) in _LINKS:
+        device_a = network_map.get_device_by_name(name_a)
+        device_b = network_map.get_device_by_name(name_b)
+        network_map._topo.add_edge(device_a, device_b, capacity=capacity)
+        network_map._topo.add_edge(device_b, device_a, capacity=capacity)
+
+    for router_name in _ROUTES:
+        network_map.update_device_routing_table(
+            network_map.get_device_by_name(router_name), make_routing_table(router_name))
+
+    for (pid_name, prefixes) in _PIDS.items():
+        network_map.add_pid_to_topology(
+            pid_name, [ipaddress.ip_network(prefix) for prefix in prefixes])
+
+    return network_map
+
+def get_device_ips(network_map):
+    """Get [(IP address, device)] of all device addresses"""
+
+    return [(ip_intf.ip, device)
+            for device in network_map.get_devices()
+            for ip_intf in device.ip_interfaces]
@@ -0,0 +1,210 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of the adapter stats history and the compact binary stats format
+"""
+import struct
+import unittest
+from unittest import mock
+
+from altoserver.adapterstats import LOAD_ESTIMATORS, AdapterStatsRing, decode_packed_stats
+from altoserver.netnode import NetNode
+
+def pack_stats(stat_names, adapter_stats, magic=b'PAS1'):
+    """Pack {adapter name -> [counter per stat name]} like collectors do"""
+
+    parts = [struct.pack('<4sHH', magic, len(stat_names), len(adapter_stats))]
+    for name in list(stat_names) + list(adapter_stats):
+        encoded = name.encode('utf-8')
+        parts.append(struct.pack('<B', len(encoded)) + encoded)
+
+    for counters in adapter_stats.values():
+        parts.append(struct.pack('<{}Q'.format(len(counters)), *counters))
+
+    return b''.join(parts)
+
+class AdapterStatsRingTest(unittest.TestCase):
+    """Rates are computed from the latest samples"""
+
+    def test_rates(self):
+        ring = AdapterStatsRing(3)
+        self.assertIsNone(ring.get_latest())
+
+        ring.append(10.0, {'rx_bytes': 1000, 'tx_bytes': 10})
+        self.assertIsNone(ring.get_rate('rx_bytes'))
+
+        ring.append(12.0, {'rx_bytes': 3000, 'tx_bytes': 10})
+        self.assertEqual(ring.get_rate('rx_bytes'), 1000.0)
+        self.assertEqual(ring.get_rate('tx_bytes'), 0.0)
+
+        # Missing counters are 0
+        (timestamp, counters) = ring.get_latest()
+        self.assertEqual(timestamp, 12.0)
+        self.assertEqual(counters, {'rx_bytes': 3000, 'tx_bytes': 10, 'rx_packets': 0,
+                                    'tx_packets': 0, 'rx_errors': 0, 'tx_errors': 0})
+
+        with self.assertRaises(ValueError):
+            ring.get_rate('rx_bytes', 'median')
+
+    def test_history_wraps(self):
+        ring = AdapterStatsRing(3)
+        for sample in range(7):
+            ring.append(sample * 2.0, {'rx_bytes': sample * sample * 10})
+            self.assertEqual(len(ring), min(sample + 1, 3))
+
+        self.assertEqual(ring.get_latest()[1]['rx_bytes'], 360)
+        self.assertEqual(ring.get_rate('rx_bytes'), 55.0)
+
+    def test_large_counters(self):
+        ring = AdapterStatsRing(3)
+        ring.append(0.0, {'rx_bytes': 2**64 - 1001})
+        ring.append(1.0, {'rx_bytes': 2**64 - 1})
+        self.assertEqual(ring.get_latest()[1]['rx_bytes'], 2**64 - 1)
+        self.assertEqual(ring.get_rate('rx_bytes'), 1000.0)
+
+class LoadEstimatorTest(unittest.TestCase):
+    """Estimators smooth the rates of the stats history"""
+
+    def setUp(self):
+        self.ring = AdapterStatsRing(5)
+        for (sample, value) in enumerate([0, 200, 400, 1000]):
+            self.ring.append(sample * 2.0, {'tx_bytes': value})
+
+    def test_estimators(self):
+        self.assertEqual(self.ring.get_rate('tx_bytes', 'last'), 300.0)
+        self.assertAlmostEqual(self.ring.get_rate('tx_bytes', 'ewma'), 0.3 * 300 + 0.7 * 100)
+        self.assertAlmostEqual(self.ring.get_rate('tx_bytes', 'mean'), 1000 / 6)
+        self.assertAlmostEqual(self.ring.get_rate('tx_bytes', 'peak'), 280.0)
+
+    def test_node_loads(self):
+        node = NetNode('h1', 'host')
+        for (sample, value) in enumerate([0, 200, 400, 1000]):
+            with mock.patch('time.time', return_value=sample * 2.0):
+                node.update_adapter_stats([{'name': 'eth0', 'stats': {'tx_bytes': value}}])
+
+        for estimator in LOAD_ESTIMATORS:
+            self.assertAlmostEqual(node.get_adapter_tx_load('eth0', estimator),
+                                   self.ring.get_rate('tx_bytes', estimator) * 8, msg=estimator)
+
+        self.assertIsNone(node.get_adapter_tx_load('eth1', 'ewma'))
+
+    def test_counter_reset(self):
+        ring = AdapterStatsRing(5)
+        for (sample, value) in enumerate([0, 100, 200, 50]):
+            ring.append(sample * 2.0, {'tx_bytes': value})
+
+        # Interval of the reset has no rate, estimates skip it
+        self.assertIsNone(ring.get_rate('tx_bytes', 'last'))
+        for estimator in ('ewma', 'mean', 'peak'):
+            self.assertEqual(ring.get_rate('tx_bytes', estimator), 50.0, estimator)
+
+        ring.append(8.0, {'tx_bytes': 150})
+        for estimator in LOAD_ESTIMATORS:
+            self.assertEqual(ring.get_rate('tx_bytes', estimator), 50.0, estimator)
+
+class ParseAdapterStatsTest(unittest.TestCase):
+    """Uploaded stats are checked before any of them is added"""
+
+    def test_parse(self):
+        (names, counters) = NetNode.parse_adapter_stats([
+            {'name': 'eth0', 'stats': {'rx_bytes': 5, 'tx_bytes': 2**64 - 1, 'multicast': 3}},
+            {'name': 'eth1', 'stats': {}},
+        ])
+
+        self.assertEqual(names, ['eth0', 'eth1'])
+        self.assertEqual(counters.shape, (2, len(AdapterStatsRing.counter_names)))
+        self.assertEqual(counters[0].tolist(), [5, 2**64 - 1, 0, 0, 0, 0])
+        self.assertEqual(counters[1].tolist(), [0] * len(AdapterStatsRing.counter_names))
+
+    def test_malformed(self):
+        for bad_stats in ([{'stats': {}}],
+                          [{'name': 'eth0'}],
+                          [{'name': 'eth0', 'stats': []}],
+                          ['eth0'],
+                          [{'name': 'eth0', 'stats': {'rx_bytes': -1}}],
+                          [{'name': 'eth0', 'stats': {'rx_bytes': 2**64}}],
+                          [{'name': 'eth0', 'stats': {'rx_bytes': 1.5}}],
+                          [{'name': 'eth0', 'stats': {'rx_bytes': '10'}}],
+                          [{'name': 'eth0', 'stats': {'rx_bytes': True}}]):
+            with self.assertRaises(ValueError, msg=str(bad_stats)):
+                NetNode.parse_adapter_stats(bad_stats)
+
+    def test_update_counters(self):
+        node = NetNode('h1', 'host')
+        (names, counters) = NetNode.parse_adapter_stats([
+            {'name': 'eth0', 'stats': {'rx_bytes': 100}},
+            {'name': 'eth1', 'stats': {'rx_bytes': 7}}])
+        node.update_adapter_counters(names, counters)
+
+        # Adapters missing in the latest upload are forgotten
+        (names, counters) = NetNode.parse_adapter_stats([{'name': 'eth0', 'stats': {'rx_bytes': 200}}])
+        node.update_adapter_counters(names, counters)
+
+        (_, stats) = node.interface_stats
+        self.assertEqual([(stat['name'], stat['stats']['rx_bytes']) for stat in stats], [('eth0', 200)])
+
+class DecodePackedStatsTest(unittest.TestCase):
+    """Packed stats decode to the same counters as JSON uploads"""
+
+    def test_decode(self):
+        stat_names = ['tx_bytes', 'multicast', 'rx_bytes', 'rx_packets']
+        adapter_stats = {
+            'eth0': [2 ** 64 - 1, 7, 1000, 10],
+            'wlan-ü': [5, 0, 6, 1],
+        }
+
+        (names, counters) = decode_packed_stats(pack_stats(stat_names, adapter_stats))
+        self.assertEqual(names, ['eth0', 'wlan-ü'])
+        self.assertEqual(counters.shape, (2, len(AdapterStatsRing.counter_names)))
+
+        # Unknown stats are dropped, missing ones are 0 like in JSON uploads
+        for (row, (name, values)) in enumerate(adapter_stats.items()):
+            stats = dict(zip(stat_names, values))
+            expected = [stats.get(counter, 0) for counter in AdapterStatsRing.counter_names]
+            self.assertEqual(counters[row].tolist(), expected, name)
+
+    def test_same_rates_as_json(self):
+        stat_names = list(AdapterStatsRing.counter_names)
+        packed_ring = AdapterStatsRing(4)
+        json_ring = AdapterStatsRing(4)
+        for sample in range(4):
+            values = [sample * 100 * (idx + 1) for idx in range(len(stat_names))]
+
+            (_, counters) = decode_packed_stats(pack_stats(stat_names, {'eth0': values}))
+            packed_ring.append_counters(sample * 2.0, counters[0])
+            json_ring.append(sample * 2.0, dict(zip(stat_names, values)))
+
+        for counter in stat_names:
+            self.assertEqual(packed_ring.get_rate(counter), json_ring.get_rate(counter))
+
+    def test_empty(self):
+        (names, counters) = decode_packed_stats(pack_stats(['rx_bytes'], {}))
+        self.assertEqual(names, [])
+        self.assertEqual(counters.shape, (0, len(AdapterStatsRing.counter_names)))
+
+    def test_malformed(self):
+        data = pack_stats(['rx_bytes', 'tx_bytes'], {'eth0': [1, 2]})
+
+        for bad_data in (data[:5], data[:12], data[:-1], data + b'\0',
+                         pack_stats(['rx_bytes'], {'eth0': [1]}, magic=b'PAS0')):
+            with self.assertRaises(ValueError):
+                decode_packed_stats(bad_data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,288 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of the ALTO resources served over HTTP
+"""
+import gzip
+import ipaddress
+import json
+import random
+import unittest
+import zlib
+from unittest import mock
+
+import numpy
+from flask import Flask
+
+from altoserver import nm
+from altoserver.alto import alto
+from altoserver.alto.costproviders.basecostprovider import BaseCostProvider
+from altoserver.alto.costproviders.ospfcostprovider import OSPFCostProvider
+from altoserver.alto.costproviders.pathloadcostprovider import PathLoadCostProvider
+from altoserver.alto.costproviders.routehopscostprovider import RouteHopsCostProvider
+from altoserver.upload import netupload
+from tests.netmaps import get_device_ips, load_network, make_routing_table
+
+def make_client():
+    """Get Flask test client of a server holding the test network"""
+
+    load_network(nm)
+
+    app = Flask(__name__)
+    app.register_blueprint(netupload, url_prefix='/upload')
+    app.register_blueprint(alto, url_prefix='/alto')
+
+    return app.test_client()
+
+class NetworkMapBodyTest(unittest.TestCase):
+    """Network map is served in all content codings"""
+
+    def setUp(self):
+        self.client = make_client()
+
+    def get_network_map(self, encoding):
+        """Get decoded network map requested with Accept-Encoding"""
+
+        resp = self.client.get('/alto/networkmap', headers={'Accept-Encoding': encoding})
+        self.assertEqual(resp.status_code, 200)
+
+        if encoding == 'gzip':
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            body = gzip.decompress(resp.data)
+        elif encoding == 'deflate':
+            self.assertEqual(resp.headers['Content-Encoding'], 'deflate')
+            body = zlib.decompress(resp.data)
+        else:
+            self.assertNotIn('Content-Encoding', resp.headers)
+            body = resp.data
+
+        return json.loads(body.decode('utf-8'))
+
+    def test_encodings(self):
+        network_map = self.get_network_map('identity')
+        self.assertEqual(sorted(network_map['network-map']), ['core', 'pid1', 'pid2', 'pid4'])
+        self.assertEqual(network_map['network-map']['pid2'], {'ipv4': ['10.0.2.0/24']})
+
+        for encoding in ('gzip', 'deflate'):
+            self.assertEqual(self.get_network_map(encoding), network_map, encoding)
+
+    def test_map_change(self):
+        for encoding in ('identity', 'gzip'):
+            self.assertEqual(self.get_network_map(encoding)['network-map']['pid4'],
+                             {'ipv4': ['10.0.4.0/24']})
+
+        nm.add_pid_to_topology('pid4', [ipaddress.ip_network('10.0.4.0/24'),
+                                        ipaddress.ip_network('10.0.5.0/24')])
+
+        for encoding in ('identity', 'gzip'):
+            network_map = self.get_network_map(encoding)
+            self.assertEqual(network_map['network-map']['pid4'],
+                             {'ipv4': ['10.0.4.0/24', '10.0.5.0/24']})
+            self.assertEqual(network_map['meta']['tag'], nm.get_map_tag())
+
+class ConditionalRequestTest(unittest.TestCase):
+    """Unchanged resources are answered with 304 in the requested coding"""
+
+    def setUp(self):
+        self.client = make_client()
+
+    def get(self, url, encoding, etag=None):
+        """Get response to GET request with Accept-Encoding and If-None-Match"""
+
+        headers = {'Accept-Encoding': encoding}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+
+        return self.client.get(url, headers=headers)
+
+    def assert_conditional(self, url):
+        """Check entity tags of each coding of the resource. Returns them"""
+
+        etags = {}
+        for encoding in ('identity', 'gzip', 'deflate'):
+            resp = self.get(url, encoding)
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('Accept-Encoding', resp.headers['Vary'])
+            etags[encoding] = resp.headers['ETag']
+
+            resp = self.get(url, encoding, etags[encoding])
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.headers['ETag'], etags[encoding])
+
+        # Representations of the other codings are not the same entity
+        self.assertEqual(len(set(etags.values())), 3)
+        self.assertEqual(self.get(url, 'gzip', etags['identity']).status_code, 200)
+
+        return etags
+
+    def test_network_map(self):
+        etags = self.assert_conditional('/alto/networkmap')
+
+        nm.add_pid_to_topology('pid4', [ipaddress.ip_network('10.0.4.0/24'),
+                                        ipaddress.ip_network('10.0.5.0/24')])
+
+        resp = self.get('/alto/networkmap', 'gzip', etags['gzip'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etags['gzip'])
+
+    def test_cost_map(self):
+        url = '/alto/costmap/hops-routingcost'
+        etags = self.assert_conditional(url)
+
+        # Cost maps change with the routing tables
+        r3 = nm.get_device_by_name('r3')
+        with nm.lock:
+            nm.update_device_routing_table(r3, make_routing_table('r3')[:-1])
+
+        resp = self.get(url, 'identity', etags['identity'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etags['identity'])
+
+    def test_endpoint_properties(self):
+        request = {'properties': ['network-map.pid'], 'endpoints': ['ipv4:10.0.1.2']}
+        resp = self.client.post('/alto/endpointprop/lookup', data=json.dumps(request),
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.post('/alto/endpointprop/lookup', data=json.dumps(request),
+                                content_type='application/json',
+                                headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(resp.status_code, 304)
+
+class CostMapTest(unittest.TestCase):
+    """Cost maps hold costs between the endpoints of PIDs"""
+
+    def setUp(self):
+        self.client = make_client()
+
+    def get_cost_map(self, resource_id):
+        """Get cost-map part of the cost map resource"""
+
+        resp = self.client.get('/alto/costmap/' + resource_id)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(resp.data.decode('utf-8'))['cost-map']
+
+    def test_route_hops(self):
+        # Hosts are a hop further than their router, the same network is 0 hops away
+        self.assertEqual(self.get_cost_map('hops-routingcost'), {
+            'core': {'core': 0, 'pid1': 0, 'pid2': 0, 'pid4': 0},
+            'pid1': {'core': 1, 'pid1': 0, 'pid2': 2, 'pid4': 3},
+            'pid2': {'core': 1, 'pid1': 2, 'pid2': 0, 'pid4': 2},
+            'pid4': {'core': 1, 'pid1': 3, 'pid2': 2, 'pid4': 0},
+        })
+
+    def test_residual_bandwidth(self):
+        # Widest path between any endpoints, a host has no path to itself
+        self.assertEqual(self.get_cost_map('residual-pathbandwidth'), {
+            'core': {'core': 100, 'pid1': 10, 'pid2': 30, 'pid4': 40},
+            'pid1': {'core': 10, 'pid2': 10, 'pid4': 10},
+            'pid2': {'core': 30, 'pid1': 10, 'pid2': 20, 'pid4': 30},
+            'pid4': {'core': 40, 'pid1': 10, 'pid2': 30},
+        })
+
+    def test_unknown_resource(self):
+        self.assertEqual(self.client.get('/alto/costmap/no-such-map').status_code, 404)
+
+    def test_router_level_costs(self):
+        rng = random.Random(3)
+
+        # Quagga tables and some load on all links
+        for router_name in ('r1', 'r2', 'r3'):
+            nm.update_device_quagga_routing_table(nm.get_device_by_name(router_name), [
+                {'protocol': 'O', 'subnet': subnet, 'RD': rng.randint(1, 50)}
+                for subnet in ('10.0.1.0/24', '10.0.2.0/24', '10.0.4.0/24', '10.0.0.0/16')])
+
+        for (timestamp, max_bytes) in ((100.0, 0), (101.0, 5)):
+            with mock.patch('time.time', return_value=timestamp):
+                nm.update_devices_adapter_stats([(device, [{
+                    'name': 'eth{}'.format(index),
+                    'stats': {'rx_bytes': rng.randint(0, max_bytes),
+                              'tx_bytes': rng.randint(0, max_bytes)}
+                } for index in range(3)]) for device in nm.get_devices()])
+
+        providers = [RouteHopsCostProvider(), OSPFCostProvider(),
+                     PathLoadCostProvider(), PathLoadCostProvider('mean')]
+        addresses = [ip_address for (ip_address, _) in get_device_ips(nm)]
+
+        # Router level costs are the same as costs of all endpoint pairs
+        for _ in range(20):
+            pid_endpoints = [[] for _ in range(rng.randint(1, 6))]
+            for ip_address in addresses:
+                rng.choice(pid_endpoints).append(ip_address)
+
+            for provider in providers:
+                numpy.testing.assert_array_equal(
+                    provider.get_pid_cost_matrix(pid_endpoints),
+                    BaseCostProvider.get_pid_cost_matrix(provider, pid_endpoints),
+                    provider.cost_type)
+
+class FilteredMapTest(unittest.TestCase):
+    """Filtered maps hold only the requested PIDs"""
+
+    def setUp(self):
+        self.client = make_client()
+
+    def post(self, url, request):
+        """Get (status code, JSON body) of the POST request"""
+
+        resp = self.client.post(url, data=json.dumps(request), content_type='application/json')
+        if resp.status_code != 200:
+            return (resp.status_code, None)
+
+        return (resp.status_code, json.loads(resp.data.decode('utf-8')))
+
+    def test_network_map(self):
+        url = '/alto/networkmap/filtered'
+
+        (status, resp) = self.post(url, {'pids': ['pid1', 'pid9']})
+        self.assertEqual(status, 200)
+        self.assertEqual(resp['network-map'], {'pid1': {'ipv4': ['10.0.1.0/24']}})
+        self.assertEqual(resp['meta']['tag'], nm.get_map_tag())
+
+        (status, resp) = self.post(url, {'pids': []})
+        self.assertEqual(sorted(resp['network-map']), ['core', 'pid1', 'pid2', 'pid4'])
+
+        # PIDs without addresses of the requested types are left out
+        (status, resp) = self.post(url, {'pids': [], 'address-types': ['ipv6']})
+        self.assertEqual(resp['network-map'], {})
+
+        self.assertEqual(self.post(url, {'address-types': ['ipv4']}), (400, None))
+
+    def test_cost_map(self):
+        url = '/alto/costmap/filtered'
+        cost_type = {'cost-mode': 'numerical', 'cost-metric': 'hops-routingcost'}
+
+        (status, resp) = self.post(url, {
+            'cost-type': cost_type,
+            'pids': {'srcs': ['pid1'], 'dsts': ['pid2', 'pid4', 'pid9']}
+        })
+        self.assertEqual(status, 200)
+        self.assertEqual(resp['cost-map'], {'pid1': {'pid2': 2, 'pid4': 3}})
+
+        # Empty lists select all PIDs
+        (status, resp) = self.post(url, {'cost-type': cost_type, 'pids': {'dsts': ['pid1']}})
+        self.assertEqual(resp['cost-map'], {
+            'core': {'pid1': 0}, 'pid1': {'pid1': 0}, 'pid2': {'pid1': 2}, 'pid4': {'pid1': 3}})
+
+        self.assertEqual(self.post(url, {'cost-type': {
+            'cost-mode': 'numerical', 'cost-metric': 'no-such-metric'}}), (400, None))
+        self.assertEqual(self.post(url, {'pids': {}}), (400, None))
+
+if __name__ == '__main__':
+    unittest.main()
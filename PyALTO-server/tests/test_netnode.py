@@ -0,0 +1,83 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of the routing data compiled by NetNode
+"""
+import ipaddress
+import random
+import unittest
+
+from altoserver.netnode import NetNode
+from tests.test_prefixtrie import random_addresses, random_prefixes
+
+class OSPFDistancesTest(unittest.TestCase):
+    """OSPF RD lookups match a scan over all Quagga RT lines"""
+
+    @staticmethod
+    def linear_distance(qrt_data, address):
+        """Get min RD of all OSPF subnets containing address"""
+
+        distances = [line['RD'] for line in qrt_data
+                     if line['protocol'] == 'O' and line['RD'] is not None and
+                     address in ipaddress.ip_network(line['subnet'])]
+        return min(distances, default=None)
+
+    def test_random_tables(self):
+        rng = random.Random(5)
+        for _ in range(20):
+            prefixes = random_prefixes(rng, 40)
+            qrt_data = [{
+                'protocol': rng.choice(['O', 'O', 'O', 'C', 'K']),
+                'subnet': str(prefix),
+                'RD': rng.choice([None, rng.randint(1, 100)])
+            } for prefix in prefixes + rng.sample(prefixes, 10)]
+
+            router = NetNode('r1', 'router')
+            router.update_quagga_routing_table(qrt_data)
+
+            addresses = random_addresses(rng, prefixes, 100)
+            expected = [OSPFDistancesTest.linear_distance(qrt_data, address)
+                        for address in addresses]
+            self.assertEqual(router.get_ospf_distances(addresses), expected)
+
+    def test_no_table(self):
+        router = NetNode('r1', 'router')
+        address = ipaddress.ip_address('10.0.0.1')
+        self.assertEqual(router.get_ospf_distances([address]), [None])
+
+        router.update_quagga_routing_table([{'protocol': 'O', 'subnet': '10.0.0.0/8', 'RD': 5}])
+        self.assertEqual(router.get_ospf_distances([address]), [5])
+
+    def test_malformed_table(self):
+        router = NetNode('r1', 'router')
+        router.update_quagga_routing_table([{'protocol': 'O', 'subnet': '10.0.0.0/8', 'RD': 5}])
+        address = ipaddress.ip_address('10.0.0.1')
+
+        for bad_table in ([{'protocol': 'O', 'subnet': 'bad', 'RD': 1}],
+                          [{'protocol': 'O', 'RD': 1}],
+                          [{'protocol': 'O', 'subnet': '10.0.0.0/8', 'RD': 'x'},
+                           {'protocol': 'O', 'subnet': '10.0.0.0/8', 'RD': 1}]):
+            with self.assertRaises((ValueError, KeyError, TypeError)):
+                router.update_quagga_routing_table(bad_table)
+
+            # Previous table is kept
+            self.assertEqual(router.get_ospf_distances([address]), [5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of the NetworkMap device indexes
+"""
+import ipaddress
+import unittest
+from unittest import mock
+
+from altoserver.netnode import NetNode
+from tests.netmaps import build_network_map, get_device_ips, make_routing_table
+
+class NameIndexTest(unittest.TestCase):
+    """Devices are found by name as long as they are in the topology"""
+
+    def setUp(self):
+        self.nm = build_network_map()
+
+    def test_lookup(self):
+        for device in self.nm.get_devices():
+            self.assertIs(self.nm.get_device_by_name(device.name), device)
+
+        self.assertIsNone(self.nm.get_device_by_name('r9'))
+
+    def test_replace_keeps_links(self):
+        old_a2 = self.nm.get_device_by_name('a2')
+        r2 = self.nm.get_device_by_name('r2')
+        h2 = self.nm.get_device_by_name('h2')
+
+        new_a2 = NetNode('a2', 'adslam', [], 'r2')
+        self.nm.add_device(new_a2)
+
+        self.assertIs(self.nm.get_device_by_name('a2'), new_a2)
+        self.assertEqual(len(self.nm.get_devices()), 10)
+        self.assertEqual(self.nm.get_link_capacity(r2, new_a2), 60)
+        self.assertEqual(self.nm.get_link_capacity(new_a2, h2), 20)
+        self.assertEqual(len(self.nm.get_out_edges(new_a2)), 3)
+        self.assertEqual(len(self.nm.get_in_edges(new_a2)), 3)
+        self.assertFalse(any(node_b is old_a2 for (_, node_b, _) in self.nm.get_out_edges(r2)))
+
+    def test_remove(self):
+        r2 = self.nm.get_device_by_name('r2')
+        self.nm.remove_device('a2')
+
+        self.assertIsNone(self.nm.get_device_by_name('a2'))
+        self.assertIsNone(self.nm.get_link_capacity(r2, 'a2'))
+
+        # Removing unknown device is not an error
+        self.nm.remove_device('a2')
+
+class IPIndexTest(unittest.TestCase):
+    """Devices are found by IP address as their addresses change"""
+
+    def setUp(self):
+        self.nm = build_network_map()
+
+    def test_lookup(self):
+        for (ip_address, device) in get_device_ips(self.nm):
+            self.assertIs(self.nm.get_device_by_ip(ip_address), device)
+
+        self.assertIsNone(self.nm.get_device_by_ip(ipaddress.ip_address('10.0.9.9')))
+
+    def test_address_upload(self):
+        h2 = self.nm.get_device_by_name('h2')
+        version = self.nm.addr_version
+
+        self.nm.update_device_addresses(h2, [{'address': '10.0.2.9/24'}])
+
+        self.assertIsNone(self.nm.get_device_by_ip(ipaddress.ip_address('10.0.2.2')))
+        self.assertIs(self.nm.get_device_by_ip(ipaddress.ip_address('10.0.2.9')), h2)
+        self.assertEqual(self.nm.addr_version, version + 1)
+
+        # The same addresses again are not a change
+        self.nm.update_device_addresses(h2, [{'address': '10.0.2.9/24'}])
+        self.assertEqual(self.nm.addr_version, version + 1)
+
+    def test_malformed_address_upload(self):
+        h2 = self.nm.get_device_by_name('h2')
+
+        with self.assertRaises(ValueError):
+            self.nm.update_device_addresses(h2, [{'address': '10.0.2.9/24'}, {'address': 'bad'}])
+
+        self.assertIs(self.nm.get_device_by_ip(ipaddress.ip_address('10.0.2.2')), h2)
+        self.assertIsNone(self.nm.get_device_by_ip(ipaddress.ip_address('10.0.2.9')))
+
+    def test_replace_device(self):
+        self.nm.add_device(NetNode('h2', 'user', [ipaddress.ip_interface('10.0.2.9/24')], 'a2'))
+
+        self.assertIsNone(self.nm.get_device_by_ip(ipaddress.ip_address('10.0.2.2')))
+        self.assertIs(self.nm.get_device_by_ip(ipaddress.ip_address('10.0.2.9')),
+                      self.nm.get_device_by_name('h2'))
+
+    def test_shared_address(self):
+        h2 = self.nm.get_device_by_name('h2')
+        h3 = self.nm.get_device_by_name('h3')
+        shared_ip = ipaddress.ip_address('10.0.2.2')
+
+        # h3 takes the address of h2, which still has it
+        self.nm.update_device_addresses(h3, [{'address': '10.0.2.2/24'}])
+        self.assertIs(self.nm.get_device_by_ip(shared_ip), h2)
+
+        # Address stays indexed as long as any device has it
+        self.nm.update_device_addresses(h2, [{'address': '10.0.2.4/24'}])
+        self.assertIs(self.nm.get_device_by_ip(shared_ip), h3)
+
+        self.nm.remove_device('h3')
+        self.assertIsNone(self.nm.get_device_by_ip(shared_ip))
+
+class PathCacheTest(unittest.TestCase):
+    """Traced paths are reused until the state they depend on changes"""
+
+    def setUp(self):
+        self.nm = build_network_map()
+        self.h1_ip = ipaddress.ip_address('10.0.1.2')
+        self.h3_ip = ipaddress.ip_address('10.0.2.3')
+        self.h4_ip = ipaddress.ip_address('10.0.4.2')
+
+    def get_path(self, ip_a, ip_b):
+        """Get (device names on the path, number of traces done)"""
+
+        with mock.patch.object(self.nm, 'dev_to_dev_iterator',
+                               wraps=self.nm.dev_to_dev_iterator) as tracer:
+            path = self.nm.get_path(ip_a, ip_b)
+
+        return ([device.name for device in path], tracer.call_count)
+
+    def test_path(self):
+        self.assertEqual(self.get_path(self.h1_ip, self.h4_ip),
+                         (['h1', 'a1', 'r1', 'r2', 'r3', 'a3', 'h4'], 1))
+        self.assertEqual(self.get_path(self.h1_ip, self.h4_ip),
+                         (['h1', 'a1', 'r1', 'r2', 'r3', 'a3', 'h4'], 0))
+
+    def test_routing_table_change(self):
+        self.get_path(self.h1_ip, self.h3_ip)
+        r2 = self.nm.get_device_by_name('r2')
+        r3 = self.nm.get_device_by_name('r3')
+
+        # Router not on the path does not matter
+        self.nm.update_device_routing_table(r3, make_routing_table('r3')[:-1])
+        self.assertEqual(self.get_path(self.h1_ip, self.h3_ip)[1], 0)
+
+        # Router on the path does, even if the path stays the same
+        routes = make_routing_table('r2')
+        self.nm.update_device_routing_table(r2, list(reversed(routes)))
+        self.assertEqual(self.get_path(self.h1_ip, self.h3_ip),
+                         (['h1', 'a1', 'r1', 'r2', 'a2', 'h3'], 1))
+
+    def test_address_change(self):
+        self.get_path(self.h1_ip, self.h3_ip)
+
+        h3 = self.nm.get_device_by_name('h3')
+        self.nm.update_device_addresses(h3, [{'address': '10.0.2.9/24'}])
+        with self.assertRaises(LookupError):
+            self.nm.get_path(self.h1_ip, self.h3_ip)
+
+        self.nm.update_device_addresses(h3, [{'address': '10.0.2.3/24'}])
+        self.assertEqual(self.get_path(self.h1_ip, self.h3_ip),
+                         (['h1', 'a1', 'r1', 'r2', 'a2', 'h3'], 1))
+
+    def test_failed_trace(self):
+        r3 = self.nm.get_device_by_name('r3')
+        self.nm.update_device_routing_table(r3, make_routing_table('r3')[:-1])
+
+        # Failures are cached as well
+        for expected_traces in (1, 0):
+            with mock.patch.object(self.nm, 'dev_to_dev_iterator',
+                                   wraps=self.nm.dev_to_dev_iterator) as tracer:
+                with self.assertRaises(LookupError):
+                    self.nm.get_path(self.h4_ip, self.h1_ip)
+            self.assertEqual(tracer.call_count, expected_traces)
+
+        # Until the routers they depend on change
+        self.nm.update_device_routing_table(r3, make_routing_table('r3'))
+        self.assertEqual(self.get_path(self.h4_ip, self.h1_ip),
+                         (['h4', 'a3', 'r3', 'r2', 'r1', 'a1', 'h1'], 1))
+
+if __name__ == '__main__':
+    unittest.main()
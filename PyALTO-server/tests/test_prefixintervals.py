@@ -0,0 +1,55 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of the bulk longest prefix matching with sorted intervals
+"""
+import ipaddress
+import random
+import unittest
+
+from altoserver.prefixtrie import PrefixTrie
+from altoserver.prefixintervals import PrefixIntervals
+from tests.test_prefixtrie import random_prefixes, random_addresses, linear_longest_match
+
+class PrefixIntervalsTest(unittest.TestCase):
+    """Interval lookups give the same results as a linear scan"""
+
+    def test_longest_matches(self):
+        rng = random.Random(8895)
+
+        prefix_values = []
+        trie = PrefixTrie()
+        for (index, prefix) in enumerate(set(random_prefixes(rng, 300))):
+            # Values are shared by many prefixes like PIDs are
+            value = 'pid{}'.format(index % 17)
+            trie.insert(prefix, value)
+            prefix_values.append((prefix, value))
+
+        addresses = random_addresses(rng, [prefix for (prefix, _) in prefix_values], 2000)
+
+        self.assertEqual(
+            PrefixIntervals(trie).longest_matches(addresses),
+            [linear_longest_match(prefix_values, address) for address in addresses])
+
+    def test_empty_trie(self):
+        addresses = [ipaddress.ip_address('10.0.0.1'), ipaddress.ip_address('::1')]
+        self.assertEqual(PrefixIntervals(PrefixTrie()).longest_matches(addresses), [None, None])
+
+if __name__ == '__main__':
+    unittest.main()
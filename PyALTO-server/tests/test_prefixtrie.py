@@ -0,0 +1,122 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of the prefix trie used for longest prefix matching
+"""
+import ipaddress
+import random
+import unittest
+
+from altoserver.prefixtrie import PrefixTrie
+
+def random_prefixes(rng, count):
+    """Get list of count random IPv4 and IPv6 prefixes, some nested"""
+
+    prefixes = []
+    for _ in range(count):
+        if rng.random() < 0.7:
+            prefixlen = rng.randint(0, 32)
+            prefixes.append(ipaddress.ip_network(
+                (rng.getrandbits(32) & (0xffffffff << (32 - prefixlen)) & 0xffffffff, prefixlen)))
+        else:
+            prefixlen = rng.randint(0, 128)
+            mask = ((1 << 128) - 1) ^ ((1 << (128 - prefixlen)) - 1)
+            prefixes.append(ipaddress.ip_network((rng.getrandbits(128) & mask, prefixlen)))
+
+    # Addresses inside of the other prefixes make nesting likely
+    for prefix in list(prefixes[:count // 4]):
+        if prefix.prefixlen < prefix.max_prefixlen:
+            prefixes.append(next(prefix.subnets(prefixlen_diff=1)))
+
+    return prefixes
+
+def random_addresses(rng, prefixes, count):
+    """Get random addresses, half of them inside of the given prefixes"""
+
+    addresses = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            prefix = rng.choice(prefixes)
+            offset = rng.randrange(prefix.num_addresses)
+            addresses.append(prefix.network_address + offset)
+        elif rng.random() < 0.7:
+            addresses.append(ipaddress.IPv4Address(rng.getrandbits(32)))
+        else:
+            addresses.append(ipaddress.IPv6Address(rng.getrandbits(128)))
+
+    return addresses
+
+def linear_longest_match(prefix_values, address):
+    """Value of the longest prefix containing the address by scanning all of them"""
+
+    best = None
+    for (prefix, value) in prefix_values:
+        if prefix.version == address.version and address in prefix:
+            if best is None or prefix.prefixlen > best[0].prefixlen:
+                best = (prefix, value)
+
+    return None if best is None else best[1]
+
+class PrefixTrieTest(unittest.TestCase):
+    """Trie lookups give the same results as a linear scan"""
+
+    def setUp(self):
+        rng = random.Random(7285)
+
+        # First inserted value of each prefix is kept
+        self.prefix_values = []
+        self.trie = PrefixTrie()
+        seen = set()
+        for (index, prefix) in enumerate(random_prefixes(rng, 300)):
+            self.trie.insert(prefix, 'pid{}'.format(index))
+            if prefix not in seen:
+                self.prefix_values.append((prefix, 'pid{}'.format(index)))
+                seen.add(prefix)
+
+        self.addresses = random_addresses(rng, list(seen), 2000)
+
+    def test_longest_match(self):
+        for address in self.addresses:
+            self.assertEqual(
+                self.trie.longest_match(address),
+                linear_longest_match(self.prefix_values, address),
+                str(address))
+
+    def test_matches(self):
+        for address in self.addresses:
+            expected = sorted(value for (prefix, value) in self.prefix_values
+                              if prefix.version == address.version and address in prefix)
+            self.assertEqual(sorted(self.trie.matches(address)), expected, str(address))
+
+    def test_items_and_len(self):
+        self.assertEqual(len(self.trie), len(self.prefix_values))
+        self.assertEqual(sorted(self.trie.items(), key=str), sorted(self.prefix_values, key=str))
+
+    def test_replace(self):
+        prefix = ipaddress.ip_network('10.0.0.0/8')
+        trie = PrefixTrie()
+        trie.insert(prefix, 'old')
+        trie.insert(prefix, 'new')
+        self.assertEqual(trie.longest_match(ipaddress.ip_address('10.1.2.3')), 'old')
+        trie.insert(prefix, 'new', replace=True)
+        self.assertEqual(trie.longest_match(ipaddress.ip_address('10.1.2.3')), 'new')
+        self.assertEqual(len(trie), 1)
+
+if __name__ == '__main__':
+    unittest.main()
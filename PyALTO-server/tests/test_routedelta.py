@@ -0,0 +1,162 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of delta encoded routing table uploads
+"""
+import ipaddress
+import random
+import unittest
+
+from altoserver.netnode import NetNode
+from altoserver.routedelta import (RoutesDeltaConflict, apply_routes_delta,
+                                   get_route_key, get_routes_hash, is_routes_delta)
+from tests.netmaps import make_routing_table
+
+def make_delta(old_routes, new_routes):
+    """Make delta the way collectors do: multiset difference of route lines"""
+
+    old_keys = [get_route_key(route) for route in old_routes]
+    new_keys = [get_route_key(route) for route in new_routes]
+
+    remove = list(old_routes)
+    add = []
+    for (route, route_key) in zip(new_routes, new_keys):
+        if route_key in old_keys:
+            old_keys.remove(route_key)
+            remove.remove(route)
+        else:
+            add.append(route)
+
+    return {
+        'base': get_routes_hash(old_routes),
+        'hash': get_routes_hash(new_routes),
+        'add': add,
+        'remove': remove
+    }
+
+class RoutesDeltaTest(unittest.TestCase):
+    """Applying a delta is the same as uploading the full table"""
+
+    def setUp(self):
+        self.routes = make_routing_table('r2')
+
+    def test_hash_does_not_depend_on_order(self):
+        shuffled = list(self.routes)
+        random.Random(1).shuffle(shuffled)
+        self.assertEqual(get_routes_hash(shuffled), get_routes_hash(self.routes))
+        self.assertNotEqual(get_routes_hash(self.routes[1:]), get_routes_hash(self.routes))
+
+    def test_apply_matches_full_table(self):
+        rng = random.Random(23)
+        routes = self.routes
+        for _ in range(50):
+            # Drop some lines, add some new ones
+            new_routes = [route for route in routes if rng.random() < 0.8]
+            for _ in range(rng.randint(0, 3)):
+                new_routes.append({
+                    'ifname': 'eth{}'.format(rng.randint(0, 2)),
+                    'destination': '10.{}.{}.0'.format(rng.randint(0, 255), rng.randint(0, 255)),
+                    'gateway': '10.0.0.1', 'mask': '255.255.255.0', 'flags': ['U', 'G']
+                })
+
+            delta = make_delta(routes, new_routes)
+            self.assertTrue(is_routes_delta(delta))
+            self.assertFalse(is_routes_delta(new_routes))
+
+            patched = apply_routes_delta(routes, get_routes_hash(routes), delta)
+            self.assertEqual(sorted(map(get_route_key, patched)),
+                             sorted(map(get_route_key, new_routes)))
+            self.assertEqual(get_routes_hash(patched), get_routes_hash(new_routes))
+            routes = patched
+
+    def test_node_hash_matches_full_upload(self):
+        new_routes = self.routes[:-1]
+
+        by_delta = NetNode('r2', 'router')
+        by_delta.update_routing_table(self.routes)
+        delta = make_delta(self.routes, new_routes)
+        by_delta.update_routing_table(apply_routes_delta(
+            by_delta.routing_table, by_delta.routing_table_hash, delta))
+
+        by_full = NetNode('r2', 'router')
+        by_full.update_routing_table(new_routes)
+
+        self.assertEqual(by_delta.routing_table_hash, by_full.routing_table_hash)
+        self.assertEqual(by_delta.routing_table_hash, delta['hash'])
+
+    def test_conflicts(self):
+        routes_hash = get_routes_hash(self.routes)
+        delta = make_delta(self.routes, self.routes[1:])
+
+        # Delta made for other routes
+        with self.assertRaises(RoutesDeltaConflict):
+            apply_routes_delta(self.routes[1:], get_routes_hash(self.routes[1:]), delta)
+
+        # Removed route is not in the table
+        bad_remove = dict(delta, remove=[dict(self.routes[0], ifname='eth9')])
+        with self.assertRaises(RoutesDeltaConflict):
+            apply_routes_delta(self.routes, routes_hash, bad_remove)
+
+        # Result does not match the hash of the collector's table
+        bad_hash = dict(delta, hash=routes_hash)
+        with self.assertRaises(RoutesDeltaConflict):
+            apply_routes_delta(self.routes, routes_hash, bad_hash)
+
+    def test_empty_delta_keeps_routes(self):
+        routes_hash = get_routes_hash(self.routes)
+        delta = {'base': routes_hash, 'hash': routes_hash, 'add': [], 'remove': []}
+        self.assertIs(apply_routes_delta(self.routes, routes_hash, delta), self.routes)
+
+class FibOrderTest(unittest.TestCase):
+    """Delta applied tables are in other order, LPM must not depend on it"""
+
+    def setUp(self):
+        self.routes = make_routing_table('r2') + [
+            # Same prefix with a worse metric and two default routes
+            {'ifname': 'eth0', 'destination': '10.0.4.0', 'gateway': '10.0.0.1',
+             'mask': '255.255.255.0', 'flags': ['U', 'G'], 'metric': 20},
+            {'ifname': 'eth0', 'destination': '0.0.0.0', 'gateway': '10.0.0.1',
+             'mask': '0.0.0.0', 'flags': ['U', 'G'], 'metric': 10},
+            {'ifname': 'eth2', 'destination': '0.0.0.0', 'gateway': '10.0.3.2',
+             'mask': '0.0.0.0', 'flags': ['U', 'G'], 'metric': 5},
+        ]
+
+        self.expected = {
+            '10.0.4.7': ('eth2', '10.0.3.2'),
+            '10.0.1.9': ('eth0', '10.0.0.1'),
+            '10.0.2.3': ('eth1', '0.0.0.0'),
+            '192.0.2.1': ('eth2', '10.0.3.2'),
+        }
+
+    def test_lpm_does_not_depend_on_order(self):
+        rng = random.Random(5)
+        for _ in range(20):
+            shuffled = list(self.routes)
+            rng.shuffle(shuffled)
+
+            node = NetNode('r2', 'router')
+            node.update_routing_table(shuffled)
+            for (address, route) in self.expected.items():
+                self.assertEqual(node.rt_longest_prefix_match(
+                    ipaddress.ip_address(address), return_default=True), route, address)
+
+            self.assertEqual(NetNode.compile_fib(shuffled)[1], NetNode.compile_fib(self.routes)[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of router hop counts against traced paths
+"""
+import ipaddress
+import sys
+import threading
+import unittest
+
+from altoserver.netnode import NetNode
+from altoserver.routehopstable import RouteHopsTable
+from tests.netmaps import build_network_map, get_device_ips, make_routing_table
+
+class RouteHopsTableTest(unittest.TestCase):
+    """Hops of each router match the routers on the traced path"""
+
+    def setUp(self):
+        self.nm = build_network_map()
+        self.table = RouteHopsTable(self.nm)
+
+    def assert_hops_match_paths(self):
+        """Compare hops from all routers to all host addresses with traced paths"""
+
+        device_ips = get_device_ips(self.nm)
+        routers = [device for device in self.nm.get_devices() if device.type == 'router']
+        for router in routers:
+            router_ip = router.ip_interfaces[0].ip
+            for (ip_b, device_b) in device_ips:
+                # Paths to router addresses end at the router, not on its network
+                if device_b.type == 'router':
+                    continue
+
+                try:
+                    path = self.nm.get_path(router_ip, ip_b)
+                    expected = sum(1 for device in path if device.type == 'router') - 1
+                except LookupError:
+                    expected = None
+
+                self.assertEqual(self.table.get_hops(router, ip_b), expected,
+                                 '{} -> {}'.format(router.name, ip_b))
+
+    def test_hops_match_paths(self):
+        self.assert_hops_match_paths()
+
+    def test_hops_follow_routing_table_changes(self):
+        self.assert_hops_match_paths()
+
+        # r3 has no default route any more, only its own networks are reachable
+        r3 = self.nm.get_device_by_name('r3')
+        self.nm.update_device_routing_table(r3, make_routing_table('r3')[:-1])
+
+        h1_ip = self.nm.get_device_by_name('h1').ip_interfaces[0].ip
+        self.assertIsNone(self.table.get_hops(r3, h1_ip))
+
+        self.assert_hops_match_paths()
+
+    def test_concurrent_changes(self):
+        device_ips = [(ip_b, device_b) for (ip_b, device_b) in get_device_ips(self.nm)
+                      if device_b.type != 'router']
+        routers = [device for device in self.nm.get_devices() if device.type == 'router']
+        r3 = self.nm.get_device_by_name('r3')
+        stop = threading.Event()
+        errors = []
+
+        def read_hops():
+            while not stop.is_set():
+                try:
+                    for router in routers:
+                        for (ip_b, _) in device_ips:
+                            self.table.get_hops(router, ip_b)
+                except Exception as exc:
+                    errors.append(exc)
+                    return
+
+        # Switch threads often, so that they interleave inside of the table
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+
+        readers = [threading.Thread(target=read_hops) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+
+        # Uploads change the network under the map lock only
+        try:
+            for index in range(200):
+                with self.nm.lock:
+                    self.nm.update_device_routing_table(
+                        r3, make_routing_table('r3')[:-1 if index % 2 else None])
+                    self.nm.add_device(NetNode('h9', 'user', [ipaddress.ip_interface(
+                        '10.0.4.{}/24'.format(10 + index % 100))], 'a3'))
+        finally:
+            stop.set()
+            for reader in readers:
+                reader.join()
+
+        self.assertEqual(errors, [])
+
+        # Added host has no links, paths to it can not be traced
+        self.nm.remove_device('h9')
+        self.assert_hops_match_paths()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of the incremental updates sent as merge patches
+"""
+import ipaddress
+import json
+import unittest
+
+from altoserver import nm
+from altoserver.alto import alto_server
+from altoserver.alto.updatestream import UpdateStreamService, make_merge_patch
+from tests.netmaps import load_network, make_routing_table
+
+def apply_merge_patch(target, patch):
+    """Apply JSON merge patch as described in RFC7396"""
+
+    if not isinstance(patch, dict):
+        return patch
+
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+
+    return result
+
+def parse_event(event):
+    """Get (media type, client id, data) of SSE event"""
+
+    (event_line, data_line) = event.rstrip('\n').split('\n')
+    (media_type, client_id) = event_line[len('event: '):].split(',')
+    return (media_type, client_id, json.loads(data_line[len('data: '):]))
+
+class MergePatchTest(unittest.TestCase):
+    """Merge patches transform the old document into the new one"""
+
+    def test_merge_patch(self):
+        old = {'a': 1, 'b': {'c': 2, 'd': [1, 2]}, 'e': 'x'}
+        new = {'a': 1, 'b': {'c': 3, 'd': [1]}, 'f': {'g': None}}
+
+        patch = make_merge_patch(old, new)
+        self.assertEqual(patch, {'b': {'c': 3, 'd': [1]}, 'e': None, 'f': {'g': None}})
+        self.assertEqual(make_merge_patch(new, new), {})
+        self.assertEqual(make_merge_patch(old, [1]), [1])
+
+    def test_apply(self):
+        old = {'pid1': {'pid1': 0, 'pid2': 2}, 'pid2': {'pid1': 2}}
+        new = {'pid1': {'pid1': 0, 'pid2': 3, 'pid4': 1}, 'pid4': {'pid1': 1}}
+        self.assertEqual(apply_merge_patch(old, make_merge_patch(old, new)), new)
+
+class UpdateStreamTest(unittest.TestCase):
+    """Streams send the full resource once and patches of the changes"""
+
+    def setUp(self):
+        load_network(nm)
+        self.service = UpdateStreamService(alto_server, min_interval=0, keepalive_interval=0.05)
+
+    def test_get_update(self):
+        (tag, media_type, data, prev_tag, patch) = self.service._get_update('hops-routingcost')
+        self.assertEqual(media_type, 'application/alto-costmap+json')
+        self.assertIsNone(prev_tag)
+        self.assertIsNone(patch)
+
+        # Unchanged resource is not computed again
+        self.assertIs(self.service._get_update('hops-routingcost')[2], data)
+
+        # r3 has no default route any more
+        r3 = nm.get_device_by_name('r3')
+        nm.update_device_routing_table(r3, make_routing_table('r3')[:-1])
+
+        update = self.service._get_update('hops-routingcost')
+        self.assertNotEqual(update[0], tag)
+        self.assertEqual(update[2], alto_server.get_cost_map('hops-routingcost').get_json_repr())
+        self.assertEqual(update[3], tag)
+        self.assertEqual(apply_merge_patch(data, update[4]), update[2])
+
+        self.assertIsNone(self.service._get_update('no-such-resource'))
+
+    def test_stream(self):
+        stream = self.service.stream({'c1': 'network-map'})
+
+        (media_type, client_id, data) = parse_event(next(stream))
+        self.assertEqual(media_type, 'application/alto-networkmap+json')
+        self.assertEqual(client_id, 'c1')
+        self.assertEqual(data, alto_server.get_network_map())
+
+        # Idle stream is kept alive
+        self.assertEqual(next(stream), ': keep-alive\n\n')
+
+        nm.add_pid_to_topology('pid4', [ipaddress.ip_network('10.0.4.0/24'),
+                                        ipaddress.ip_network('10.0.5.0/24')])
+
+        (media_type, client_id, patch) = parse_event(next(stream))
+        self.assertEqual(media_type, 'application/merge-patch+json')
+        self.assertEqual(client_id, 'c1')
+        self.assertEqual(patch['network-map'], {'pid4': {'ipv4': ['10.0.4.0/24', '10.0.5.0/24']}})
+        self.assertEqual(apply_merge_patch(data, patch), alto_server.get_network_map())
+
+        stream.close()
+
+if __name__ == '__main__':
+    unittest.main()
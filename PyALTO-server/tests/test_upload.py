@@ -0,0 +1,181 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of the single device and batch uploads
+"""
+import base64
+import ipaddress
+import json
+import unittest
+
+from altoserver import nm
+from altoserver.routedelta import get_routes_hash
+from tests.netmaps import make_routing_table
+from tests.test_adapterstats import pack_stats
+from tests.test_alto import make_client
+
+def make_addresses(*addresses):
+    """Get adapter addresses of eth0 as uploaded by the collector"""
+    return {'eth0': [{'address': address} for address in addresses]}
+
+def make_stats(**stats):
+    """Get adapter stats of eth0 as uploaded by the collector"""
+    return [{'name': 'eth0', 'stats': stats}]
+
+class UploadTest(unittest.TestCase):
+    """Malformed uploads are rejected without changing anything"""
+
+    def setUp(self):
+        self.client = make_client()
+
+    def post(self, url, data):
+        """Get status code of POST request with JSON body"""
+        return self.client.post(url, data=json.dumps(data), content_type='application/json').status_code
+
+    def get_versions(self):
+        """Get (topology, address, routing table, stats) versions of the network map"""
+        return (nm.topo_version, nm.addr_version, nm.rt_version, nm.stats_version)
+
+    def get_ip_interfaces(self, device_name):
+        return list(nm.get_device_by_name(device_name).ip_interfaces)
+
+    def assert_rejected(self, url, data, status=400):
+        """Check that the upload is rejected and the network is not changed"""
+
+        versions = self.get_versions()
+        h1_interfaces = self.get_ip_interfaces('h1')
+        r3_routes = nm.get_device_by_name('r3').routing_table
+
+        self.assertEqual(self.post(url, data), status, json.dumps(data))
+        self.assertEqual(self.get_versions(), versions, json.dumps(data))
+        self.assertEqual(self.get_ip_interfaces('h1'), h1_interfaces)
+        self.assertEqual(nm.get_device_by_name('r3').routing_table, r3_routes)
+
+    def test_single_device(self):
+        self.assertEqual(self.post('/upload/h1/adapter_addr', make_addresses('10.0.1.5/24')), 204)
+        self.assertEqual(self.get_ip_interfaces('h1'), [ipaddress.ip_interface('10.0.1.5/24')])
+
+        stats_version = nm.stats_version
+        self.assertEqual(self.post('/upload/h1/adapter_stats', make_stats(rx_bytes=10)), 204)
+        self.assertEqual(nm.stats_version, stats_version + 1)
+
+        self.assertEqual(self.post('/upload/r3/rtable', make_routing_table('r3')[:-1]), 204)
+        self.assertEqual(nm.get_device_by_name('r3').routing_table, make_routing_table('r3')[:-1])
+
+    def test_single_device_malformed(self):
+        self.assert_rejected('/upload/h1/adapter_addr', make_addresses('10.0.1.5/24', '10.0.1.300/24'))
+        self.assert_rejected('/upload/h1/adapter_addr', {'eth0': [{'addr': '10.0.1.5/24'}]})
+        self.assert_rejected('/upload/h1/adapter_addr', ['10.0.1.5/24'])
+        self.assert_rejected('/upload/h9/adapter_addr', make_addresses('10.0.1.5/24'))
+
+        self.assert_rejected('/upload/h1/adapter_stats', make_stats(rx_bytes=2**64))
+        self.assert_rejected('/upload/h1/adapter_stats', make_stats(rx_bytes='10'))
+        self.assert_rejected('/upload/h1/adapter_stats', [{'stats': {}}])
+
+        self.assert_rejected('/upload/r3/rtable', ['eth0 10.0.3.0'])
+        self.assert_rejected('/upload/r3/rtable', [{'ifname': 'eth0', 'destination': '10.0.3.0'}])
+        self.assert_rejected('/upload/h1/rtable', make_routing_table('r3'))
+        self.assert_rejected('/upload/r3/quagga_rt', [{'type': 'O'}])
+        self.assert_rejected('/upload/h1/quagga_rt', [])
+
+        resp = self.client.post('/upload/h1/adapter_addr', data='eth0', content_type='text/plain')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_batch(self):
+        versions = self.get_versions()
+        routes = make_routing_table('r3')[:-1]
+
+        self.assertEqual(self.post('/upload/batch', {
+            'h1': {'adapter_addr': make_addresses('10.0.1.5/24'), 'adapter_stats': make_stats(rx_bytes=10)},
+            'h2': {'adapter_stats': make_stats(rx_bytes=20)},
+            'r3': {'rtable': routes},
+        }), 204)
+
+        self.assertEqual(self.get_ip_interfaces('h1'), [ipaddress.ip_interface('10.0.1.5/24')])
+        self.assertEqual(nm.get_device_by_name('r3').routing_table, routes)
+
+        # Stats of all devices are one change
+        self.assertEqual(nm.stats_version, versions[3] + 1)
+        self.assertGreater(nm.addr_version, versions[1])
+        self.assertGreater(nm.rt_version, versions[2])
+        for (device_name, rx_bytes) in (('h1', 10), ('h2', 20)):
+            (_, stats) = nm.get_device_by_name(device_name).interface_stats
+            self.assertEqual(stats[0]['stats']['rx_bytes'], rx_bytes)
+
+    def test_batch_is_atomic(self):
+        # Data of the valid devices is not applied either
+        self.assert_rejected('/upload/batch', {
+            'h1': {'adapter_addr': make_addresses('10.0.1.5/24')},
+            'r3': {'rtable': make_routing_table('r3')[:-1]},
+            'h2': {'adapter_stats': make_stats(rx_bytes=2**64)},
+        })
+        self.assert_rejected('/upload/batch', {
+            'h1': {'adapter_addr': make_addresses('10.0.1.5/24')},
+            'r3': {'rtable': [{'ifname': 'eth0'}]},
+        })
+        self.assert_rejected('/upload/batch', {
+            'h1': {'adapter_addr': make_addresses('10.0.1.5/24')},
+            'h2': {'adapter_stats_packed': 'not base64!'},
+        })
+
+    def test_batch_malformed(self):
+        for bad_batch in ([], {'h9': {}}, {'h1': []}, {'h1': {'no_such_type': []}},
+                          {'h1': {'adapter_addr': []}},
+                          {'h1': {'rtable': make_routing_table('r3')}},
+                          {'h1': {'adapter_stats': make_stats(), 'adapter_stats_packed': ''}}):
+            self.assert_rejected('/upload/batch', bad_batch)
+
+    def test_packed_stats(self):
+        packed = pack_stats(['rx_bytes', 'tx_bytes'], {'eth0': [10, 2**64 - 1]})
+
+        resp = self.client.post('/upload/h1/adapter_stats', data=packed,
+                                content_type='application/vnd.pyalto.adapter-stats')
+        self.assertEqual(resp.status_code, 204)
+
+        self.assertEqual(self.post('/upload/batch', {
+            'h2': {'adapter_stats_packed': base64.b64encode(packed).decode('ascii')}}), 204)
+
+        for device_name in ('h1', 'h2'):
+            (_, stats) = nm.get_device_by_name(device_name).interface_stats
+            self.assertEqual(stats[0]['name'], 'eth0')
+            self.assertEqual(stats[0]['stats']['tx_bytes'], 2**64 - 1)
+
+        versions = self.get_versions()
+        resp = self.client.post('/upload/h1/adapter_stats', data=packed[:-1],
+                                content_type='application/vnd.pyalto.adapter-stats')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.get_versions(), versions)
+
+    def test_batch_delta_conflict(self):
+        routes = make_routing_table('r3')
+        delta = {'base': get_routes_hash(routes[:-1]), 'hash': get_routes_hash(routes[:1]),
+                 'remove': routes[1:2]}
+
+        versions = self.get_versions()
+        resp = self.client.post('/upload/batch', data=json.dumps({
+            'h1': {'adapter_addr': make_addresses('10.0.1.5/24')},
+            'r3': {'rtable': delta},
+        }), content_type='application/json')
+
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(json.loads(resp.data.decode('utf-8'))['resync'], {'r3': ['rtable']})
+        self.assertEqual(self.get_versions(), versions)
+
+if __name__ == '__main__':
+    unittest.main()
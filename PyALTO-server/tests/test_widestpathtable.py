@@ -0,0 +1,74 @@
+"""
+PyALTO, a Python3 implementation of Application Layer Traffic Optimization protocol
+Copyright (C) 2016,2017  J. Poderys, Technical University of Denmark
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Tests of widest path bottlenecks against traced paths
+"""
+import unittest
+
+from altoserver.widestpathtable import WidestPathTable
+from tests.netmaps import build_network_map, get_device_ips
+
+class WidestPathTableTest(unittest.TestCase):
+    """Bottleneck of each pair is the narrowest link on the traced path"""
+
+    def setUp(self):
+        self.nm = build_network_map()
+        self.loads = {}             # (Node A name, Node B name) -> load of the link
+        self.table = WidestPathTable(self.nm, self.get_link_rbw)
+
+    def get_link_rbw(self, node_a, node_b):
+        """Residual bandwidth of the link: capacity less made up load"""
+
+        capacity = self.nm.get_link_capacity(node_a, node_b)
+        if capacity is None:
+            return None
+
+        return capacity - self.loads.get((node_a.name, node_b.name), 0)
+
+    def assert_bottlenecks_match_paths(self):
+        """Compare bottlenecks of all address pairs with traced paths"""
+
+        device_ips = get_device_ips(self.nm)
+        for (ip_a, device_a) in device_ips:
+            for (ip_b, device_b) in device_ips:
+                path = self.nm.get_path(ip_a, ip_b)
+                link_rbws = [self.get_link_rbw(node_a, node_b)
+                             for (node_a, node_b) in zip(path, path[1:])]
+                expected = None
+                if link_rbws and None not in link_rbws:
+                    expected = min(link_rbws)
+
+                self.assertEqual(self.table.get_bottleneck(device_a, device_b, ip_b), expected,
+                                 '{} -> {}'.format(ip_a, ip_b))
+
+    def test_bottlenecks_match_paths(self):
+        self.assert_bottlenecks_match_paths()
+
+    def test_bottlenecks_follow_stats_changes(self):
+        self.assert_bottlenecks_match_paths()
+
+        # Tables are dropped when adapter stats change
+        self.loads = {('r2', 'r1'): 95, ('a2', 'h3'): 25, ('h4', 'a3'): 1}
+        r2 = self.nm.get_device_by_name('r2')
+        self.nm.update_device_adapter_stats(r2, [])
+
+        self.assert_bottlenecks_match_paths()
+
+if __name__ == '__main__':
+    unittest.main()